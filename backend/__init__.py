@@ -1,40 +1,86 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask
 from flask_cors import CORS
-from openai import OpenAI
+import httpx
+from openai import OpenAI, DefaultHttpxClient
 from dotenv import load_dotenv
 from google.cloud import texttospeech
-from supabase import create_client
 
+from .config import load_config
 from .logging_config import setup_logging
+from .session_store import create_session_store
+from .job_queue import JobQueue
+from .repository import Repository
+from .metrics import Metrics
+from .llm_client import LLMClient
+from .util.intent_utils import LocalIntentClassifier
+from .util.audio_cache import AudioCache, AudioStore
+from .util.user_cache import UserCache
+from .util.appointment_cache import AppointmentCache
+from .util.response_cache import ResponseCache
+from .util.micro_batcher import MicroBatcher
+from .util.chat_utils import prerender_static_audio
+from .util.db_utils import SAVE_SESSION_JOB, save_session_job
 from .routes import api_blueprint
 
 def create_app(test_config=None):
-    setup_logging()
     load_dotenv()
 
     app = Flask(__name__)
     CORS(app, supports_credentials=True)
     
-    app.config.from_mapping(
-        OPENAI_API_KEY=os.getenv('OPENAI_API_KEY'),
-        SUPABASE_URL=os.getenv('SUPABASE_URL'),
-        SUPABASE_API_KEY=os.getenv('SUPABASE_API_KEY')
-    )
+    load_config(app, test_config)
+    setup_logging(app.config)
     
+    app.metrics = Metrics()
+
     # Initialize clients
-    app.openai_client = OpenAI(api_key=app.config['OPENAI_API_KEY'])
+    pool_size = app.config['OPENAI_POOL_SIZE']
+    app.openai_client = OpenAI(
+        api_key=app.config['OPENAI_API_KEY'],
+        # Retries are handled by app.llm
+        max_retries=0,
+        http_client=DefaultHttpxClient(limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+    )
+    app.llm = LLMClient(app.openai_client, app.config)
     app.tts_client = texttospeech.TextToSpeechClient()
-    app.supabase_client = create_client(
-        app.config['SUPABASE_URL'], 
-        app.config['SUPABASE_API_KEY']
+    app.repository = Repository(
+        app.config['SUPABASE_URL'],
+        app.config['SUPABASE_API_KEY'],
+        app.config['SUPABASE_POOL_SIZE'],
+        app.config['SUPABASE_TIMEOUT'],
+        app.metrics
     )
+    app.chat_executor = ThreadPoolExecutor(max_workers=app.config['CHAT_WORKERS'], thread_name_prefix='chat')
 
     # Initialize state objects
-    # TODO: Migrate to Redis database for scalability
-    app.temp_db = {}
-    app.user_info = {}
-    app.custom_sys_prompt = None
+    app.session_store = create_session_store(app.config)
+    app.summary_store = create_session_store(app.config, "summary")
+    os.makedirs(app.instance_path, exist_ok=True)
+    app.intent_classifier = LocalIntentClassifier.load(app.config['LOCAL_INTENT_MODEL_PATH'])
+    app.audio_cache = AudioCache(app.config['TTS_CACHE_MAX_BYTES'], app.config['TTS_CACHE_DIR'])
+    # Clips are shared through the session backend so any worker can serve them (memory sessions are per process anyway)
+    shared_audio = None if app.config['SESSION_STORE'] == 'memory' else create_session_store(app.config, "audio", app.config['AUDIO_TTL'])
+    app.audio_store = AudioStore(app.config['AUDIO_TTL'], shared_audio)
+    app.user_cache = UserCache(app.config['USER_CACHE_MAX_ENTRIES'], app.config['USER_CACHE_TTL'], app.config['USER_CACHE_ENABLED'])
+    app.appointment_cache = AppointmentCache(app.config['APPOINTMENT_CACHE_MAX_ENTRIES'], app.config['APPOINTMENT_CACHE_TTL'])
+    app.response_cache = ResponseCache(
+        app.config['RESPONSE_CACHE_MAX_ENTRIES'], app.config['RESPONSE_CACHE_TTL'], app.config['RESPONSE_CACHE_ENABLED']
+    )
+    app.punct_batcher = MicroBatcher(app.config['PUNCT_BATCH_WINDOW_MS'] / 1000, app.config['PUNCT_BATCH_MAX'])
+    app.metrics.add_source("audio_cache", app.audio_cache.metrics)
+    app.metrics.add_source("user_cache", app.user_cache.metrics)
+    app.metrics.add_source("appointment_cache", app.appointment_cache.metrics)
+    app.metrics.add_source("openai", app.llm.metrics)
+    app.metrics.add_source("response_cache", app.response_cache.metrics)
+    app.metrics.add_source("punct_batcher", app.punct_batcher.metrics)
+    if app.config['TTS_CACHE_PRERENDER']:
+        prerender_static_audio(app)
+
+    app.job_queue = JobQueue(app.config['JOB_QUEUE_PATH'], app.config['JOB_WORKERS'], app.config['JOB_MAX_ATTEMPTS'])
+    app.job_queue.register(SAVE_SESSION_JOB, save_session_job)
+    app.job_queue.start(app.app_context)
 
     app.register_blueprint(api_blueprint)
     
@@ -0,0 +1,96 @@
+import asyncio
+import os
+from quart import Quart
+from quart_cors import cors
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+from google.cloud import texttospeech
+
+from backend.config import load_config
+from backend.logging_config import setup_logging
+from backend.session_store import create_session_store
+from backend.job_queue import JobQueue
+from backend.repository import AsyncRepository
+from backend.metrics import Metrics
+from backend.llm_client import AsyncLLMClient
+from backend.util.db_utils import SAVE_SESSION_JOB
+from backend.util.intent_utils import LocalIntentClassifier
+from backend.util.audio_cache import AudioCache, AudioStore
+from backend.util.user_cache import UserCache
+from backend.util.appointment_cache import AppointmentCache
+from backend.util.response_cache import ResponseCache
+from backend.util.micro_batcher import AsyncMicroBatcher
+from .chat_utils import prerender_static_audio, save_session_job, job_runner
+from .routes import api_blueprint
+
+def create_app(test_config=None):
+    """
+    Create the async (ASGI) app. It serves the same /api/* contract as the Flask
+    app in backend/__init__.py, but uses async OpenAI, TTS and Supabase clients so
+    one process can hold many concurrent conversations.
+    """
+    load_dotenv()
+
+    app = Quart(__name__)
+    load_config(app, test_config)
+    setup_logging(app.config)
+    app = cors(app, allow_origin=app.config['CORS_ORIGINS'], allow_credentials=True)
+
+    app.metrics = Metrics()
+
+    # Initialize clients
+    pool_size = app.config['OPENAI_POOL_SIZE']
+    app.openai_client = AsyncOpenAI(
+        api_key=app.config['OPENAI_API_KEY'],
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+    )
+    app.llm = AsyncLLMClient(app.openai_client, app.config)
+
+    @app.before_serving
+    async def create_clients():
+        # The gRPC and HTTP async clients have to be created inside the server's event loop
+        app.tts_client = texttospeech.TextToSpeechAsyncClient()
+        app.repository = AsyncRepository(
+            app.config['SUPABASE_URL'],
+            app.config['SUPABASE_API_KEY'],
+            app.config['SUPABASE_POOL_SIZE'],
+            app.config['SUPABASE_TIMEOUT'],
+            app.metrics
+        )
+        if app.config['TTS_CACHE_PRERENDER']:
+            app.add_background_task(prerender_static_audio)
+        app.job_queue.register(SAVE_SESSION_JOB, job_runner(app, asyncio.get_running_loop(), save_session_job))
+        app.job_queue.start()
+
+    @app.after_serving
+    async def close_clients():
+        await app.repository.http.aclose()
+
+    # Initialize state objects
+    app.session_store = create_session_store(app.config)
+    app.summary_store = create_session_store(app.config, "summary")
+    os.makedirs(app.instance_path, exist_ok=True)
+    app.intent_classifier = LocalIntentClassifier.load(app.config['LOCAL_INTENT_MODEL_PATH'])
+    app.audio_cache = AudioCache(app.config['TTS_CACHE_MAX_BYTES'], app.config['TTS_CACHE_DIR'])
+    # Clips are shared through the session backend so any worker can serve them (memory sessions are per process anyway)
+    shared_audio = None if app.config['SESSION_STORE'] == 'memory' else create_session_store(app.config, "audio", app.config['AUDIO_TTL'])
+    app.audio_store = AudioStore(app.config['AUDIO_TTL'], shared_audio)
+    app.user_cache = UserCache(app.config['USER_CACHE_MAX_ENTRIES'], app.config['USER_CACHE_TTL'], app.config['USER_CACHE_ENABLED'])
+    app.appointment_cache = AppointmentCache(app.config['APPOINTMENT_CACHE_MAX_ENTRIES'], app.config['APPOINTMENT_CACHE_TTL'])
+    app.response_cache = ResponseCache(
+        app.config['RESPONSE_CACHE_MAX_ENTRIES'], app.config['RESPONSE_CACHE_TTL'], app.config['RESPONSE_CACHE_ENABLED']
+    )
+    app.punct_batcher = AsyncMicroBatcher(app.config['PUNCT_BATCH_WINDOW_MS'] / 1000, app.config['PUNCT_BATCH_MAX'])
+    app.metrics.add_source("audio_cache", app.audio_cache.metrics)
+    app.metrics.add_source("user_cache", app.user_cache.metrics)
+    app.metrics.add_source("appointment_cache", app.appointment_cache.metrics)
+    app.metrics.add_source("openai", app.llm.metrics)
+    app.metrics.add_source("response_cache", app.response_cache.metrics)
+    app.metrics.add_source("punct_batcher", app.punct_batcher.metrics)
+    app.job_queue = JobQueue(app.config['JOB_QUEUE_PATH'], app.config['JOB_WORKERS'], app.config['JOB_MAX_ATTEMPTS'])
+
+    app.register_blueprint(api_blueprint)
+
+    return app
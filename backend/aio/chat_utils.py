@@ -0,0 +1,609 @@
+import asyncio
+import time
+import uuid
+from quart import jsonify, current_app, Response, stream_with_context
+import logging
+import backend.prompt_lib as pl
+from backend.util.chat_utils import (
+    MIN_CONVO_LEN, MODEL,
+    CRISIS_MESSAGE, get_branch_request, get_first_crisis_message, greeting_message, greeting_parts, sse_event,
+    choose_branch, end_check_prompt,
+    summary_update_due, summary_request, summary_is_current,
+    punctuation_inputs, punctuation_lookup, punctuation_store, punctuation_batch_message, parse_punctuation_batch,
+    punctuation_result
+)
+from backend.util.session_utils import SessionContext
+from backend.util.intent_utils import fast_intent, record_shadow
+from backend.util.voice_utils import audio_cache_key, parse_audio_format, audio_payload
+from backend.util.db_utils import SAVE_SESSION_JOB
+from backend.util.history_utils import COMPACTION_BATCH, plan_compaction, digest_words
+from backend.util.response_cache import response_cache_key
+from backend.repository import digest_cursor
+from .voice_utils import generate_audio, submit_audio, SpeechPipeline
+from .data_utils import suggest_appointment, closing_suggestion, fetch_user_info
+
+logger = logging.getLogger(__name__)
+
+async def get_response(sys_prompt, messages, prompt_name="reply", use_cache=True):
+    """
+    Send a message to the OpenAI API and return the response.
+
+    Args:
+        sys_prompt (str): The system prompt to send to the API.
+        messages (list): The conversation history to send to the API.
+        prompt_name (str): Short label for the prompt, used when logging timings.
+        use_cache (bool): Whether to read and fill the response cache for cacheable prompts.
+
+    Returns:
+        str: The response from the API.
+    """
+    conversation = [{"role": "system", "content": sys_prompt}, *messages]
+    options = {}
+    cache_key = None
+    if prompt_name in pl.CACHEABLE_PROMPTS:
+        options["temperature"] = 0
+    if prompt_name in pl.CACHEABLE_PROMPTS and use_cache:
+        cache_key = response_cache_key(prompt_name, pl.CACHEABLE_PROMPTS[prompt_name], MODEL, conversation)
+        cached = current_app.response_cache.get(prompt_name, cache_key)
+        if cached is not None:
+            logger.info(f"[{prompt_name}] Answered from the response cache")
+            return cached
+    logger.info(f"[{prompt_name}] Sending request to OpenAI API", extra={"payload": {"sys_prompt": sys_prompt, "messages": messages}})
+    start = time.perf_counter()
+    with current_app.metrics.span("llm", prompt_name):
+        response = await current_app.llm.create(
+            prompt_name,
+            model=MODEL,
+            messages=conversation,
+            **options
+        )
+    response_content = response.choices[0].message.content
+    if cache_key is not None:
+        current_app.response_cache.put(cache_key, response_content)
+    logger.info(f"[{prompt_name}] took {time.perf_counter() - start:.3f}s")
+    logger.info(f"[{prompt_name}] Received API response", extra={"payload": {"response": response_content}})
+    return response_content
+
+
+async def stream_response(sys_prompt, messages, prompt_name="reply"):
+    """
+    Send a message to the OpenAI API and yield the response as it is generated.
+
+    Args:
+        sys_prompt (str): The system prompt to send to the API.
+        messages (list): The conversation history to send to the API.
+        prompt_name (str): Short label for the prompt, used when logging timings.
+
+    Yields:
+        str: Pieces of the response, in order.
+    """
+    conversation = [{"role": "system", "content": sys_prompt}, *messages]
+    logger.info(f"[{prompt_name}] Streaming request to OpenAI API", extra={"payload": {"sys_prompt": sys_prompt, "messages": messages}})
+    metrics = current_app.metrics
+    start = time.perf_counter()
+    stream = await current_app.llm.create(
+        prompt_name,
+        model=MODEL,
+        messages=conversation,
+        stream=True
+    )
+    first_token = True
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if first_token:
+                metrics.record("llm_first_token", prompt_name, time.perf_counter() - start)
+                first_token = False
+            yield chunk.choices[0].delta.content
+    metrics.record("llm", prompt_name, time.perf_counter() - start)
+    logger.info(f"[{prompt_name}] stream took {time.perf_counter() - start:.3f}s")
+
+
+async def prerender_static_audio():
+    """
+    Async counterpart of backend.util.chat_utils.prerender_static_audio.
+    """
+    phrases = {
+        audio_cache_key(gender, text): (text, gender)
+        for gender in ("FEMALE", "MALE", None) for text in (CRISIS_MESSAGE, greeting_parts("", gender)[-1])
+    }.values()
+    await asyncio.gather(*(generate_audio(text, gender, cacheable=True) for text, gender in phrases))
+    logger.info(f"Pre-rendered static audio. Audio cache: {current_app.audio_cache.metrics()}")
+
+
+async def get_first_message(user_name, sys_prompt, history, gender):
+    """
+    Get the first message to send to the user.
+
+    Args:
+        user_name (str): The name of the user.
+        sys_prompt (str): The system prompt to send to the API.
+        history (list): The conversation history.
+        gender (str): The gender of the therapist.
+
+    Returns:
+        str: The first message to send to the user.
+    """
+    first_message = greeting_message(user_name, gender)
+    if history:
+        first_message = await get_response(sys_prompt + pl.start_convo_prompt_v0(user_name, history), [], "start")
+    logger.info("Generated first message", extra={"payload": {"message": first_message}})
+    return first_message
+
+
+async def precompute_appointment_suggestion(store, session_id, user_id):
+    """
+    Async counterpart of backend.util.chat_utils.submit_appointment_suggestion; runs as a background task.
+
+    Args:
+        store (SessionStore): The app's session store.
+        session_id (str): Unique identifier for the session.
+        user_id (str): The ID of the user.
+    """
+    try:
+        suggestion = await suggest_appointment(user_id)
+        await asyncio.to_thread(store.update, session_id, {"appointment_suggestion": suggestion})
+    except Exception as e:
+        logger.exception(f"Error precomputing appointment suggestion for session {session_id}: {e}")
+
+
+async def handle_first_chat(data):
+    session_id = data.get('sessionId')
+    user_id = data.get('userId')
+    preferred_name = data.get('userName')
+    is_voice_mode = data.get('isVoiceMode', False)
+    audio_format = parse_audio_format(data)
+
+    # Get user info from Supabase
+    logger.info(f"Getting prefs for user_id: {user_id}")
+    user_info = await fetch_user_info(user_id)
+    if user_info is None:
+        return jsonify({"success": False, "error": "User not found"})
+    session = SessionContext.start(session_id, user_info, preferred_name, [], current_app.session_store)
+
+    response_data = {
+        "success": True,
+        "sessionId": session_id
+    }
+
+    # Retrieve first message and audio content, if applicable
+    try:
+        first_message = await get_first_message(preferred_name, session.sys_prompt, user_info['history_summary'], session.gender)
+        response_data["message"] = first_message
+        if is_voice_mode:
+            if user_info['history_summary']:
+                response_data.update(await submit_audio([first_message], session.gender, audio_format))
+            else:
+                # Only the fixed part of the greeting is kept in the disk cache
+                parts = greeting_parts(preferred_name, session.gender)
+                response_data.update(await submit_audio(parts, session.gender, audio_format, [False, True]))
+        session.add_message("assistant", first_message)
+        await asyncio.to_thread(session.save)
+        current_app.add_background_task(precompute_appointment_suggestion, session.store, session_id, user_id)
+        logger.info(f"Started session: {session_id}")
+    except Exception as e:
+        logger.error(f"Error retrieving first message: {e}")
+        return jsonify({"success": False, "error": str(e)})
+
+    return jsonify(response_data)
+
+
+async def handle_crisis_message(session):
+    """
+    Async counterpart of backend.util.chat_utils.handle_crisis_message.
+
+    Args:
+        session (SessionContext): The session context.
+
+    Returns:
+        str: The generated response.
+    """
+    first_crisis_message = get_first_crisis_message(session)
+    if first_crisis_message:
+        return first_crisis_message
+    return await get_response(*get_branch_request("crisis", session, current_app.config), "crisis")
+
+
+async def generate_response(session):
+    """
+    Generate a response to a conversation. Mirrors backend.util.chat_utils.generate_response.
+
+    Args:
+        session (SessionContext): The session context.
+
+    Returns:
+        str: The generated response.
+        bool: True if the conversation should end, False otherwise.
+    """
+    if current_app.config['SPECULATIVE_RESPONSE']:
+        return await generate_response_speculative(session)
+
+    branch = await select_branch(session)
+    if branch == "crisis":
+        return await handle_crisis_message(session), False
+    return await get_response(*get_branch_request(branch, session, current_app.config), branch), branch == "close"
+
+
+async def generate_response_speculative(session):
+    """
+    Async counterpart of backend.util.chat_utils.generate_response_speculative: the
+    classifier, end check and default reply run as concurrent tasks.
+
+    Args:
+        session (SessionContext): The session context.
+
+    Returns:
+        str: The generated response.
+        bool: True if the conversation should end, False otherwise.
+    """
+    recent_history = session.recent_history(current_app.config['CONTEXT_TOKENS_CLASSIFY'])
+    convo_len = len(session.history)
+
+    intent, prediction = fast_intent(recent_history, current_app.config, current_app.intent_classifier)
+    intent_task = None
+    if intent is None:
+        intent_task = asyncio.create_task(get_response(pl.classify_intent_prompt_v1(), [{"role": "user", "content": str(recent_history)}], "classify"))
+    end_task = reply_task = None
+    if intent is None or "1" in intent:
+        if convo_len >= MIN_CONVO_LEN:
+            end_task = asyncio.create_task(get_response(end_check_prompt(session, current_app.config), [], "end"))
+        reply_task = asyncio.create_task(get_response(*get_branch_request("reply", session, current_app.config)))
+
+    def discard(*tasks):
+        for task in tasks:
+            if task is not None:
+                task.cancel()
+
+    if intent_task is not None:
+        intent = await intent_task
+        await asyncio.to_thread(record_shadow, recent_history, prediction, intent, current_app.config)
+    logger.info(f"Detected intent: {intent}")
+    branch = choose_branch(intent, session)
+    if branch is None:
+        branch = choose_branch(intent, session, await end_task)
+    if branch == "reply":
+        return await reply_task, False
+    discard(reply_task, end_task)
+    if branch == "crisis":
+        return await handle_crisis_message(session), False
+    return await get_response(*get_branch_request(branch, session, current_app.config), branch), branch == "close"
+
+
+async def classify_intent(session):
+    """
+    Async counterpart of backend.util.chat_utils.classify_intent.
+
+    Args:
+        session (SessionContext): The session context.
+
+    Returns:
+        str: The intent ("1" typical, "2" crisis, "3" irrelevant).
+    """
+    recent_history = session.recent_history(current_app.config['CONTEXT_TOKENS_CLASSIFY'])
+    intent, prediction = fast_intent(recent_history, current_app.config, current_app.intent_classifier)
+    if intent is None:
+        intent = await get_response(pl.classify_intent_prompt_v1(), [{"role": "user", "content": str(recent_history)}], "classify")
+        await asyncio.to_thread(record_shadow, recent_history, prediction, intent, current_app.config)
+    logger.info(f"Detected intent: {intent}")
+    return intent
+
+
+async def select_branch(session):
+    """
+    Async counterpart of backend.util.chat_utils.select_branch.
+
+    Args:
+        session (SessionContext): The session context.
+
+    Returns:
+        str: One of "crisis", "robust", "close" or "reply".
+    """
+    intent = await classify_intent(session)
+    branch = choose_branch(intent, session)
+    if branch is None:
+        should_end = await get_response(end_check_prompt(session, current_app.config), [], "end")
+        branch = choose_branch(intent, session, should_end)
+    return branch
+
+
+async def finish_turn(session, agent_response, end_flag):
+    """
+    Store the agent's response and build the response payload for a chat turn.
+
+    Args:
+        session (SessionContext): The session context.
+        agent_response (str): The agent's response.
+        end_flag (bool): True if the conversation should end, False otherwise.
+
+    Returns:
+        dict: The response payload, including a suggested appointment if the conversation ended.
+    """
+    logger.info(f"Response ready for session ID: {session.session_id}", extra={"payload": {"response": agent_response}})
+    session.add_message("assistant", agent_response)
+    update_summary = summary_update_due(session, current_app.config)
+    await asyncio.to_thread(session.save)
+    if update_summary:
+        current_app.add_background_task(
+            update_running_summary, current_app.summary_store, session.session_id, list(session.history), session.summary_generation
+        )
+
+    response_data = {
+        "success": True,
+        "message": agent_response,
+        "sessionId": session.session_id
+    }
+
+    if end_flag: # Suggest an appointment if the conversation should end
+        suggestedAppointment, suggestedTime = await closing_suggestion(session)
+        if suggestedAppointment:
+            response_data['suggestedAppointment'] = suggestedAppointment
+            response_data['suggestedTime'] = suggestedTime
+    return response_data
+
+
+_summarizing = set()
+
+async def update_running_summary(store, session_id, chat_history, generation=0):
+    """
+    Async counterpart of backend.util.chat_utils.update_running_summary.
+
+    Args:
+        store (SessionStore): The app's summary store.
+        session_id (str): Unique identifier for the session.
+        chat_history (list): The conversation history.
+        generation (int): The session's summary_generation when the update was requested.
+    """
+    if session_id in _summarizing:
+        return
+    _summarizing.add(session_id)
+    session_store = current_app.session_store
+    try:
+        running_summary = await asyncio.to_thread(store.get, session_id) or {"summary": None, "upto": 0}
+        prompt, prompt_name = summary_request(chat_history, running_summary)
+        if prompt is not None:
+            summary = await get_response(prompt, [], prompt_name)
+            if not await asyncio.to_thread(summary_is_current, session_store, session_id, generation):
+                logger.info(f"Session {session_id} was saved while its summary was updating; dropping the update")
+                return
+            await asyncio.to_thread(store.save, session_id, {"summary": summary, "upto": len(chat_history)})
+            if not await asyncio.to_thread(summary_is_current, session_store, session_id, generation):
+                await asyncio.to_thread(store.delete, session_id)
+    except Exception as e:
+        logger.exception(f"Error updating running summary for session {session_id}: {e}")
+    finally:
+        _summarizing.discard(session_id)
+
+
+async def handle_chat(data):
+    session_id = data.get('sessionId', 'default')
+    user_message = data.get('message')
+    is_voice_mode = data.get('isVoiceMode', False)
+    audio_format = parse_audio_format(data)
+    logger.info(f"Received message. Session ID: {session_id}", extra={"payload": {"message": user_message}})
+
+    session = await asyncio.to_thread(SessionContext.load, session_id, current_app.session_store)
+    if session is None:
+        return jsonify({"success": False, "error": "Session not found"})
+    session.add_message("user", user_message)
+    try:
+        agent_response, end_flag = await generate_response(session)
+    except Exception as e:
+        logger.error(f"Error generating response: {e}")
+        await asyncio.to_thread(session.save) # Keep the user's message, so the next turn still sees it
+        return jsonify({"success": False, "error": str(e)})
+    response_data = await finish_turn(session, agent_response, end_flag)
+
+    if is_voice_mode: # Start generating the audio response; the client fetches it by ID
+        response_data.update(await submit_audio([agent_response], session.gender, audio_format))
+
+    return jsonify(response_data)
+
+
+async def handle_chat_stream(data):
+    session_id = data.get('sessionId', 'default')
+    user_message = data.get('message')
+    is_voice_mode = data.get('isVoiceMode', False)
+    audio_format = parse_audio_format(data)
+    logger.info(f"Received streaming message. Session ID: {session_id}", extra={"payload": {"message": user_message}})
+
+    session = await asyncio.to_thread(SessionContext.load, session_id, current_app.session_store)
+    if session is None:
+        return jsonify({"success": False, "error": "Session not found"})
+    session.add_message("user", user_message)
+    try:
+        branch = await select_branch(session)
+        agent_response = get_first_crisis_message(session) if branch == "crisis" else None
+    except Exception as e:
+        logger.error(f"Error generating response: {e}")
+        await asyncio.to_thread(session.save) # Keep the user's message, so the next turn still sees it
+        return jsonify({"success": False, "error": str(e)})
+
+    # Synthesize speech sentence by sentence while the reply is still streaming
+    speech = SpeechPipeline(session.gender, audio_format) if is_voice_mode else None
+
+    def audio_events(finished):
+        return [
+            sse_event({"type": "audio", "index": index, "text": sentence, **audio_payload(audio_content, audio_format)})
+            for index, sentence, audio_content in finished if audio_content
+        ]
+
+    @stream_with_context
+    async def events():
+        chunks = []
+        try:
+            if agent_response:
+                chunks.append(agent_response)
+                yield sse_event({"type": "delta", "content": agent_response})
+                if speech:
+                    speech.feed(agent_response)
+            else:
+                async for delta in stream_response(*get_branch_request(branch, session, current_app.config), branch):
+                    chunks.append(delta)
+                    yield sse_event({"type": "delta", "content": delta})
+                    if speech:
+                        speech.feed(delta)
+                        for frame in audio_events(speech.ready()):
+                            yield frame
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            await asyncio.to_thread(session.save)
+            yield sse_event({"type": "error", "success": False, "error": str(e)})
+            return
+        response_data = await finish_turn(session, "".join(chunks), branch == "close")
+        if speech:
+            speech.flush()
+            for frame in audio_events(await speech.drain()):
+                yield frame
+        yield sse_event({"type": "done", "end": branch == "close", **response_data})
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def punctuate_batch(texts):
+    unique = list(dict.fromkeys(texts))
+    answers = None
+    if len(unique) > 1:
+        content = await get_response(pl.punctualize_batch_prompt(), [punctuation_batch_message(unique)], "punctuation_batch", use_cache=False)
+        answers = parse_punctuation_batch(content, len(unique))
+        if answers is None:
+            logger.warning(f"[punctuation_batch] Unusable answer for {len(unique)} segments, punctualizing them one by one")
+    if answers is None:
+        answers = [
+            answer.strip() for answer in await asyncio.gather(*(
+                get_response(pl.punctualize_prompt(), [{"role": "user", "content": text}], "punctuation", use_cache=False)
+                for text in unique
+            ))
+        ]
+    corrected = dict(zip(unique, answers))
+    return [corrected[text] for text in texts]
+
+
+async def punctuate(texts):
+    results, misses, shadow = punctuation_lookup(texts, current_app.config, current_app.response_cache)
+    if misses:
+        answers = await current_app.punct_batcher.submit([texts[i] for i in misses], punctuate_batch)
+        punctuation_store(results, misses, answers, shadow, current_app.response_cache)
+    return results
+
+
+async def handle_add_punctuation(data):
+    texts = punctuation_inputs(data)
+    if texts is None:
+        return jsonify({'success': False, 'error': 'No text provided'})
+
+    try:
+        new_texts = await punctuate(texts)
+    except Exception as e:
+        logger.error(f"Error adding punctuation: {str(e)}")
+        return jsonify({'success': False, 'error': 'Failed to add punctuation'})
+
+    return jsonify(punctuation_result(data, new_texts))
+
+
+async def handle_save_session(session_id):
+    session = await asyncio.to_thread(SessionContext.load, session_id, current_app.session_store)
+    if session is None:
+        return jsonify({"success": False, "error": "Session not found"})
+    try:
+        job_id = await asyncio.to_thread(current_app.job_queue.enqueue, SAVE_SESSION_JOB, {
+            "user_id": session.user_id,
+            "chat_history": session.history,
+            "running_summary": await asyncio.to_thread(session.load_running_summary, current_app.summary_store),
+            "save_id": uuid.uuid4().hex
+        })
+        # The job has its own copy now. Bumping the generation first stops summary updates
+        # that are still running from writing theirs back
+        session.set("summary_generation", session.summary_generation + 1)
+        await asyncio.to_thread(session.save)
+        await asyncio.to_thread(current_app.summary_store.delete, session_id)
+    except Exception as e:
+        logger.exception(f"Error queueing session save: {e}")
+        return jsonify({"success": False, "error": str(e)})
+    return jsonify({"success": True, "jobId": job_id})
+
+
+async def handle_get_job(job_id):
+    job = await asyncio.to_thread(current_app.job_queue.get, job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "jobId": job_id, **job})
+
+
+async def save_session_job(payload):
+    """
+    Async counterpart of backend.util.db_utils.save_session_job.
+
+    Args:
+        payload (dict): user_id, chat_history and running_summary, captured when the save was requested,
+            and the save_id that makes retries idempotent.
+    """
+    chat_history = payload['chat_history']
+    running_summary = payload.get('running_summary')
+    prompt, prompt_name = summary_request(chat_history, running_summary)
+    summary = await get_response(prompt, [], prompt_name) if prompt else running_summary["summary"]
+    await current_app.repository.insert_session(payload['user_id'], chat_history, summary, payload.get('save_id'))
+    current_app.add_background_task(compact_history, payload['user_id'])
+
+
+def job_runner(app, loop, handler):
+    """
+    Let the job queue's worker threads run an async handler on the server's event loop.
+
+    Args:
+        app (Quart): The app, whose context the handler runs in.
+        loop (asyncio.AbstractEventLoop): The server's event loop.
+        handler (callable): Async function taking the job's payload.
+
+    Returns:
+        callable: A blocking handler for JobQueue.register.
+    """
+    async def run(payload):
+        async with app.app_context():
+            await handler(payload)
+
+    return lambda payload: asyncio.run_coroutine_threadsafe(run(payload), loop).result()
+
+
+_compacting = set()
+
+async def compact_history(user_id):
+    """
+    Async counterpart of backend.util.history_utils.compact_history.
+
+    Args:
+        user_id (str): The ID of the user.
+    """
+    if user_id in _compacting:
+        return
+    _compacting.add(user_id)
+    repository = current_app.repository
+    config = current_app.config
+    try:
+        while True:
+            row = await repository.get_user(user_id)
+            session_rows = await repository.get_summaries(
+                user_id, after=digest_cursor(row), limit=COMPACTION_BATCH, newest_first=False
+            )
+
+            fold = plan_compaction(row.get('history_digest'), [r['summary'] for r in session_rows], config)
+            if not fold:
+                return
+            digest = await get_response(
+                pl.digest_prompt_v0(row.get('history_digest'), [r['summary'] for r in session_rows[:fold]], digest_words(config)),
+                [],
+                "digest"
+            )
+            await repository.update_user(user_id, {
+                "history_digest": digest,
+                "history_digest_until": session_rows[fold - 1]['created_at'],
+                "history_digest_until_id": session_rows[fold - 1]['id']
+            })
+            current_app.user_cache.invalidate(user_id)
+            logger.info(f"Folded {fold} session summaries into the digest for user_id: {user_id}")
+    except Exception as e:
+        logger.exception(f"Error compacting history for user_id {user_id}: {e}")
+    finally:
+        _compacting.discard(user_id)
@@ -0,0 +1,204 @@
+import asyncio
+from quart import jsonify, current_app, make_response
+import logging
+import pytz
+from datetime import datetime
+from backend.util.appt_utils import (
+    next_appointment_time, render_calendar, render_appointments_calendar, cache_appointments, precomputed_suggestion
+)
+from backend.util.session_utils import SessionContext, parse_user_info
+from backend.repository import digest_cursor
+
+logger = logging.getLogger(__name__)
+
+async def handle_new_user(data):
+    try:
+        await current_app.repository.insert_user({
+            "user_id": data.get('userID'),
+            "email": data.get('email'),
+            "full_name": data.get('fullName'),
+            "preferred_name": data.get('preferredName'),
+            "history_summary": "[]"
+        })
+        current_app.user_cache.invalidate(data.get('userID'))
+    except Exception as e:
+        logger.error(f"Error adding user: {e}")
+        return jsonify({"success": False, "error": str(e)})
+
+    return jsonify({"success": True})
+
+
+async def get_user_row(user_id):
+    """
+    Async counterpart of backend.util.session_utils.get_user_row.
+
+    Args:
+        user_id (str): The ID of the user.
+
+    Returns:
+        dict: The user's row, or None if the user doesn't exist.
+    """
+    row = current_app.user_cache.get(user_id)
+    if row is None:
+        row = await current_app.repository.get_user(user_id)
+        if row is None:
+            return None
+        current_app.user_cache.put(user_id, row)
+    return row
+
+
+async def fetch_user_info(user_id):
+    """
+    Async counterpart of backend.util.session_utils.fetch_user_info.
+
+    Args:
+        user_id (str): The ID of the user.
+
+    Returns:
+        dict: The parsed user info, or None if the user doesn't exist.
+    """
+    row = await get_user_row(user_id)
+    if row is None:
+        return None
+    limit = current_app.config['HISTORY_RECENT_SUMMARIES']
+    # Sessions up to history_digest_until are already part of the digest
+    summary_rows = await current_app.repository.get_summaries(user_id, after=digest_cursor(row), limit=limit)
+    if not summary_rows and not row.get('history_digest'):
+        row = {**row, 'history_summary': await current_app.repository.get_legacy_history(user_id)}
+    return parse_user_info(row, summary_rows, limit, current_app.config['HISTORY_TOKEN_BUDGET'])
+
+
+async def suggest_appointment(user_id):
+    '''
+    Async counterpart of backend.util.appt_utils.suggest_appointment.
+
+    Args:
+        user_id (str): The unique identifier for the user.
+
+    Returns:
+        tuple: (suggestedAppointment, suggestedTime), or (False, None) if the user already has a future appointment.
+    '''
+    has_appointment = current_app.appointment_cache.get(user_id)
+    if has_appointment is None:
+        try:
+            future_appointments = await current_app.repository.get_appointments(user_id, datetime.now(pytz.UTC).isoformat(), limit=1)
+        except Exception as e:
+            logger.error(f"Error querying Supabase appointments table: {str(e)}")
+            return False, None
+        cache_appointments(current_app.appointment_cache, user_id, future_appointments)
+        has_appointment = bool(future_appointments)
+    if has_appointment:
+        logger.info(f"User {user_id} already has an appointment time.")
+        return False, None
+    return True, next_appointment_time().isoformat()
+
+
+async def closing_suggestion(session):
+    '''
+    Async counterpart of backend.util.appt_utils.closing_suggestion.
+
+    Args:
+        session (SessionContext): The session context.
+
+    Returns:
+        tuple: (suggestedAppointment, suggestedTime) for a conversation that is ending.
+    '''
+    suggestion = precomputed_suggestion(session, current_app.appointment_cache)
+    if suggestion is None:
+        return await suggest_appointment(session.user_id)
+    return suggestion
+
+
+async def calendar_response(calendar_content, filename):
+    response = await make_response(calendar_content)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    response.headers["Content-Type"] = "text/calendar"
+    return response
+
+
+async def handle_generate_calendar(data):
+    return await calendar_response(render_calendar(data.get('appointmentTime')), "therapy_session.ics")
+
+
+async def handle_generate_appointments_calendar(user_id):
+    if not user_id:
+        return jsonify({'success': False, 'error': 'Missing required fields'}), 400
+    try:
+        appointments = await current_app.repository.get_appointments(user_id, datetime.now(pytz.UTC).isoformat())
+    except Exception as e:
+        logger.error(f"Error retrieving appointments: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    cache_appointments(current_app.appointment_cache, user_id, appointments)
+    return await calendar_response(render_appointments_calendar(user_id, appointments), "therapy_sessions.ics")
+
+
+async def handle_save_appointment(data):
+    user_id = data.get('userId')
+    appointment_time = data.get('appointmentTime')
+    if not user_id or not appointment_time:
+        return jsonify({'success': False, 'error': 'Missing required fields'}), 400
+
+    utc_time = datetime.fromisoformat(appointment_time).astimezone(pytz.UTC)
+    try:
+        await current_app.repository.insert_appointment({
+            "user_id": user_id,
+            "appointment_time": utc_time.isoformat(),
+            "created_at_time": datetime.now(pytz.UTC).isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Error saving appointment: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    current_app.appointment_cache.add_appointment(user_id, utc_time)
+
+    return jsonify({'success': True})
+
+
+async def handle_get_appointments(user_id):
+    try:
+        appointments = await current_app.repository.get_appointments(user_id, datetime.now(pytz.UTC).isoformat())
+    except Exception as e:
+        logger.error(f"Error retrieving appointments: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    cache_appointments(current_app.appointment_cache, user_id, appointments)
+
+    return jsonify({'success': True, 'appointments': appointments})
+
+
+async def handle_get_prefs(user_id, session_id=None):
+    try:
+        user_info = await get_user_row(user_id)
+    except Exception as e:
+        logger.error(f"Error getting user info: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    if user_info is None:
+        return jsonify({'success': False, 'error': 'User not found'}), 404
+
+    # Keep a live session in sync with the latest row
+    session = await asyncio.to_thread(SessionContext.load, session_id, current_app.session_store)
+    if session is not None and session.user_id == user_id:
+        session.update_user_info(user_info)
+        await asyncio.to_thread(session.save)
+    return jsonify({'success': True, 'backgroundInfo': user_info['custom_background'], 'agentPreferences': user_info['custom_behavior'], 'gender': user_info['custom_gender']})
+
+
+async def handle_set_prefs(data):
+    user_id = data.get('userId')
+    prefs = {
+        "custom_background": data.get('backgroundInfo'),
+        "custom_behavior": data.get('agentPreferences'),
+        "custom_gender": data.get('gender')
+    }
+    try:
+        await current_app.repository.update_user(user_id, prefs)
+        current_app.user_cache.invalidate(user_id)
+    except Exception as e:
+        logger.error(f"Error setting prefs: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    # Apply the new preferences to a live session right away
+    session = await asyncio.to_thread(SessionContext.load, data.get('sessionId'), current_app.session_store)
+    if session is not None and session.user_id == user_id:
+        session.update_user_info({**session.user_info, **prefs})
+        await asyncio.to_thread(session.save)
+
+    return jsonify({'success': True})
@@ -0,0 +1,146 @@
+import time
+from quart import Blueprint, request, g, current_app, Response
+from quart.wrappers.response import IterableBody
+from .chat_utils import (
+    handle_first_chat, handle_chat, handle_chat_stream, handle_add_punctuation, handle_save_session, handle_get_job
+)
+from .data_utils import (
+    handle_new_user, handle_generate_calendar, handle_generate_appointments_calendar, handle_save_appointment,
+    handle_get_appointments, handle_get_prefs, handle_set_prefs
+)
+from .voice_utils import handle_get_audio
+from backend.metrics import start_request, finish_request
+import logging
+
+# Same /api/* contract as backend/routes.py; see the docstrings there for payloads.
+api_blueprint = Blueprint('api', __name__)
+logger = logging.getLogger(__name__)
+
+# Hooks are async so they run in the request's own context (sync ones run in a thread)
+@api_blueprint.before_request
+async def start_timing():
+    g.timing = (start_request(), time.perf_counter())
+
+
+def call_on_close(response, callback):
+    """Quart counterpart of werkzeug's Response.call_on_close, for streamed bodies."""
+    body = response.response
+    inner = body.iter
+
+    async def iterate():
+        try:
+            async for chunk in inner:
+                yield chunk
+        finally:
+            if hasattr(inner, "aclose"):
+                await inner.aclose()
+            callback()
+
+    body.iter = iterate()
+
+
+@api_blueprint.after_request
+async def add_server_timing(response):
+    token, start = g.pop('timing')
+    if isinstance(response.response, IterableBody):
+        # Streams report their stages only through /metrics (see backend/routes.py)
+        finish_request(token, 0.0)
+        metrics, endpoint = current_app.metrics, request.endpoint
+        call_on_close(response, lambda: metrics.record("request", endpoint, time.perf_counter() - start))
+        return response
+    elapsed = time.perf_counter() - start
+    current_app.metrics.record("request", request.endpoint, elapsed, response.status_code >= 500)
+    response.headers['Server-Timing'] = finish_request(token, elapsed)
+    return response
+
+
+@api_blueprint.route('/metrics', methods=['GET'])
+async def metrics():
+    return Response(current_app.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@api_blueprint.route('/api/newUser', methods=['POST'])
+async def newUser():
+    data = await request.get_json()
+    logger.info("Adding user", extra={"payload": data})
+    return await handle_new_user(data)
+
+
+@api_blueprint.route('/api/firstChat', methods=['POST'])
+async def firstChat():
+    data = await request.get_json()
+    logger.info("Handling first chat", extra={"payload": data})
+    return await handle_first_chat(data)
+
+
+@api_blueprint.route('/api/chat', methods=['POST'])
+async def chat():
+    data = await request.get_json()
+    logger.info("Handling chat", extra={"payload": data})
+    return await handle_chat(data)
+
+
+@api_blueprint.route('/api/chat-stream', methods=['POST'])
+async def chat_stream():
+    data = await request.get_json()
+    logger.info("Handling streaming chat", extra={"payload": data})
+    return await handle_chat_stream(data)
+
+
+@api_blueprint.route('/api/audio/<audio_id>', methods=['GET'])
+async def get_audio(audio_id):
+    return await handle_get_audio(audio_id)
+
+
+@api_blueprint.route('/api/add-punct', methods=['POST'])
+async def add_punctuation_text():
+    data = await request.get_json()
+    return await handle_add_punctuation(data)
+
+
+@api_blueprint.route('/api/save', methods=['POST'])
+async def save():
+    session_id = (await request.get_json()).get('sessionId')
+    logger.info(f"Saving session for session ID {session_id}")
+    return await handle_save_session(session_id)
+
+
+@api_blueprint.route('/api/jobs/<job_id>', methods=['GET'])
+async def get_job(job_id):
+    return await handle_get_job(job_id)
+
+
+@api_blueprint.route('/api/generate-calendar', methods=['POST'])
+async def generate_calendar():
+    data = await request.get_json()
+    return await handle_generate_calendar(data)
+
+
+@api_blueprint.route('/api/appointments-calendar', methods=['POST'])
+async def appointments_calendar():
+    user_id = (await request.get_json()).get('userId')
+    return await handle_generate_appointments_calendar(user_id)
+
+
+@api_blueprint.route('/api/save-appointment', methods=['POST'])
+async def save_appointment():
+    data = await request.get_json()
+    return await handle_save_appointment(data)
+
+
+@api_blueprint.route('/api/get-appointments', methods=['POST'])
+async def get_appointments():
+    user_id = (await request.get_json()).get('userId')
+    return await handle_get_appointments(user_id)
+
+
+@api_blueprint.route('/api/get-prefs', methods=['POST'])
+async def get_prefs():
+    data = await request.get_json()
+    return await handle_get_prefs(data.get('userId'), data.get('sessionId'))
+
+
+@api_blueprint.route('/api/set-prefs', methods=['POST'])
+async def set_prefs():
+    data = await request.get_json()
+    return await handle_set_prefs(data)
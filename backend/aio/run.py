@@ -0,0 +1,6 @@
+from backend.aio import create_app
+
+app = create_app()
+
+if __name__ == "__main__":
+    app.run(host='localhost', debug=True, port=5000)
@@ -0,0 +1,210 @@
+import asyncio
+import time
+from collections import deque
+from quart import current_app, jsonify, request, Response
+from google.cloud import texttospeech
+import logging
+from backend.util.voice_utils import (
+    DEFAULT_AUDIO_FORMAT, AUDIO_MIMETYPES, AUDIO_WAIT_TIMEOUT, AUDIO_POLL_INTERVAL,
+    tts_config, voice_name, split_sentences, audio_cache_key, join_audio, audio_link
+)
+
+logger = logging.getLogger(__name__)
+
+async def generate_audio(text, gender, audio_format=DEFAULT_AUDIO_FORMAT, cacheable=False):
+    """
+    Generate speech from text using the async Google Cloud TTS client and return it.
+
+    Args:
+        text (str): Text to convert to speech
+        gender (str): The user's preferred therapist gender
+        audio_format (tuple): (encoding, sample rate) to synthesize with
+        cacheable (bool): Whether the text is a static phrase whose audio may be kept on disk
+
+    Returns:
+        bytes: The audio content containing the synthesized speech
+    """
+    key = audio_cache_key(gender, text, audio_format)
+    # The cache may read from disk, so it runs off the event loop
+    audio_content = await asyncio.to_thread(current_app.audio_cache.get, key)
+    if audio_content is not None:
+        return audio_content
+    try:
+        text2speech_audio_config, voice = tts_config(voice_name(gender), audio_format)
+        with current_app.metrics.span("tts", "synthesize"):
+            response = await current_app.tts_client.synthesize_speech(
+                input=texttospeech.SynthesisInput(text=text),
+                voice=voice,
+                audio_config=text2speech_audio_config
+            )
+        await asyncio.to_thread(current_app.audio_cache.put, key, response.audio_content, cacheable)
+        return response.audio_content
+    except Exception as e:
+        logger.error(f"Unexpected error in text-to-speech: {str(e)}")
+        return None
+
+
+async def generate_audio_parts(parts, gender, audio_format=DEFAULT_AUDIO_FORMAT, cacheable=None):
+    """
+    Async counterpart of backend.util.voice_utils.generate_audio_parts.
+
+    Args:
+        parts (list): Pieces of text, in order
+        gender (str): The user's preferred therapist gender
+        audio_format (tuple): (encoding, sample rate) to synthesize with
+        cacheable (list): Per part, whether it is a static phrase (see generate_audio). Defaults to none.
+
+    Returns:
+        bytes: The audio content containing the synthesized speech
+    """
+    cacheable = cacheable or [False] * len(parts)
+    chunks = await asyncio.gather(*(
+        generate_audio(part, gender, audio_format, static) for part, static in zip(parts, cacheable)
+    ))
+    if any(chunk is None for chunk in chunks):
+        return None
+    return join_audio(list(chunks))
+
+
+async def submit_audio(parts, gender, audio_format=DEFAULT_AUDIO_FORMAT, cacheable=None):
+    """
+    Async counterpart of backend.util.voice_utils.submit_audio: synthesis runs as a task.
+
+    Args:
+        parts (list): Pieces of text, in order
+        gender (str): The user's preferred therapist gender
+        audio_format (tuple): (encoding, sample rate) to synthesize with
+        cacheable (list): Per part, whether it is a static phrase (see generate_audio)
+
+    Returns:
+        dict: Response fields pointing to the audio (see audio_link).
+    """
+    audio_store = current_app.audio_store
+    audio_id = await asyncio.to_thread(audio_store.reserve, audio_format)
+
+    async def run():
+        try:
+            audio_content = await generate_audio_parts(parts, gender, audio_format, cacheable)
+        except Exception as e:
+            logger.error(f"Error generating audio {audio_id}: {e}")
+            audio_content = None
+        try:
+            await asyncio.to_thread(audio_store.publish, audio_id, audio_format, audio_content)
+        except Exception as e:
+            logger.error(f"Error publishing audio {audio_id}: {e}")
+        return audio_content
+
+    audio_store.add(audio_id, asyncio.create_task(run()), audio_format)
+    return audio_link(audio_id, audio_format)
+
+
+async def wait_for_shared_audio(audio_id):
+    """
+    Async counterpart of backend.util.voice_utils.wait_for_shared_audio.
+
+    Args:
+        audio_id (str): The audio ID.
+
+    Returns:
+        tuple: (status, audio_format, audio_content) as returned by AudioStore.fetch.
+    """
+    deadline = time.monotonic() + AUDIO_WAIT_TIMEOUT
+    while True:
+        status, audio_format, audio_content = await asyncio.to_thread(current_app.audio_store.fetch, audio_id)
+        if status != "pending" or time.monotonic() >= deadline:
+            return status, audio_format, audio_content
+        await asyncio.sleep(AUDIO_POLL_INTERVAL)
+
+
+async def handle_get_audio(audio_id):
+    """
+    Async counterpart of backend.util.voice_utils.handle_get_audio.
+
+    Args:
+        audio_id (str): The ID returned in a chat response.
+
+    Returns:
+        Response: The audio, with Range and conditional request support, or a JSON error.
+    """
+    entry = current_app.audio_store.get(audio_id)
+    if entry is not None:
+        task, audio_format = entry
+        try:
+            # Shield the task so a client giving up doesn't cancel it for later requests
+            audio_content = await asyncio.wait_for(asyncio.shield(task), AUDIO_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out waiting for audio {audio_id}")
+            return jsonify({"success": False, "error": "Audio is not ready"}), 504
+    else:
+        # Produced by another worker
+        status, audio_format, audio_content = await wait_for_shared_audio(audio_id)
+        if status is None:
+            return jsonify({"success": False, "error": "Audio not found or expired"}), 404
+        if status == "pending":
+            logger.error(f"Timed out waiting for audio {audio_id}")
+            return jsonify({"success": False, "error": "Audio is not ready"}), 504
+    if audio_content is None:
+        return jsonify({"success": False, "error": "Audio generation failed"}), 500
+
+    response = Response(audio_content, mimetype=AUDIO_MIMETYPES[audio_format[0]])
+    response.set_etag(audio_id)
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['AUDIO_TTL']
+    return await response.make_conditional(request, accept_ranges=True, complete_length=len(audio_content))
+
+
+class SpeechPipeline:
+    """
+    Async counterpart of backend.util.voice_utils.SpeechPipeline: each finished
+    sentence is synthesized as its own task while the reply keeps streaming.
+    """
+
+    def __init__(self, gender, audio_format=DEFAULT_AUDIO_FORMAT):
+        self.gender = gender
+        self.audio_format = audio_format
+        self.buffer = ""
+        self.pending = deque()
+        self.index = 0
+        self.start = time.perf_counter()
+
+    def feed(self, delta):
+        """Add a piece of the reply and start synthesizing any sentences it completes."""
+        self.buffer += delta
+        sentences, self.buffer = split_sentences(self.buffer)
+        for sentence in sentences:
+            self._submit(sentence)
+
+    def flush(self):
+        """Start synthesizing whatever is left once the reply is complete."""
+        if self.buffer.strip():
+            self._submit(self.buffer.strip())
+        self.buffer = ""
+
+    def ready(self):
+        """
+        Returns:
+            list: (index, sentence, audio_content) for finished sentences, in order,
+            stopping at the first one still in progress.
+        """
+        finished = []
+        while self.pending and self.pending[0][2].done():
+            index, sentence, task = self.pending.popleft()
+            finished.append((index, sentence, task.result()))
+        return finished
+
+    async def drain(self):
+        """
+        Returns:
+            list: (index, sentence, audio_content) for every remaining sentence, in order.
+        """
+        finished = []
+        while self.pending:
+            index, sentence, task = self.pending.popleft()
+            finished.append((index, sentence, await task))
+        if finished:
+            logger.info(f"All audio ready after {time.perf_counter() - self.start:.3f}s")
+        return finished
+
+    def _submit(self, sentence):
+        self.pending.append((self.index, sentence, asyncio.create_task(generate_audio(sentence, self.gender, self.audio_format))))
+        self.index += 1
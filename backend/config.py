@@ -0,0 +1,118 @@
+import os
+
+
+def parse_pairs(value):
+    """
+    Parse a comma-separated list of name=number settings.
+
+    Args:
+        value (str): E.g. "classify=8,end=8".
+
+    Returns:
+        dict: The number for each name.
+    """
+    pairs = {}
+    for pair in filter(None, (part.strip() for part in (value or '').split(','))):
+        name, _, number = pair.partition('=')
+        pairs[name.strip()] = float(number)
+    return pairs
+
+
+def load_config(app, test_config=None):
+    """
+    Load settings from environment variables into the app config.
+
+    Shared by the Flask app and the async app so both read the same settings.
+
+    Args:
+        app: The Flask or Quart app.
+        test_config (dict): Optional overrides applied after the environment.
+    """
+    app.config.from_mapping(
+        OPENAI_API_KEY=os.getenv('OPENAI_API_KEY'),
+        # Seconds before an OpenAI call is abandoned: OPENAI_TIMEOUT, or per prompt name as "name=seconds,..."
+        OPENAI_TIMEOUT=float(os.getenv('OPENAI_TIMEOUT', '30')),
+        OPENAI_TIMEOUTS=os.getenv('OPENAI_TIMEOUTS', 'classify=8,end=8,punctuation=8,punctuation_batch=15'),
+        # Retries for connection errors, timeouts, 429s and 5xx, with jittered exponential backoff
+        OPENAI_MAX_RETRIES=int(os.getenv('OPENAI_MAX_RETRIES', '2')),
+        OPENAI_RETRY_BACKOFF=float(os.getenv('OPENAI_RETRY_BACKOFF', '0.5')),
+        # Prompts that get a duplicate request once the first is slower than the prompt's p95
+        # (OPENAI_HEDGE_MIN_DELAY until enough latencies are seen), e.g. "classify,end"
+        OPENAI_HEDGE_PROMPTS=os.getenv('OPENAI_HEDGE_PROMPTS', ''),
+        OPENAI_HEDGE_MIN_DELAY=float(os.getenv('OPENAI_HEDGE_MIN_DELAY', '2')),
+        OPENAI_POOL_SIZE=int(os.getenv('OPENAI_POOL_SIZE', '20')),
+        SUPABASE_URL=os.getenv('SUPABASE_URL'),
+        SUPABASE_API_KEY=os.getenv('SUPABASE_API_KEY'),
+        # Keep-alive connections the data-access layer holds open to Supabase
+        SUPABASE_POOL_SIZE=int(os.getenv('SUPABASE_POOL_SIZE', '10')),
+        SUPABASE_TIMEOUT=float(os.getenv('SUPABASE_TIMEOUT', '10')),
+        # Run the intent, end-of-conversation and reply calls concurrently
+        SPECULATIVE_RESPONSE=os.getenv('SPECULATIVE_RESPONSE', 'false').lower() == 'true',
+        CHAT_WORKERS=int(os.getenv('CHAT_WORKERS', '8')),
+        # Where conversation state lives: memory, redis or sqlite
+        SESSION_STORE=os.getenv('SESSION_STORE', 'memory'),
+        SESSION_REDIS_URL=os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0'),
+        SESSION_SQLITE_PATH=os.getenv('SESSION_SQLITE_PATH', os.path.join(app.instance_path, 'sessions.db')),
+        SESSION_TTL=int(os.getenv('SESSION_TTL', str(24 * 60 * 60))),
+        # Local intent classifier in front of the LLM classifier: off, shadow (log only) or on
+        LOCAL_INTENT_MODE=os.getenv('LOCAL_INTENT_MODE', 'off'),
+        LOCAL_INTENT_MODEL_PATH=os.getenv('LOCAL_INTENT_MODEL_PATH', os.path.join(app.instance_path, 'intent_model.json')),
+        LOCAL_INTENT_LOG_PATH=os.getenv('LOCAL_INTENT_LOG_PATH', os.path.join(app.instance_path, 'intent_shadow.jsonl')),
+        LOCAL_INTENT_NORMAL_THRESHOLD=float(os.getenv('LOCAL_INTENT_NORMAL_THRESHOLD', '0.9')),
+        LOCAL_INTENT_OFF_TOPIC_THRESHOLD=float(os.getenv('LOCAL_INTENT_OFF_TOPIC_THRESHOLD', '0.95')),
+        # Two-tier TTS audio cache: in-memory LRU bounded by bytes, plus a disk directory for static phrases only
+        TTS_CACHE_MAX_BYTES=int(os.getenv('TTS_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+        TTS_CACHE_DIR=os.getenv('TTS_CACHE_DIR', os.path.join(app.instance_path, 'tts_cache')),
+        TTS_CACHE_PRERENDER=os.getenv('TTS_CACHE_PRERENDER', 'true').lower() == 'true',
+        # Read-through cache of Supabase users rows (USER_CACHE_ENABLED=false to always read the DB)
+        USER_CACHE_ENABLED=os.getenv('USER_CACHE_ENABLED', 'true').lower() == 'true',
+        USER_CACHE_TTL=int(os.getenv('USER_CACHE_TTL', '60')),
+        USER_CACHE_MAX_ENTRIES=int(os.getenv('USER_CACHE_MAX_ENTRIES', '1024')),
+        # Answers to short, deterministic prompts (classify, end, punctuation), keyed by prompt version and input
+        RESPONSE_CACHE_ENABLED=os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true',
+        RESPONSE_CACHE_TTL=int(os.getenv('RESPONSE_CACHE_TTL', str(60 * 60))),
+        RESPONSE_CACHE_MAX_ENTRIES=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '4096')),
+        # /api/add-punct segments arriving within this many milliseconds share one LLM call of at most PUNCT_BATCH_MAX segments
+        PUNCT_BATCH_WINDOW_MS=float(os.getenv('PUNCT_BATCH_WINDOW_MS', '10')),
+        PUNCT_BATCH_MAX=int(os.getenv('PUNCT_BATCH_MAX', '16')),
+        # Rule-based punctuation for short, plain fragments, in front of the LLM: off, shadow (log only) or on.
+        # Fragments over PUNCT_LOCAL_MAX_WORDS words, with uncommon words (likely names), or that the rules find
+        # ambiguous, still go to the LLM. Defaults to shadow until the logged agreement justifies turning it on.
+        PUNCT_LOCAL_MODE=os.getenv('PUNCT_LOCAL_MODE', 'shadow'),
+        PUNCT_LOCAL_MAX_WORDS=int(os.getenv('PUNCT_LOCAL_MAX_WORDS', '12')),
+        # Per-user "has a future appointment" state. Users with an appointment are cached until its
+        # time; APPOINTMENT_CACHE_TTL bounds how long "no appointment" is trusted.
+        APPOINTMENT_CACHE_TTL=int(os.getenv('APPOINTMENT_CACHE_TTL', '600')),
+        APPOINTMENT_CACHE_MAX_ENTRIES=int(os.getenv('APPOINTMENT_CACHE_MAX_ENTRIES', '4096')),
+        # Durable background jobs, e.g. summarizing and saving a session after /api/save
+        JOB_QUEUE_PATH=os.getenv('JOB_QUEUE_PATH', os.path.join(app.instance_path, 'jobs.db')),
+        JOB_WORKERS=int(os.getenv('JOB_WORKERS', '2')),
+        JOB_MAX_ATTEMPTS=int(os.getenv('JOB_MAX_ATTEMPTS', '5')),
+        # Update a running summary of the session every this many turns (0 turns it off), so saving is cheap
+        SUMMARY_EVERY_TURNS=int(os.getenv('SUMMARY_EVERY_TURNS', '4')),
+        # Token budgets for the conversation history sent with each kind of call
+        CONTEXT_TOKENS_CLASSIFY=int(os.getenv('CONTEXT_TOKENS_CLASSIFY', '300')),
+        CONTEXT_TOKENS_REPLY=int(os.getenv('CONTEXT_TOKENS_REPLY', '3000')),
+        CONTEXT_TOKENS_CLOSE=int(os.getenv('CONTEXT_TOKENS_CLOSE', '3000')),
+        # Past-session summaries read verbatim at session start; older ones live in users.history_digest
+        HISTORY_RECENT_SUMMARIES=int(os.getenv('HISTORY_RECENT_SUMMARIES', '5')),
+        # Token ceiling for the digest plus recent summaries in the system prompt, and the digest's target size
+        HISTORY_TOKEN_BUDGET=int(os.getenv('HISTORY_TOKEN_BUDGET', '1500')),
+        HISTORY_DIGEST_TOKENS=int(os.getenv('HISTORY_DIGEST_TOKENS', '500')),
+        # Seconds a clip stays fetchable from /api/audio/<id>
+        AUDIO_TTL=int(os.getenv('AUDIO_TTL', '300')),
+        # JSON logs, written by a background thread to one size-rotated file per process in LOG_DIR
+        LOG_DIR=os.getenv('LOG_DIR'),
+        LOG_LEVEL=os.getenv('LOG_LEVEL', 'INFO'),
+        LOG_MAX_BYTES=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+        LOG_BACKUP_COUNT=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+        # Prompts, histories and other payload strings are cut to this many characters
+        LOG_FIELD_MAX_CHARS=int(os.getenv('LOG_FIELD_MAX_CHARS', '500')),
+        # Fraction of records that keep their payload, overridable per logger as "name=rate,..."
+        LOG_PAYLOAD_SAMPLE_RATE=float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0.1')),
+        LOG_PAYLOAD_SAMPLE_RATES=os.getenv('LOG_PAYLOAD_SAMPLE_RATES', ''),
+        # Origins allowed to call the async app with credentials
+        CORS_ORIGINS=os.getenv('CORS_ORIGINS', 'http://localhost:3000,http://127.0.0.1:3000').split(',')
+    )
+    if test_config:
+        app.config.from_mapping(test_config)
@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+# Seconds a worker may hold a job before another worker (or a restarted process) takes it over
+LEASE_SECONDS = 300
+# Seconds idle workers wait between polls when nothing wakes them
+POLL_SECONDS = 2
+# Finished jobs are kept this long so clients can still read their status
+RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+
+class JobQueue:
+    """
+    Durable job queue kept in a SQLite file, so queued work survives restarts.
+
+    Jobs are JSON payloads tagged with a kind. Worker threads claim jobs with a
+    lease, run the handler registered for the kind and retry failures with
+    exponential backoff until max_attempts is reached. A job whose worker died
+    is picked up again once its lease runs out (counting as an attempt), so a
+    handler may run more than once and must be idempotent. A worker whose lease was taken over can't
+    record the outcome.
+    """
+
+    def __init__(self, path, workers, max_attempts):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.handlers = {}
+        self.context = None
+        self.wakeup = threading.Event()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, error TEXT, run_after REAL NOT NULL, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, lease TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def register(self, kind, handler):
+        """
+        Args:
+            kind (str): The job kind.
+            handler (callable): Called with the job's payload. Raising marks the attempt as failed.
+        """
+        self.handlers[kind] = handler
+
+    def start(self, context=None):
+        """
+        Start the worker threads.
+
+        Args:
+            context (callable): Optional context manager factory each job runs in, e.g. app.app_context.
+        """
+        self.context = context
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"jobs-{i}", daemon=True).start()
+
+    def enqueue(self, kind, payload):
+        """
+        Args:
+            kind (str): The job kind.
+            payload (dict): JSON-serializable job arguments.
+
+        Returns:
+            str: The job ID.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, payload, status, run_after, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, now, now, now)
+            )
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, now - RETENTION_SECONDS))
+        self.wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """
+        Args:
+            job_id (str): The job ID.
+
+        Returns:
+            dict: The job's kind, status, attempts and last error, or None if it doesn't exist.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT kind, status, attempts, error FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {"kind": row[0], "status": row[1], "attempts": row[2], "error": row[3]}
+
+    def _claim(self):
+        now = time.time()
+        lease = uuid.uuid4().hex
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock, so only one worker can claim a given job
+            conn.execute("BEGIN IMMEDIATE")
+            # A job whose worker kept dying (its lease ran out) has no attempts left to retry with
+            expired = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, lease = NULL "
+                "WHERE status = ? AND run_after <= ? AND attempts >= ?",
+                (FAILED, "Lease expired on the last attempt", now, RUNNING, now, self.max_attempts)
+            ).rowcount
+            if expired:
+                logger.error(f"Failed {expired} job(s) whose lease expired on their last attempt")
+            row = conn.execute(
+                "SELECT job_id, kind, payload, attempts FROM jobs "
+                "WHERE (status = ? AND run_after <= ?) OR (status = ? AND run_after <= ?) "
+                "ORDER BY run_after LIMIT 1",
+                (QUEUED, now, RUNNING, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, run_after = ?, updated_at = ?, lease = ? WHERE job_id = ?",
+                    (RUNNING, now + LEASE_SECONDS, now, lease, row[0])
+                )
+            conn.execute("COMMIT")
+        return row + (lease,) if row is not None else None
+
+    def _finish(self, job_id, lease, attempts, error):
+        now = time.time()
+        if error is None:
+            status, run_after = DONE, now
+        elif attempts < self.max_attempts:
+            status, run_after = QUEUED, now + 2 ** attempts
+        else:
+            status, run_after = FAILED, now
+        with self._connect() as conn:
+            # Only the worker still holding the lease may record the outcome
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, run_after = ?, updated_at = ?, lease = NULL "
+                "WHERE job_id = ? AND status = ? AND lease = ?",
+                (status, error, run_after, now, job_id, RUNNING, lease)
+            ).rowcount
+        return status if updated else None
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Error claiming job: {e}")
+                job = None
+            if job is None:
+                self.wakeup.wait(POLL_SECONDS)
+                self.wakeup.clear()
+                continue
+
+            job_id, kind, payload, attempts, lease = job
+            attempts += 1
+            error = None
+            try:
+                handler = self.handlers[kind]
+                if self.context is not None:
+                    with self.context():
+                        handler(json.loads(payload))
+                else:
+                    handler(json.loads(payload))
+            except Exception as e:
+                logger.exception(f"Job {job_id} ({kind}) failed on attempt {attempts}: {e}")
+                error = str(e)
+            try:
+                status = self._finish(job_id, lease, attempts, error)
+            except sqlite3.Error as e:
+                logger.error(f"Error finishing job {job_id}: {e}")
+                continue
+            if status is None:
+                logger.warning(f"Job {job_id} ({kind}) lost its lease on attempt {attempts}; its outcome was not recorded")
+            else:
+                logger.info(f"Job {job_id} ({kind}) is {status} after {attempts} attempt(s)")
@@ -0,0 +1,196 @@
+import asyncio
+import concurrent.futures
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from openai import APIConnectionError, RateLimitError, InternalServerError
+
+from .config import parse_pairs
+
+logger = logging.getLogger(__name__)
+
+# Connection errors (including timeouts), 429s and 5xx are worth another try
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+# Successful latencies kept per prompt for the hedging delay
+LATENCY_WINDOW = 200
+# Samples needed before the observed p95 replaces OPENAI_HEDGE_MIN_DELAY
+MIN_LATENCY_SAMPLES = 20
+
+
+class BaseLLMClient:
+    """
+    Policy shared by LLMClient and AsyncLLMClient: per-prompt timeouts, retries
+    with jittered exponential backoff, and hedging delays taken from each
+    prompt's observed p95 latency.
+    """
+
+    def __init__(self, openai_client, config):
+        self.openai_client = openai_client
+        self.default_timeout = config['OPENAI_TIMEOUT']
+        self.timeouts = parse_pairs(config['OPENAI_TIMEOUTS'])
+        self.max_retries = config['OPENAI_MAX_RETRIES']
+        self.backoff = config['OPENAI_RETRY_BACKOFF']
+        self.hedge_prompts = {name.strip() for name in config['OPENAI_HEDGE_PROMPTS'].split(',') if name.strip()}
+        self.hedge_min_delay = config['OPENAI_HEDGE_MIN_DELAY']
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.stats = {"requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "failures": 0}
+
+    def timeout(self, prompt_name):
+        return self.timeouts.get(prompt_name, self.default_timeout)
+
+    def retry_delay(self, attempt):
+        # Full jitter keeps retries from many sessions from arriving together
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def hedge_delay(self, prompt_name):
+        """
+        Returns:
+            float: Seconds to wait before sending a duplicate request, or None if the prompt isn't hedged.
+        """
+        if prompt_name not in self.hedge_prompts:
+            return None
+        with self.lock:
+            samples = sorted(self.latencies.get(prompt_name, ()))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return self.hedge_min_delay
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def _observe(self, prompt_name, seconds):
+        with self.lock:
+            self.latencies.setdefault(prompt_name, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Counters for requests, retries, hedged requests, hedges that answered first and failed calls.
+        """
+        with self.lock:
+            return dict(self.stats)
+
+
+class LLMClient(BaseLLMClient):
+    """Blocking chat completions with the shared retry and hedging policy."""
+
+    def __init__(self, openai_client, config):
+        super().__init__(openai_client, config)
+        # Own pool, since callers may already be running on the chat worker pool
+        self.hedge_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=config['OPENAI_POOL_SIZE'], thread_name_prefix='llm'
+        )
+
+    def create(self, prompt_name, **kwargs):
+        """
+        Call chat.completions.create, retrying retryable errors and hedging slow
+        non-streaming calls for prompts listed in OPENAI_HEDGE_PROMPTS.
+
+        Args:
+            prompt_name (str): Short label for the prompt; selects its timeout and hedging.
+            **kwargs: Passed to chat.completions.create.
+
+        Returns:
+            The completion, or the stream when stream=True.
+        """
+        kwargs.setdefault('timeout', self.timeout(prompt_name))
+        hedge_delay = None if kwargs.get('stream') else self.hedge_delay(prompt_name)
+        for attempt in range(self.max_retries + 1):
+            try:
+                if hedge_delay is None:
+                    return self._call(prompt_name, kwargs)
+                return self._hedged(prompt_name, kwargs, hedge_delay)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                delay = self.retry_delay(attempt)
+                logger.warning(f"[{prompt_name}] {type(e).__name__} on attempt {attempt + 1}, retrying in {delay:.2f}s")
+                self._count("retries")
+                time.sleep(delay)
+
+    def _call(self, prompt_name, kwargs):
+        self._count("requests")
+        start = time.perf_counter()
+        response = self.openai_client.chat.completions.create(**kwargs)
+        # A stream returns once it opens, which says nothing about how long the reply takes
+        if not kwargs.get('stream'):
+            self._observe(prompt_name, time.perf_counter() - start)
+        return response
+
+    def _hedged(self, prompt_name, kwargs, delay):
+        primary = self.hedge_executor.submit(self._call, prompt_name, kwargs)
+        done, _ = concurrent.futures.wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        hedge = self.hedge_executor.submit(self._call, prompt_name, kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    # The slower request can't be cancelled once sent; its result is dropped
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+class AsyncLLMClient(BaseLLMClient):
+    """Async counterpart of LLMClient. The slower of two hedged requests is cancelled."""
+
+    async def create(self, prompt_name, **kwargs):
+        kwargs.setdefault('timeout', self.timeout(prompt_name))
+        hedge_delay = None if kwargs.get('stream') else self.hedge_delay(prompt_name)
+        for attempt in range(self.max_retries + 1):
+            try:
+                if hedge_delay is None:
+                    return await self._call(prompt_name, kwargs)
+                return await self._hedged(prompt_name, kwargs, hedge_delay)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                delay = self.retry_delay(attempt)
+                logger.warning(f"[{prompt_name}] {type(e).__name__} on attempt {attempt + 1}, retrying in {delay:.2f}s")
+                self._count("retries")
+                await asyncio.sleep(delay)
+
+    async def _call(self, prompt_name, kwargs):
+        self._count("requests")
+        start = time.perf_counter()
+        response = await self.openai_client.chat.completions.create(**kwargs)
+        if not kwargs.get('stream'):
+            self._observe(prompt_name, time.perf_counter() - start)
+        return response
+
+    async def _hedged(self, prompt_name, kwargs, delay):
+        primary = asyncio.create_task(self._call(prompt_name, kwargs))
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        hedge = asyncio.create_task(self._call(prompt_name, kwargs))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -1,28 +1,143 @@
+import atexit
+import json
 import os
 import logging
-from datetime import datetime
-
-def setup_logging():
-    """Configure logging to write to logs directory in project root"""
-    # Get the project root directory (parent of backend)
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    log_dir = os.path.join(project_root, 'logs/app_backend')
-    
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from .config import parse_pairs
+
+# Project root (parent of backend)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_LOG_DIR = os.path.join(PROJECT_ROOT, 'logs/app_backend')
+
+# Payload fields whose values never reach the log file
+REDACTED_FIELDS = {"audioData", "audio_content", "email", "apikey", "api_key", "Authorization"}
+
+_listener = None
+
+
+def redact(value, max_chars):
+    """
+    Copy a log payload, truncating long strings and redacting sensitive fields. The
+    copy is taken by PayloadFilter on the thread that logs the record, before it is
+    queued, so later changes to e.g. a session's history don't leak into the record.
+
+    Args:
+        value: A JSON-like value (dicts, lists, strings, numbers).
+        max_chars (int): Longest string kept as is.
+
+    Returns:
+        A JSON-serializable copy of the value.
+    """
+    if isinstance(value, dict):
+        return {
+            key: f"[redacted {len(str(item))} chars]" if key in REDACTED_FIELDS else redact(item, max_chars)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item, max_chars) for item in value]
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = value if isinstance(value, str) else str(value)
+    if len(text) > max_chars:
+        return f"{text[:max_chars]}... [{len(text) - max_chars} more chars]"
+    return text
+
+
+class PayloadFilter(logging.Filter):
+    """
+    Samples and redacts the structured payload of a record, passed as
+    logger.info(message, extra={"payload": {...}}). The message itself is always
+    logged; unsampled records just lose their payload.
+
+    Sampling is per logger: sample_rates maps logger names (or their parents) to
+    the fraction of payloads kept, falling back to default_rate.
+    """
+
+    def __init__(self, default_rate, sample_rates, max_chars):
+        super().__init__()
+        self.default_rate = default_rate
+        self.sample_rates = sample_rates
+        self.max_chars = max_chars
+
+    def rate(self, name):
+        while name:
+            if name in self.sample_rates:
+                return self.sample_rates[name]
+            name = name.rpartition('.')[0]
+        return self.default_rate
+
+    def filter(self, record):
+        payload = getattr(record, 'payload', None)
+        if payload is not None:
+            keep = random.random() < self.rate(record.name)
+            record.payload = redact(payload, self.max_chars) if keep else None
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, thread, message and payload."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            # QueueHandler has already merged args and any traceback into the message
+            "message": record.getMessage(),
+        }
+        if getattr(record, 'payload', None) is not None:
+            entry["payload"] = record.payload
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(config=None):
+    """
+    Send log records through a queue to a background listener that writes JSON
+    lines to a size-rotated file, so request threads never wait on disk I/O.
+    Each process gets its own file: rotation isn't safe with several processes
+    writing to one.
+
+    Args:
+        config (dict): The app config (LOG_* settings). Defaults apply when omitted.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    config = config or {}
+    log_dir = config.get('LOG_DIR') or DEFAULT_LOG_DIR
+    max_chars = config.get('LOG_FIELD_MAX_CHARS', 500)
+
     # Create logs directory if it doesn't exist
     os.makedirs(log_dir, exist_ok=True)
-    
-    # Create log file with timestamp
-    log_file = os.path.join(log_dir, f'talk2me_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log')
-    
-    # Configure logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file)
-        ]
+
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, f'talk2me_{datetime.now().strftime("%Y%m%d_%H%M%S")}_{os.getpid()}.log'),
+        maxBytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+        backupCount=config.get('LOG_BACKUP_COUNT', 5),
+        encoding='utf-8'
     )
-    
+    file_handler.setFormatter(JSONFormatter())
+
+    queue_handler = QueueHandler(queue.Queue(-1))
+    queue_handler.addFilter(PayloadFilter(
+        config.get('LOG_PAYLOAD_SAMPLE_RATE', 0.1),
+        parse_pairs(config.get('LOG_PAYLOAD_SAMPLE_RATES')),
+        max_chars
+    ))
+    _listener = QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+    root.addHandler(queue_handler)
+
     # Set third-party loggers to WARNING level to reduce noise
     logging.getLogger('werkzeug').setLevel(logging.WARNING)
     logging.getLogger('urllib3').setLevel(logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
@@ -0,0 +1,168 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Spans recorded while handling the current request, for its Server-Timing header
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds, error):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.errors += error
+
+
+class Metrics:
+    """
+    Latency histograms and error counters for each backend stage, keyed by
+    (stage, name): e.g. ("llm", "classify"), ("tts", "synthesize"),
+    ("supabase", "get_user") or ("request", "api.chat").
+
+    Spans are also collected per request (see start_request), so a response can
+    report its own breakdown in a Server-Timing header.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        # Callables returning {counter name: value}, exported as gauges by name
+        self.sources = {}
+
+    def record(self, stage, name, seconds, error=False):
+        """
+        Args:
+            stage (str): The kind of work, e.g. "llm", "tts" or "supabase".
+            name (str): What was done, e.g. the prompt name or query name.
+            seconds (float): How long it took.
+            error (bool): Whether it failed.
+        """
+        with self.lock:
+            histogram = self.histograms.get((stage, name))
+            if histogram is None:
+                histogram = self.histograms[(stage, name)] = Histogram()
+            histogram.observe(seconds, error)
+        spans = _request_spans.get()
+        if spans is not None and stage != "request":
+            spans.append((f"{stage}.{name}", seconds))
+
+    @contextmanager
+    def span(self, stage, name):
+        """Time the enclosed block and record it, marking it as an error if it raises."""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(stage, name, time.perf_counter() - start, error)
+
+    def add_source(self, name, metrics):
+        """
+        Export another component's counters, e.g. a cache's metrics().
+
+        Args:
+            name (str): Label for the component, e.g. "user_cache".
+            metrics (callable): Returns a dict of numeric values.
+        """
+        self.sources[name] = metrics
+
+    def render(self):
+        """
+        Returns:
+            str: All metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            snapshot = [
+                (stage, name, list(h.counts), h.count, h.sum, h.errors)
+                for (stage, name), h in sorted(self.histograms.items())
+            ]
+        lines = [
+            "# HELP talk2me_stage_seconds Latency of backend stages.",
+            "# TYPE talk2me_stage_seconds histogram"
+        ]
+        for stage, name, counts, count, total, _ in snapshot:
+            labels = f'stage="{stage}",name="{name}"'
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, counts):
+                cumulative += bucket
+                lines.append(f'talk2me_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'talk2me_stage_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"talk2me_stage_seconds_sum{{{labels}}} {total}")
+            lines.append(f"talk2me_stage_seconds_count{{{labels}}} {count}")
+        lines += ["# HELP talk2me_stage_errors_total Failed backend stages.", "# TYPE talk2me_stage_errors_total counter"]
+        for stage, name, _, _, _, errors in snapshot:
+            lines.append(f'talk2me_stage_errors_total{{stage="{stage}",name="{name}"}} {errors}')
+        lines += ["# HELP talk2me_component Counters reported by caches and other components.", "# TYPE talk2me_component gauge"]
+        for source, metrics in sorted(self.sources.items()):
+            for key, value in sorted(metrics().items()):
+                if isinstance(value, (int, float)):
+                    lines.append(f'talk2me_component{{component="{source}",metric="{key}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def start_request():
+    """
+    Start collecting spans for the request being handled. Work handed to other
+    threads is included when submitted through propagate.
+
+    Returns:
+        contextvars.Token: Pass to finish_request.
+    """
+    return _request_spans.set([])
+
+
+def finish_request(token, elapsed):
+    """
+    Stop collecting spans for the request.
+
+    Args:
+        token (contextvars.Token): From start_request.
+        elapsed (float): The request's total time in seconds.
+
+    Returns:
+        str: The Server-Timing header value, with spans of the same name summed.
+    """
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+    totals = {}
+    for name, seconds in list(spans):
+        total, calls = totals.get(name, (0.0, 0))
+        totals[name] = (total + seconds, calls + 1)
+    entries = [
+        f'{name};dur={1000 * total:.1f}' + (f';desc="{calls} calls"' if calls > 1 else "")
+        for name, (total, calls) in totals.items()
+    ]
+    entries.append(f"total;dur={1000 * elapsed:.1f}")
+    return ", ".join(entries)
+
+
+def propagate(fn):
+    """
+    Wrap a function submitted to a thread pool so its spans count towards the
+    request that submitted it.
+
+    Args:
+        fn (callable): The function to run.
+
+    Returns:
+        callable: fn, run in a copy of the caller's context.
+    """
+    context = contextvars.copy_context()
+    return lambda: context.run(fn)
@@ -20,12 +20,29 @@ example_conversation = [
     {"role": "assistant", "content": "You’re welcome, Alan! I'm glad you’re feeling more hopeful. Keep checking in with yourself and adjusting as needed. I’m sure you’ll make progress with these changes."}
 ]
 
+# Short-answer prompts whose answers depend only on their input. get_response caches
+# them and pins temperature to 0. The version is part of the cache key: bump it when
+# a prompt's meaning changes in a way its text doesn't show.
+CACHEABLE_PROMPTS = {
+    "classify": "classify_intent_prompt_v1",
+    "end": "idenfity_end_prompt_v0",
+    "punctuation": "punctualize_prompt_v0",
+    "punctuation_batch": "punctualize_batch_prompt_v0",
+}
+
 def punctualize_prompt():
     return """
     You are a text normalizer. Your task is to add proper punctuation, fix capitalization, and correct common speech-to-text artifacts.
     Maintain the exact meaning but make it read naturally. Return ONLY the corrected text with no explanations.
     """
 
+def punctualize_batch_prompt():
+    return """
+    You are a text normalizer. You will receive a JSON object of the form {"segments": [...]} holding independent pieces of speech-to-text output.
+    For each segment, add proper punctuation, fix capitalization, and correct common speech-to-text artifacts. Maintain the exact meaning but make it read naturally.
+    Never merge, split, drop or reorder segments. Return ONLY a JSON object of the form {"segments": [...]} with one corrected string per input segment, in the same order.
+    """
+
 def summary_prompt_v0(convo):
     return f"""
     You are an AI specialized in summarizing therapy conversations. Given a transcript of a session between a therapist and a patient, generate a highly concise, objective summary. Follow these guidelines:
@@ -43,9 +60,54 @@ def summary_prompt_v0(convo):
     Output: 
     """
 
-def inject_history(user_name, hist):
+def update_summary_prompt_v0(summary, new_turns):
+    return f"""
+    You are an AI specialized in summarizing therapy conversations. You keep a running summary of a session that is still in progress.
+    Update the summary below with the new part of the conversation. Follow these guidelines:
+
+    - Preserve key info: Keep issues discussed, suggestions given, decisions or plans made, and any takeaways.
+    - Be brief: Use as few words as possible while preserving key points.
+    - Be objective: Do not infer emotions beyond what is explicitly stated.
+    - Return ONLY the updated summary.
+
+    <Summary so far>
+    {summary or "None yet."}
+    </Summary so far>
+
+    New part of the conversation: {str(new_turns)}
+    Output:
+    """
+
+def digest_prompt_v0(digest, summaries, max_words):
+    return f"""
+    You are an AI specialized in summarizing therapy conversations. You keep a long-term digest of a patient's past therapy sessions.
+    Merge the session summaries below into the existing digest, in chronological order. Follow these guidelines:
+
+    - Preserve key info: Keep recurring issues, progress over time, suggestions that helped or didn't, and any ongoing plans.
+    - Drop details that no longer matter, and merge repeated points.
+    - Be brief: Use at most {max_words} words.
+    - Be objective: Do not infer emotions beyond what is explicitly stated.
+
+    <Existing digest>
+    {digest or "None yet."}
+    </Existing digest>
+
+    <Session summaries>
+    {str(summaries)}
+    </Session summaries>
+    Output:
+    """
+
+def inject_history(user_name, hist, digest=None):
+    earlier = f"""
+    Below is a digest of your earlier sessions:
+    <Earlier sessions>
+    {digest}
+    </Earlier sessions>
+    """ if digest else ""
     return f"""
-    You are in a therapy session with your client, {user_name}. Below is a summary of your previous sessions in chronological order:
+    You are in a therapy session with your client, {user_name}.{earlier}
+    Below is a summary of your most recent sessions in chronological order:
     <Past sessions>
     {str(hist)}
     </Past sessions>
@@ -0,0 +1,255 @@
+import logging
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Only the columns the backend reads. The legacy users.history_summary blob is
+# fetched separately, and only for users who have nothing in the sessions table.
+USER_COLUMNS = (
+    "user_id,preferred_name,custom_background,custom_behavior,custom_gender,"
+    "history_digest,history_digest_until,history_digest_until_id"
+)
+SUMMARY_COLUMNS = "id,summary,created_at"
+APPOINTMENT_COLUMNS = "appointment_time"
+
+
+def digest_cursor(row):
+    """
+    Args:
+        row (dict): The user's row.
+
+    Returns:
+        tuple: (created_at, id) of the newest session folded into the digest, or None.
+    """
+    if not row.get('history_digest_until'):
+        return None
+    return row['history_digest_until'], row.get('history_digest_until_id')
+
+
+@dataclass
+class Query:
+    """One PostgREST request, built once and run by either repository class."""
+    name: str
+    method: str
+    table: str
+    params: dict = field(default_factory=dict)
+    body: object = None
+    first: bool = False
+    headers: dict = None
+
+    def parse(self, response):
+        response.raise_for_status()
+        if self.method != "GET":
+            return None
+        rows = response.json()
+        if self.first:
+            return rows[0] if rows else None
+        return rows
+
+
+class BaseRepository:
+    """
+    Every Supabase query the backend makes, as PostgREST requests with column
+    projection. Repository and AsyncRepository run them over a pooled,
+    keep-alive HTTP client.
+    """
+
+    def __init__(self, url, api_key, pool_size, timeout, metrics=None):
+        self.base_url = f"{url.rstrip('/')}/rest/v1"
+        self.headers = {
+            "apikey": api_key,
+            "Authorization": f"Bearer {api_key}",
+            # Writes don't need the row echoed back
+            "Prefer": "return=minimal"
+        }
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.timeout = timeout
+        self.metrics = metrics
+
+    def _done(self, query, start, error):
+        elapsed = time.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.record("supabase", query.name, elapsed, error)
+        logger.info(f"Query {query.name} took {elapsed:.3f}s")
+
+    # Users
+
+    def _get_user(self, user_id):
+        return Query("get_user", "GET", "users", {"select": USER_COLUMNS, "user_id": f"eq.{user_id}", "limit": 1}, first=True)
+
+    def _get_legacy_history(self, user_id):
+        return Query("get_legacy_history", "GET", "users", {"select": "history_summary", "user_id": f"eq.{user_id}", "limit": 1}, first=True)
+
+    def _insert_user(self, row):
+        return Query("insert_user", "POST", "users", body=row)
+
+    def _update_user(self, user_id, fields):
+        return Query("update_user", "PATCH", "users", {"user_id": f"eq.{user_id}"}, body=fields)
+
+    # Sessions
+
+    def _insert_session(self, user_id, full_conversation, summary, save_id=None):
+        body = {"user_id": user_id, "full_conversation": full_conversation, "summary": summary}
+        if save_id is None:
+            return Query("insert_session", "POST", "sessions", body=body)
+        # A retried save finds its row already there and leaves it alone
+        return Query(
+            "insert_session", "POST", "sessions", {"on_conflict": "save_id"}, {**body, "save_id": save_id},
+            headers={"Prefer": "resolution=ignore-duplicates,return=minimal"}
+        )
+
+    def _get_summaries(self, user_id, after, limit, newest_first):
+        params = {
+            "select": SUMMARY_COLUMNS,
+            "user_id": f"eq.{user_id}",
+            # id breaks ties between sessions saved in the same instant
+            "order": "created_at.desc,id.desc" if newest_first else "created_at.asc,id.asc",
+            "limit": limit
+        }
+        if after:
+            created_at, session_id = after
+            if session_id is None:
+                # Digests written before users.history_digest_until_id existed
+                params["created_at"] = f"gt.{created_at}"
+            else:
+                params["or"] = f'(created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{session_id}))'
+
+        return Query("get_summaries", "GET", "sessions", params)
+
+    # Appointments
+
+    def _get_appointments(self, user_id, after, limit=None):
+        params = {
+            "select": APPOINTMENT_COLUMNS,
+            "user_id": f"eq.{user_id}",
+            "appointment_time": f"gte.{after}",
+            "order": "appointment_time.asc"
+        }
+        if limit:
+            params["limit"] = limit
+        return Query("get_appointments", "GET", "appointments", params)
+
+    def _insert_appointment(self, row):
+        return Query("insert_appointment", "POST", "appointments", body=row)
+
+
+class Repository(BaseRepository):
+    """Blocking repository for the Flask app."""
+
+    def __init__(self, url, api_key, pool_size=10, timeout=10, metrics=None):
+        super().__init__(url, api_key, pool_size, timeout, metrics)
+        self.http = httpx.Client(base_url=self.base_url, headers=self.headers, limits=self.limits, timeout=timeout)
+
+    def _run(self, query):
+        start = time.perf_counter()
+        error = True
+        try:
+            response = self.http.request(
+                query.method, f"/{query.table}", params=query.params, json=query.body, headers=query.headers
+            )
+            rows = query.parse(response)
+            error = False
+            return rows
+        finally:
+            self._done(query, start, error)
+
+    def get_user(self, user_id):
+        """
+        Returns:
+            dict: The user's row (USER_COLUMNS), or None if the user doesn't exist.
+        """
+        return self._run(self._get_user(user_id))
+
+    def get_legacy_history(self, user_id):
+        """
+        Returns:
+            str: The legacy users.history_summary column, or None.
+        """
+        row = self._run(self._get_legacy_history(user_id))
+        return row['history_summary'] if row else None
+
+    def insert_user(self, row):
+        self._run(self._insert_user(row))
+
+    def update_user(self, user_id, fields):
+        self._run(self._update_user(user_id, fields))
+
+    def insert_session(self, user_id, full_conversation, summary, save_id=None):
+        """
+        Save a finished session. This is the only write a save needs: summaries are
+        read back from the sessions table, so nothing on the users row changes.
+        With a save_id, inserting the same save again is a no-op.
+        """
+        self._run(self._insert_session(user_id, full_conversation, summary, save_id))
+
+    def get_summaries(self, user_id, after=None, limit=50, newest_first=True):
+        """
+        Args:
+            user_id (str): The ID of the user.
+            after (tuple): Only sessions after this (created_at, id) cursor (see digest_cursor).
+            limit (int): Maximum rows.
+            newest_first (bool): Order by created_at descending instead of ascending.
+
+        Returns:
+            list: Rows with summary and created_at.
+        """
+        return self._run(self._get_summaries(user_id, after, limit, newest_first))
+
+    def get_appointments(self, user_id, after, limit=None):
+        """
+        Returns:
+            list: Rows with appointment_time at or after `after`, soonest first.
+        """
+        return self._run(self._get_appointments(user_id, after, limit))
+
+    def insert_appointment(self, row):
+        self._run(self._insert_appointment(row))
+
+
+class AsyncRepository(BaseRepository):
+    """Async counterpart of Repository for the ASGI app."""
+
+    def __init__(self, url, api_key, pool_size=10, timeout=10, metrics=None):
+        super().__init__(url, api_key, pool_size, timeout, metrics)
+        self.http = httpx.AsyncClient(base_url=self.base_url, headers=self.headers, limits=self.limits, timeout=timeout)
+
+    async def _run(self, query):
+        start = time.perf_counter()
+        error = True
+        try:
+            response = await self.http.request(
+                query.method, f"/{query.table}", params=query.params, json=query.body, headers=query.headers
+            )
+            rows = query.parse(response)
+            error = False
+            return rows
+        finally:
+            self._done(query, start, error)
+
+    async def get_user(self, user_id):
+        return await self._run(self._get_user(user_id))
+
+    async def get_legacy_history(self, user_id):
+        row = await self._run(self._get_legacy_history(user_id))
+        return row['history_summary'] if row else None
+
+    async def insert_user(self, row):
+        await self._run(self._insert_user(row))
+
+    async def update_user(self, user_id, fields):
+        await self._run(self._update_user(user_id, fields))
+
+    async def insert_session(self, user_id, full_conversation, summary, save_id=None):
+        await self._run(self._insert_session(user_id, full_conversation, summary, save_id))
+
+    async def get_summaries(self, user_id, after=None, limit=50, newest_first=True):
+        return await self._run(self._get_summaries(user_id, after, limit, newest_first))
+
+    async def get_appointments(self, user_id, after, limit=None):
+        return await self._run(self._get_appointments(user_id, after, limit))
+
+    async def insert_appointment(self, row):
+        await self._run(self._insert_appointment(row))
@@ -1,13 +1,52 @@
-from flask import Blueprint, request
-from .util.db_utils import handle_new_user, handle_save_session
-from .util.chat_utils import handle_first_chat, handle_chat, handle_add_punctuation
-from .util.appt_utils import handle_get_appointments, handle_generate_calendar, handle_save_appointment
+import time
+from flask import Blueprint, request, g, current_app, Response
+from .util.db_utils import handle_new_user, handle_save_session, handle_get_job
+from .util.chat_utils import handle_first_chat, handle_chat, handle_chat_stream, handle_add_punctuation
+from .util.appt_utils import (
+    handle_get_appointments, handle_generate_calendar, handle_generate_appointments_calendar, handle_save_appointment
+)
 from .util.pref_utils import handle_get_prefs, handle_set_prefs
+from .util.voice_utils import handle_get_audio
+from .metrics import start_request, finish_request
 import logging
 
 api_blueprint = Blueprint('api', __name__)
 logger = logging.getLogger(__name__)
 
+@api_blueprint.before_request
+def start_timing():
+    g.timing = (start_request(), time.perf_counter())
+
+
+@api_blueprint.after_request
+def add_server_timing(response):
+    """
+    Record the request's latency and report its per-stage breakdown in a Server-Timing header.
+
+    Streamed responses run after this hook, so they get no header and report their
+    stages only through /metrics; their request latency is recorded once the body is sent.
+    """
+    token, start = g.pop('timing')
+    if response.is_streamed:
+        finish_request(token, 0.0)
+        metrics, endpoint = current_app.metrics, request.endpoint
+        response.call_on_close(lambda: metrics.record("request", endpoint, time.perf_counter() - start))
+        return response
+    elapsed = time.perf_counter() - start
+    current_app.metrics.record("request", request.endpoint, elapsed, response.status_code >= 500)
+    response.headers['Server-Timing'] = finish_request(token, elapsed)
+    return response
+
+
+@api_blueprint.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Latency histograms for LLM calls (by prompt name), TTS, Supabase queries and
+    requests, plus cache counters, in the Prometheus text format.
+    """
+    return Response(current_app.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @api_blueprint.route('/api/newUser', methods=['POST'])
 def newUser():
     """
@@ -23,7 +62,7 @@ def newUser():
         jsonify: JSON response with success status
     """
     data = request.json
-    logger.info(f"Adding user: {data}")
+    logger.info("Adding user", extra={"payload": data})
     return handle_new_user(data)
 
 
@@ -37,14 +76,17 @@ def firstChat():
         - userId (str): Unique identifier for the user
         - userName (str): User's preferred name
         - isVoiceMode (bool): True if voice mode, False otherwise
+        - audioEncoding (str, optional): "LINEAR16" (default), "OGG_OPUS" or "MP3"
+        - sampleRateHertz (int, optional): 8000, 16000, 24000 or 48000 (default)
         
     Returns:
         JSON containing:
         - message (str): AI's response
-        - audioData (str): Base64-encoded audio data for the response
+        - audioId (str), audioUrl (str): Where to fetch the spoken response, in voice mode
+        - audioEncoding (str), sampleRateHertz (int): Format of the audio
     """
     data = request.json
-    logger.info(f"Handling first chat. Data: {data}")
+    logger.info("Handling first chat", extra={"payload": data})
     return handle_first_chat(data)
 
 
@@ -57,29 +99,79 @@ def chat():
         - sessionId (str): Unique identifier for the chat session
         - message (str): User's message
         - isVoiceMode (bool): True if the message is a voice input, False otherwise
+        - audioEncoding (str, optional): "LINEAR16" (default), "OGG_OPUS" or "MP3"
+        - sampleRateHertz (int, optional): 8000, 16000, 24000 or 48000 (default)
         
     Returns:
         JSON containing:
         - message (str): AI's response
         - sessionId (str): Session identifier
+        - audioId (str), audioUrl (str): Where to fetch the spoken response, in voice mode
+        - audioEncoding (str), sampleRateHertz (int): Format of the audio
     """
     data = request.json
-    logger.info(f"Handling chat. Data: {data}")
+    logger.info("Handling chat", extra={"payload": data})
     return handle_chat(data)
 
 
+@api_blueprint.route('/api/chat-stream', methods=['POST'])
+def chat_stream():
+    """
+    Handle chat messages from the client, streaming the response as Server-Sent Events.
+    
+    Expects JSON payload with:
+        - sessionId (str): Unique identifier for the chat session
+        - message (str): User's message
+        - isVoiceMode (bool): True if audio should be streamed alongside the text, False otherwise
+        - audioEncoding (str, optional): "LINEAR16" (default), "OGG_OPUS" or "MP3"
+        - sampleRateHertz (int, optional): 8000, 16000, 24000 or 48000 (default)
+        
+    Returns:
+        text/event-stream where each frame is a JSON object with:
+        - type (str): "delta", "audio", "done" or "error"
+        - content (str): Piece of the AI's response ("delta" frames)
+        - index (int), text (str), audioData (str): Base64-encoded audio for one sentence, in order ("audio" frames)
+        - audioEncoding (str), sampleRateHertz (int): Format of audioData ("audio" frames)
+        - message (str): Full AI's response ("done" frame)
+        - end (bool): True if the conversation should end ("done" frame)
+        - suggestedAppointment (bool), suggestedTime (str): Suggested appointment, if any ("done" frame)
+
+    Unlike the other endpoints, the response has no Server-Timing header: its LLM and
+    TTS stages are only reported through /metrics.
+    """
+    data = request.json
+    logger.info("Handling streaming chat", extra={"payload": data})
+    return handle_chat_stream(data)
+
+
+@api_blueprint.route('/api/audio/<audio_id>', methods=['GET'])
+def get_audio(audio_id):
+    """
+    Serve the spoken response for an audioId returned by /api/firstChat or /api/chat.
+    Supports Range requests. IDs expire after AUDIO_TTL seconds. With a Redis or SQLite
+    SESSION_STORE any worker can serve them; with memory sessions, only the one that handed them out.
+
+    Returns:
+        The raw audio with a Content-Type matching its encoding, or JSON with an error.
+    """
+    return handle_get_audio(audio_id)
+
+
 @api_blueprint.route('/api/add-punct', methods=['POST'])
 def add_punctuation_text():
     """
     Normalize text from speech-to-text by adding punctuation and proper formatting.
+    Concurrent requests are coalesced into shared LLM calls (see PUNCT_BATCH_WINDOW_MS).
     
-    Expects JSON payload with:
+    Expects JSON payload with either:
         - text (str): Text to normalize
+        - segments (list): Texts to normalize independently
         
     Returns:
         JSON containing:
         - success (bool): True if successful, False otherwise
-        - newText (str): Normalized text
+        - newText (str): Normalized text, when text was sent
+        - newSegments (list): Normalized texts in the same order, when segments were sent
     """
     data = request.json
     return handle_add_punctuation(data)
@@ -88,21 +180,37 @@ def add_punctuation_text():
 @api_blueprint.route('/api/save', methods=['POST'])
 def save():
     """
-    Saves session to Supabase DB.
+    Queues the session to be summarized and saved to Supabase DB. Returns right away.
     
     Expects JSON payload with:
         - sessionId (str): Unique identifier for the session (currently the same as userId)
         
     Returns:
         JSON containing:
-        - success (bool): True if the save was successful, False otherwise
-        - error (str): Error message if the save failed, empty string otherwise
+        - success (bool): True if the save was queued, False otherwise
+        - jobId (str): ID to check the save's progress with /api/jobs/<job_id>
+        - error (str): Error message if the save couldn't be queued
     """
     session_id = request.json.get('sessionId')
     logger.info(f"Saving session for session ID {session_id}")
     return handle_save_session(session_id)
 
 
+@api_blueprint.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Reports the state of a background job, e.g. a session save.
+
+    Returns:
+        JSON containing:
+        - success (bool): False if the job doesn't exist
+        - status (str): "queued", "running", "done" or "failed"
+        - attempts (int): Attempts made so far
+        - error (str): Error from the latest failed attempt, if any
+    """
+    return handle_get_job(job_id)
+
+
 @api_blueprint.route('/api/generate-calendar', methods=['POST'])
 def generate_calendar():
     """
@@ -117,6 +225,22 @@ def generate_calendar():
     """
     data = request.json
     return handle_generate_calendar(data)
+
+
+@api_blueprint.route('/api/appointments-calendar', methods=['POST'])
+def appointments_calendar():
+    """
+    Generate one ICS file holding all of a user's upcoming appointments.
+
+    Expects JSON payload with:
+        - userId (str): Unique identifier for the user
+
+    Returns:
+        ICS file for download. Events keep the same UID across downloads,
+        so importing the file again updates them instead of adding copies.
+    """
+    user_id = request.json.get('userId')
+    return handle_generate_appointments_calendar(user_id)
     
 
 @api_blueprint.route('/api/save-appointment', methods=['POST'])
@@ -157,6 +281,7 @@ def get_prefs():
     
     Expects JSON payload with:
         - userId (str): Unique identifier for the user
+        - sessionId (str, optional): Live session to refresh with the latest preferences
         
     Returns:
         JSON containing:
@@ -167,7 +292,8 @@ def get_prefs():
         - error (str): Error message if any
     """
     user_id = request.json.get('userId')
-    return handle_get_prefs(user_id)
+    session_id = request.json.get('sessionId')
+    return handle_get_prefs(user_id, session_id)
     
 
 @api_blueprint.route('/api/set-prefs', methods=['POST'])
@@ -180,6 +306,7 @@ def set_prefs():
         - backgroundInfo (str): Background information
         - agentPreferences (str): Agent preferences
         - gender (str): Preferred agent gender
+        - sessionId (str, optional): Live session the new preferences should apply to
         
     Returns:
         JSON containing:
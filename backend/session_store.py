@@ -0,0 +1,245 @@
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def new_session(history, user_info, sys_prompt):
+    """
+    Build the state kept for one conversation.
+
+    Args:
+        history (list): The conversation history so far.
+        user_info (dict): The user's row from the Supabase users table.
+        sys_prompt (str): The compiled system prompt for this user.
+
+    Returns:
+        dict: The session state.
+    """
+    return {
+        "history": history,
+        "token_counts": [],
+        "crisis_status": False,
+        "user_info": user_info,
+        "sys_prompt": sys_prompt
+    }
+
+
+class SessionStore:
+    """
+    Interface for storing conversation state by session ID.
+
+    Sessions are plain JSON-serializable dicts (see new_session). Callers load a
+    session with get, modify it and write back the fields they changed with update,
+    so concurrent requests on one session (e.g. a chat turn and /api/set-prefs)
+    don't overwrite each other's changes. save writes a whole session.
+    """
+
+    def get(self, session_id):
+        """
+        Args:
+            session_id (str): Unique identifier for the session.
+
+        Returns:
+            dict: The session state, or None if the session doesn't exist or has expired.
+        """
+        raise NotImplementedError
+
+    def save(self, session_id, session):
+        """
+        Args:
+            session_id (str): Unique identifier for the session.
+            session (dict): The session state.
+        """
+        raise NotImplementedError
+
+    def update(self, session_id, changes):
+        """
+        Atomically merge fields into a stored session.
+
+        Args:
+            session_id (str): Unique identifier for the session.
+            changes (dict): The top-level fields to overwrite.
+
+        Returns:
+            bool: False if the session doesn't exist or has expired, in which case nothing is written.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        """
+        Args:
+            session_id (str): Unique identifier for the session.
+        """
+        raise NotImplementedError
+
+
+class InMemorySessionStore(SessionStore):
+    """Keeps sessions in a dict in this process. State is lost on restart and not shared between workers."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self.sessions[session_id]
+                return None
+            return copy.deepcopy(entry[1])
+
+    def save(self, session_id, session):
+        with self.lock:
+            self.sessions[session_id] = (time.time() + self.ttl, copy.deepcopy(session))
+
+    def update(self, session_id, changes):
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None or entry[0] < time.time():
+                return False
+            self.sessions[session_id] = (time.time() + self.ttl, {**entry[1], **copy.deepcopy(changes)})
+            return True
+
+    def delete(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+
+class RedisSessionStore(SessionStore):
+    """Keeps sessions in Redis (or anything speaking the Redis protocol), shared by every worker."""
+
+    def __init__(self, url, ttl, prefix="talk2me:session:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SESSION_STORE=redis requires the 'redis' package") from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, session_id):
+        data = self.client.get(self.prefix + session_id)
+        return json.loads(data) if data else None
+
+    def save(self, session_id, session):
+        self.client.set(self.prefix + session_id, json.dumps(session), ex=self.ttl)
+
+    def update(self, session_id, changes):
+        key = self.prefix + session_id
+        merged = False
+
+        def merge(pipe):
+            # Retried by transaction if the key changes between WATCH and EXEC
+            nonlocal merged
+            data = pipe.get(key)
+            merged = bool(data)
+            pipe.multi()
+            if merged:
+                pipe.set(key, json.dumps({**json.loads(data), **changes}), ex=self.ttl)
+
+        self.client.transaction(merge, key)
+        return merged
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Keeps sessions in a SQLite file, shared by every worker on one machine and kept across restarts."""
+
+    def __init__(self, path, ttl, table="sessions"):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (session_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table} (expires_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT data, expires_at FROM {self.table} WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),))
+                return None
+            return json.loads(row[0])
+
+    def save(self, session_id, session):
+        now = time.time()
+        with self._connect() as conn:
+            # Expired rows that are never read again would otherwise stay in the file
+            conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (session_id, data, expires_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(session), now + self.ttl)
+            )
+
+    def update(self, session_id, changes):
+        now = time.time()
+        with self._connect() as conn:
+            # Take the write lock before reading, so no other writer can slip in between
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                f"SELECT data FROM {self.table} WHERE session_id = ? AND expires_at >= ?", (session_id, now)
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute(
+                f"UPDATE {self.table} SET data = ?, expires_at = ? WHERE session_id = ?",
+                (json.dumps({**json.loads(row[0]), **changes}), now + self.ttl, session_id)
+            )
+            return True
+
+    def delete(self, session_id):
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE session_id = ?", (session_id,))
+
+
+def create_session_store(config, namespace="session", ttl=None):
+    """
+    Create the session store selected by the SESSION_STORE setting.
+
+    Other shared, short-lived state (e.g. synthesized audio) uses the same backend
+    under its own namespace: a separate Redis key prefix or SQLite table, so its
+    keys can never collide with session IDs.
+
+    Args:
+        config (dict): The app config.
+        namespace (str): What the store holds. "session" is the conversation state.
+        ttl (int): Seconds entries live for. Defaults to SESSION_TTL.
+
+    Returns:
+        SessionStore: The configured session store.
+    """
+    backend = config['SESSION_STORE']
+    ttl = ttl or config['SESSION_TTL']
+    logger.info(f"Using {backend} {namespace} store")
+    if backend == 'memory':
+        return InMemorySessionStore(ttl)
+    if backend == 'redis':
+        return RedisSessionStore(config['SESSION_REDIS_URL'], ttl, prefix=f"talk2me:{namespace}:")
+    if backend == 'sqlite':
+        return SQLiteSessionStore(config['SESSION_SQLITE_PATH'], ttl, "sessions" if namespace == "session" else namespace)
+    raise ValueError(f"Unknown SESSION_STORE: {backend}")
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class AppointmentCache:
+    """
+    Per-user "has a future appointment" state, so suggesting an appointment
+    doesn't need to query the appointments table.
+
+    A user with an upcoming appointment is remembered until that appointment's
+    time. A user without one is remembered for `ttl` seconds, since another
+    worker may book one in the meantime. Bounded by LRU on the number of users.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, user_id):
+        """
+        Args:
+            user_id (str): The ID of the user.
+
+        Returns:
+            bool: Whether the user has a future appointment, or None if that isn't known.
+        """
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] < time.time():
+                self.entries.pop(user_id, None)
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return entry[1] is not None
+
+    def put(self, user_id, appointment_time):
+        """
+        Record what the appointments table says about a user.
+
+        Args:
+            user_id (str): The ID of the user.
+            appointment_time (datetime): The user's next appointment (timezone-aware), or None if they have none.
+        """
+        expires_at = appointment_time.timestamp() if appointment_time else time.time() + self.ttl
+        with self.lock:
+            self.entries.pop(user_id, None)
+            self.entries[user_id] = (expires_at, appointment_time)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def add_appointment(self, user_id, appointment_time):
+        """
+        Record a newly booked appointment. The entry keeps whichever of the known
+        and the new appointment comes first.
+
+        Args:
+            user_id (str): The ID of the user.
+            appointment_time (datetime): The booked time (timezone-aware).
+        """
+        if appointment_time.timestamp() < time.time():
+            return
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[1] is not None and entry[0] >= time.time() and entry[1] < appointment_time:
+                return
+        self.put(user_id, appointment_time)
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Hit/miss counters, hit rate and the number of cached users.
+        """
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self.entries)
+            }
+
+
+def parse_appointment_time(value):
+    """
+    Args:
+        value (str): An appointment_time as stored in Supabase (ISO 8601, UTC).
+
+    Returns:
+        datetime: The timezone-aware time.
+    """
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
@@ -2,7 +2,8 @@ from flask import jsonify, current_app, make_response
 import logging
 import pytz
 from datetime import datetime, timedelta
-from ics import Calendar, Event
+from .appointment_cache import parse_appointment_time
+from .ics_utils import render_sessions, session_uid
 
 logger = logging.getLogger(__name__)
 PACIFIC_TZ = pytz.timezone('America/Los_Angeles')
@@ -11,31 +12,96 @@ def suggest_appointment(user_id):
     '''
     Suggest an appointment for a user if no future appointments exist.
 
-    This function checks the Supabase database for any future appointments
-    for the given user. If no future appointments are found, it schedules
+    This function checks the app's appointment cache, falling back to the Supabase database,
+    for any future appointments for the given user. If no future appointments are found, it schedules
     a new appointment exactly one week from the current date and time (the same hour).
     If the current time is between 6 AM and 11 PM, it would suggest a time at 8 PM.
 
     Args:
         user_id (str): The unique identifier for the user.
-        supabase_client: The Supabase client instance used to interact with the database.
 
     Returns:
         tuple: A tuple containing:
             - suggestedAppointment (bool): True if a new appointment was suggested, False otherwise.
             - suggestedTime (str): The ISO formatted string of the suggested appointment time, or None if no appointment was suggested.
     '''
-    try:
-        future_appointments = current_app.supabase_client.table("appointments").select("*")\
-                .eq("user_id", user_id)\
-                .gte("appointment_time", datetime.now().isoformat())\
-                .execute()
-    except Exception as e:
-        logger.error(f"Error querying/inserting into Supabase appointments table: {str(e)}")
-        return False, None
-    if future_appointments and future_appointments.data:
+    has_appointment = current_app.appointment_cache.get(user_id)
+    if has_appointment is None:
+        try:
+            # One row is enough to know whether an appointment exists
+            future_appointments = current_app.repository.get_appointments(user_id, datetime.now(pytz.UTC).isoformat(), limit=1)
+        except Exception as e:
+            logger.error(f"Error querying/inserting into Supabase appointments table: {str(e)}")
+            return False, None
+        cache_appointments(current_app.appointment_cache, user_id, future_appointments)
+        has_appointment = bool(future_appointments)
+    if has_appointment:
         logger.info(f"User {user_id} already has an appointment time.")
         return False, None
+    next_appointment = next_appointment_time()
+    utc_appointment = next_appointment.astimezone(pytz.UTC)
+    logger.info(f"Suggesting to user_id: {user_id} for local_appointment_time: {next_appointment.isoformat()}, utc_appointment_time: {utc_appointment.isoformat()}")
+
+    return True, next_appointment.isoformat()
+
+
+def cache_appointments(appointment_cache, user_id, future_appointments):
+    '''
+    Record a user's future appointments, soonest first, in the appointment cache.
+
+    Args:
+        appointment_cache (AppointmentCache): The app's appointment cache.
+        user_id (str): The unique identifier for the user.
+        future_appointments (list): Rows with appointment_time, as read from Supabase.
+    '''
+    next_time = parse_appointment_time(future_appointments[0]['appointment_time']) if future_appointments else None
+    appointment_cache.put(user_id, next_time)
+
+
+def precomputed_suggestion(session, appointment_cache):
+    '''
+    The appointment suggestion worked out when the session started, so ending a
+    conversation doesn't need a database call. Dropped if the appointment cache
+    shows the user has booked an appointment since.
+
+    Args:
+        session (SessionContext): The session context.
+        appointment_cache (AppointmentCache): The app's appointment cache.
+
+    Returns:
+        tuple: (suggestedAppointment, suggestedTime), or None if the session has no precomputed suggestion.
+    '''
+    suggestion = session.state.get("appointment_suggestion")
+    if suggestion is None:
+        return None
+    if appointment_cache.get(session.user_id):
+        return False, None
+    return tuple(suggestion)
+
+
+def closing_suggestion(session):
+    '''
+    Args:
+        session (SessionContext): The session context.
+
+    Returns:
+        tuple: (suggestedAppointment, suggestedTime) for a conversation that is ending.
+    '''
+    suggestion = precomputed_suggestion(session, current_app.appointment_cache)
+    if suggestion is None:
+        # The background suggestion isn't ready yet, or the session predates precomputed suggestions
+        return suggest_appointment(session.user_id)
+    return suggestion
+
+
+def next_appointment_time():
+    '''
+    Pick the suggested time for a user's next appointment: one week from now, on the hour,
+    moved to 8 PM if that would fall between 11 PM and 6 AM Pacific time.
+
+    Returns:
+        datetime: The suggested appointment time in Pacific time.
+    '''
     current_time = datetime.now(pytz.UTC)
     local_time = current_time.astimezone(PACIFIC_TZ)
     next_appointment = (local_time + timedelta(days=7)).replace(minute = 0, second=0, microsecond=0)
@@ -45,36 +111,65 @@ def suggest_appointment(user_id):
     if hour >= 23 or hour < 6:
         # Late night users (11 PM - 6 AM) likely prefer evening appointments
         next_appointment = next_appointment.replace(hour=20)  # 8 PM
-    
-    utc_appointment = next_appointment.astimezone(pytz.UTC)
-    logger.info(f"Suggesting to user_id: {user_id} for local_appointment_time: {next_appointment.isoformat()}, utc_appointment_time: {utc_appointment.isoformat()}")
-
-    return True, next_appointment.isoformat()
+    return next_appointment
 
 
 def handle_generate_calendar(data):
-    appointment_time = data.get('appointmentTime')
+    return calendar_response(render_calendar(data.get('appointmentTime')), "therapy_session.ics")
+
+
+def render_calendar(appointment_time):
+    '''
+    Render an ICS calendar holding a single 30-minute therapy session.
+    See ics_utils for the RFC 5545 output format.
+
+    Args:
+        appointment_time (str): ISO 8601 formatted appointment time. Naive times are treated as Pacific time.
+
+    Returns:
+        str: The ICS file contents.
+    '''
     start_time = datetime.fromisoformat(appointment_time)
     if start_time.tzinfo is None:
         start_time = PACIFIC_TZ.localize(start_time)
+    return render_sessions([start_time])
 
-    c = Calendar()
-    e = Event()
-    e.name = "Therapy Session with Talk2Me"
-    e.begin = start_time
-    e.end = start_time + timedelta(minutes=30)
-    e.description = f"Virtual therapy session with Talk2Me AI therapist"
-    e.created = datetime.now(pytz.UTC)
-    
-    c.events.add(e)
-    calendar_content = str(c)
-    
+
+def render_appointments_calendar(user_id, appointments):
+    '''
+    Render an ICS calendar holding all of a user's upcoming therapy sessions. Each event's
+    UID is derived from the user and time, so re-importing the file updates existing events.
+
+    Args:
+        user_id (str): The unique identifier for the user.
+        appointments (list): Rows with appointment_time, as read from Supabase.
+
+    Returns:
+        str: The ICS file contents.
+    '''
+    start_times = [parse_appointment_time(row['appointment_time']) for row in appointments]
+    return render_sessions(start_times, [session_uid(user_id, start_time) for start_time in start_times])
+
+
+def calendar_response(calendar_content, filename):
     response = make_response(calendar_content)
-    response.headers["Content-Disposition"] = "attachment; filename=therapy_session.ics"
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
     response.headers["Content-Type"] = "text/calendar"
     return response
 
 
+def handle_generate_appointments_calendar(user_id):
+    if not user_id:
+        return jsonify({'success': False, 'error': 'Missing required fields'}), 400
+    try:
+        appointments = current_app.repository.get_appointments(user_id, datetime.now(pytz.UTC).isoformat())
+    except Exception as e:
+        logger.error(f"Error retrieving appointments: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    cache_appointments(current_app.appointment_cache, user_id, appointments)
+    return calendar_response(render_appointments_calendar(user_id, appointments), "therapy_sessions.ics")
+
+
 def handle_save_appointment(data):
     user_id = data.get('userId')
     appointment_time = data.get('appointmentTime')
@@ -86,28 +181,25 @@ def handle_save_appointment(data):
     utc_time = local_time.astimezone(pytz.UTC)
 
     try:
-        current_app.supabase_client.table("appointments").insert({
+        current_app.repository.insert_appointment({
             "user_id": user_id,
             "appointment_time": utc_time.isoformat(),
             "created_at_time": datetime.now(pytz.UTC).isoformat()
-        }).execute()
+        })
     except Exception as e:
         logger.error(f"Error saving appointment: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
+    current_app.appointment_cache.add_appointment(user_id, utc_time)
     
     return jsonify({'success': True})
 
 
 def handle_get_appointments(user_id):
     try:
-        response = current_app.supabase_client.table("appointments").select("*")\
-            .eq("user_id", user_id)\
-            .gte("appointment_time", datetime.now(pytz.UTC).isoformat())\
-            .order("appointment_time", desc=False)\
-            .execute()
+        appointments = current_app.repository.get_appointments(user_id, datetime.now(pytz.UTC).isoformat())
     except Exception as e:
         logger.error(f"Error retrieving appointments: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
-    
-    appointments = response.data if response else []    
+    cache_appointments(current_app.appointment_cache, user_id, appointments)
+
     return jsonify({'success': True, 'appointments': appointments})
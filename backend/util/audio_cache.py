@@ -0,0 +1,229 @@
+import base64
+import hashlib
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class AudioCache:
+    """
+    Two-tier cache for synthesized speech, keyed by (voice name, audio config, text).
+
+    The memory tier is an LRU bounded by total bytes. The disk tier keeps entries
+    put with persist=True as files, so they survive restarts and are shared by
+    workers on one machine. Only static or templated phrases should be persisted;
+    speech made from conversation text stays in memory.
+    """
+
+    def __init__(self, max_bytes, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(voice_name, audio_config, text):
+        """
+        Args:
+            voice_name (str): The TTS voice.
+            audio_config (str): A stable description of the audio config, e.g. "LINEAR16:48000".
+            text (str): The text being synthesized.
+
+        Returns:
+            str: The cache key.
+        """
+        return hashlib.sha256(f"{voice_name}\0{audio_config}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            bytes: The cached audio, or None on a miss.
+        """
+        with self.lock:
+            audio = self.entries.get(key)
+            if audio is not None:
+                self.entries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return audio
+        audio = self._read_disk(key)
+        with self.lock:
+            if audio is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+        self._put_memory(key, audio)
+        return audio
+
+    def put(self, key, audio, persist=False):
+        """
+        Args:
+            key (str): The cache key.
+            audio (bytes): The synthesized audio.
+            persist (bool): Also write the entry to the disk tier.
+        """
+        self._put_memory(key, audio)
+        if persist:
+            self._write_disk(key, audio)
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Hit/miss counters, hit rate and the memory tier's size.
+        """
+        with self.lock:
+            lookups = sum(self.stats.values())
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            return {
+                **self.stats,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_bytes": self.size,
+                "memory_entries": len(self.entries)
+            }
+
+    def _put_memory(self, key, audio):
+        if len(audio) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = audio
+            self.size += len(audio)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key, audio):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error writing audio cache entry: {e}")
+
+
+class AudioStore:
+    """
+    Short-lived clips handed out by ID, so chat responses can return before speech
+    is synthesized and clients fetch the raw bytes from /api/audio/<id> afterwards.
+
+    The worker that produced a chat response keeps the pending synthesis (a Future
+    or asyncio Task) in memory and serves it directly. When a shared store is given
+    (the session backend's "audio" namespace), every clip is also published there,
+    so any worker can serve it. Entries expire after ttl seconds in both places.
+    """
+
+    def __init__(self, ttl, shared=None):
+        self.ttl = ttl
+        self.shared = shared
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def reserve(self, audio_format):
+        """
+        Hand out a new audio ID and, with a shared store, mark it as pending there.
+
+        Args:
+            audio_format (tuple): (encoding, sample rate) the audio is synthesized with.
+
+        Returns:
+            str: The new audio ID.
+        """
+        audio_id = secrets.token_urlsafe(16)
+        if self.shared is not None:
+            self.shared.save(audio_id, {"format": list(audio_format), "status": "pending", "audio": None})
+        return audio_id
+
+    def add(self, audio_id, pending, audio_format):
+        """
+        Args:
+            audio_id (str): The ID from reserve.
+            pending: A Future or Task that resolves to the audio bytes (or None on failure).
+            audio_format (tuple): (encoding, sample rate) the audio is synthesized with.
+        """
+        with self.lock:
+            self._purge()
+            self.entries[audio_id] = (time.monotonic() + self.ttl, pending, audio_format)
+
+    def publish(self, audio_id, audio_format, audio_content):
+        """
+        Write a finished clip to the shared store, if there is one.
+
+        Args:
+            audio_id (str): The audio ID.
+            audio_format (tuple): (encoding, sample rate) the audio is synthesized with.
+            audio_content (bytes): The audio, or None if synthesis failed.
+        """
+        if self.shared is None:
+            return
+        self.shared.save(audio_id, {
+            "format": list(audio_format),
+            "status": "failed" if audio_content is None else "ready",
+            "audio": None if audio_content is None else base64.b64encode(audio_content).decode("ascii")
+        })
+
+    def fetch(self, audio_id):
+        """
+        Look a clip up in the shared store, for IDs handed out by another worker.
+
+        Args:
+            audio_id (str): The audio ID.
+
+        Returns:
+            str: "pending", "ready" or "failed", or None if the ID is unknown or expired.
+            tuple: (encoding, sample rate), or None.
+            bytes: The audio once ready, else None.
+        """
+        entry = self.shared.get(audio_id) if self.shared is not None else None
+        if entry is None:
+            return None, None, None
+        audio = base64.b64decode(entry["audio"]) if entry["audio"] else None
+        return entry["status"], tuple(entry["format"]), audio
+
+    def get(self, audio_id):
+        """
+        Args:
+            audio_id (str): The audio ID.
+
+        Returns:
+            tuple: (pending, audio_format), or None if the ID is unknown or expired.
+        """
+        with self.lock:
+            self._purge()
+            entry = self.entries.get(audio_id)
+        return entry[1:] if entry else None
+
+    def _purge(self):
+        now = time.monotonic()
+        for audio_id in [i for i, (expires, _, _) in self.entries.items() if expires <= now]:
+            del self.entries[audio_id]
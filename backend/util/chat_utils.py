@@ -1,41 +1,182 @@
-import ast
-import base64
-from flask import jsonify, current_app
+import concurrent.futures
+import json
+import threading
+import time
+from flask import jsonify, current_app, Response, stream_with_context
 import logging
 import backend.prompt_lib as pl
-from .voice_utils import generate_audio
-from .appt_utils import suggest_appointment
+from .session_utils import SessionContext, fetch_user_info
+from .intent_utils import fast_intent, record_shadow
+from .voice_utils import audio_cache_key, generate_audio, submit_audio, SpeechPipeline, parse_audio_format, audio_payload
+from .appt_utils import suggest_appointment, closing_suggestion
+from .response_cache import response_cache_key
+from .punct_utils import local_punctuation, record_shadow as record_punctuation_shadow
+from backend.metrics import propagate
 
 logger = logging.getLogger(__name__)
 
 CRISIS_MESSAGE = "It sounds like you're going through a really difficult time. As an AI, I'm not equipped to provide crisis support, and I would highly recommend seeking out professional resources. If you need immediate help, you can contact Crisis Text Line by texting HOME to 741741, call the Suicide & Crisis Lifeline at 988, or even go to the emergency room you feel like you need. Please let me know if there's anything else I can do for you. You can get through this."
 MIN_CONVO_LEN = 10
-LONG_CONTEXT_LEN = 20
-SHORT_CONTEXT_LEN = 3
+MODEL = "gpt-4o-mini"
 
-def get_response(sys_prompt, messages):
+def get_response(sys_prompt, messages, prompt_name="reply", use_cache=True):
     """
     Send a message to the OpenAI API and return the response.
 
     Args:
         sys_prompt (str): The system prompt to send to the API.
         messages (list): The conversation history to send to the API.
+        prompt_name (str): Short label for the prompt, used when logging timings.
+        use_cache (bool): Whether to read and fill the response cache for cacheable prompts.
 
     Returns:
         str: The response from the API.
     """
     conversation = [{"role": "system", "content": sys_prompt}, *messages]
-    logger.info(f"Sending request to OpenAI API with sys_prompt: {sys_prompt}")
-    logger.info(f"Sending request to OpenAI API with messages: {messages}")
-    response = current_app.openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=conversation
-    )
+    options = {}
+    cache_key = None
+    if prompt_name in pl.CACHEABLE_PROMPTS:
+        options["temperature"] = 0
+    if prompt_name in pl.CACHEABLE_PROMPTS and use_cache:
+        cache_key = response_cache_key(prompt_name, pl.CACHEABLE_PROMPTS[prompt_name], MODEL, conversation)
+        cached = current_app.response_cache.get(prompt_name, cache_key)
+        if cached is not None:
+            logger.info(f"[{prompt_name}] Answered from the response cache")
+            return cached
+    logger.info(f"[{prompt_name}] Sending request to OpenAI API", extra={"payload": {"sys_prompt": sys_prompt, "messages": messages}})
+    start = time.perf_counter()
+    with current_app.metrics.span("llm", prompt_name):
+        response = current_app.llm.create(
+            prompt_name,
+            model=MODEL,
+            messages=conversation,
+            **options
+        )
     response_content = response.choices[0].message.content
-    logger.info(f"Received API response: {response_content[:50]}...")
+    if cache_key is not None:
+        current_app.response_cache.put(cache_key, response_content)
+    logger.info(f"[{prompt_name}] took {time.perf_counter() - start:.3f}s")
+    logger.info(f"[{prompt_name}] Received API response", extra={"payload": {"response": response_content}})
     return response_content
 
 
+def stream_response(sys_prompt, messages, prompt_name="reply"):
+    """
+    Send a message to the OpenAI API and yield the response as it is generated.
+
+    Args:
+        sys_prompt (str): The system prompt to send to the API.
+        messages (list): The conversation history to send to the API.
+        prompt_name (str): Short label for the prompt, used when logging timings.
+
+    Yields:
+        str: Pieces of the response, in order.
+    """
+    conversation = [{"role": "system", "content": sys_prompt}, *messages]
+    logger.info(f"[{prompt_name}] Streaming request to OpenAI API", extra={"payload": {"sys_prompt": sys_prompt, "messages": messages}})
+    # Read up front: the app context may be gone by the time the stream is exhausted
+    metrics = current_app.metrics
+    start = time.perf_counter()
+    stream = current_app.llm.create(
+        prompt_name,
+        model=MODEL,
+        messages=conversation,
+        stream=True
+    )
+    first_token = True
+    for chunk in stream:
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        if first_token:
+            logger.info(f"[{prompt_name}] first token after {time.perf_counter() - start:.3f}s")
+            metrics.record("llm_first_token", prompt_name, time.perf_counter() - start)
+            first_token = False
+        yield chunk.choices[0].delta.content
+    metrics.record("llm", prompt_name, time.perf_counter() - start)
+    logger.info(f"[{prompt_name}] stream took {time.perf_counter() - start:.3f}s")
+
+
+def submit_response(sys_prompt, messages, prompt_name="reply"):
+    """
+    Run get_response on the app's chat worker pool.
+
+    Args:
+        sys_prompt (str): The system prompt to send to the API.
+        messages (list): The conversation history to send to the API.
+        prompt_name (str): Short label for the prompt, used when logging timings.
+
+    Returns:
+        concurrent.futures.Future: Resolves to the response from the API.
+    """
+    app = current_app._get_current_object()
+    messages = list(messages)
+
+    def run():
+        with app.app_context():
+            return get_response(sys_prompt, messages, prompt_name)
+
+    return app.chat_executor.submit(propagate(run))
+
+
+def greeting_parts(user_name, gender):
+    """
+    Build the greeting sent to users who have no saved sessions yet, split into the
+    part that depends on the user's name and the fixed part whose audio is pre-rendered.
+
+    Args:
+        user_name (str): The name of the user.
+        gender (str): The gender of the therapist.
+
+    Returns:
+        list: The pieces of the greeting, in order.
+    """
+    therapist_name = "Jennifer"
+    if gender == "MALE":
+        therapist_name = "William"
+    return [f"Hi {user_name}!", f"I'm {therapist_name}, your AI therapist. What would you like to talk about?"]
+
+
+def greeting_message(user_name, gender):
+    """
+    Build the greeting sent to users who have no saved sessions yet.
+
+    Args:
+        user_name (str): The name of the user.
+        gender (str): The gender of the therapist.
+
+    Returns:
+        str: The greeting.
+    """
+    return " ".join(greeting_parts(user_name, gender))
+
+
+def prerender_static_audio(app):
+    """
+    Fill the audio cache with the crisis message and the fixed part of the greeting
+    for every voice. Runs on its own background thread, synthesizing the phrases in
+    parallel, so it never holds up the chat worker pool.
+
+    Args:
+        app (Flask): The app whose audio cache to fill.
+    """
+    phrases = {
+        # Genders that share a voice share the clip, so synthesize it once
+        audio_cache_key(gender, text): (text, gender)
+        for gender in ("FEMALE", "MALE", None) for text in (CRISIS_MESSAGE, greeting_parts("", gender)[-1])
+    }.values()
+
+    def render(phrase):
+        with app.app_context():
+            generate_audio(*phrase, cacheable=True)
+
+    def run():
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(phrases), thread_name_prefix="audio-prerender") as pool:
+            list(pool.map(render, phrases))
+        logger.info(f"Pre-rendered static audio. Audio cache: {app.audio_cache.metrics()}")
+
+    threading.Thread(target=run, name="audio-prerender", daemon=True).start()
+
+
 def get_first_message(user_name, sys_prompt, history, gender):
     """
     Get the first message to send to the user.
@@ -49,41 +190,53 @@ def get_first_message(user_name, sys_prompt, history, gender):
     Returns:
         str: The first message to send to the user.
     """
-    therapist_name = "Jennifer"
-    if gender == "MALE":
-        therapist_name = "William"
-    first_message = f"Hi {user_name}! I'm {therapist_name}, your AI therapist. What would you like to talk about?"
+    first_message = greeting_message(user_name, gender)
     if history:
-        first_message = get_response(sys_prompt + pl.start_convo_prompt_v0(user_name, history), [])
-    logger.info(f"First message: {first_message}")
+        first_message = get_response(sys_prompt + pl.start_convo_prompt_v0(user_name, history), [], "start")
+    logger.info("Generated first message", extra={"payload": {"message": first_message}})
     return first_message  
 
 
+def submit_appointment_suggestion(session):
+    """
+    Work out the closing appointment suggestion on the app's chat worker pool, off the
+    critical path of both the first reply and the closing turn, and store it in the
+    session once it is ready. Call it after the session has been saved.
+
+    Args:
+        session (SessionContext): The session context.
+    """
+    app = current_app._get_current_object()
+    store, session_id, user_id = session.store, session.session_id, session.user_id
+
+    def run():
+        try:
+            with app.app_context():
+                suggestion = suggest_appointment(user_id)
+            store.update(session_id, {"appointment_suggestion": suggestion})
+        except Exception as e:
+            logger.exception(f"Error precomputing appointment suggestion for session {session_id}: {e}")
+
+    app.chat_executor.submit(propagate(run))
+
+
 def handle_first_chat(data):
     session_id = data.get('sessionId')
     user_id = data.get('userId')
     preferred_name = data.get('userName')
     is_voice_mode = data.get('isVoiceMode', False)
+    audio_format = parse_audio_format(data)
 
     # Get user info from Supabase
     logger.info(f"Getting prefs for user_id: {user_id}")
-    db_user_info = current_app.supabase_client.table('users').select('*').eq('user_id', user_id).execute()
-    if not db_user_info:
+    user_info = fetch_user_info(user_id)
+    if user_info is None:
         return jsonify({"success": False, "error": "User not found"})
-    current_app.user_info = db_user_info.data[0]
-    current_app.user_info['history_summary'] = ast.literal_eval(current_app.user_info['history_summary'])
-    logger.info(f"User info: {current_app.user_info}")
+    logger.info(f"Loaded user info for user_id: {user_id}", extra={"payload": {"user_info": user_info}})
 
     # Configure custom system prompt
-    current_app.custom_sys_prompt = pl.systemprompt_v1()
-    if current_app.user_info['history_summary']:
-        current_app.custom_sys_prompt = current_app.custom_sys_prompt+ pl.inject_history(preferred_name, current_app.user_info['history_summary'])
-    if current_app.user_info['custom_background']:
-        current_app.custom_sys_prompt = current_app.custom_sys_prompt+ pl.inject_background(current_app.user_info['custom_background'])
-    if current_app.user_info['custom_behavior']:
-        current_app.custom_sys_prompt = current_app.custom_sys_prompt+ pl.inject_behavior(current_app.user_info['custom_behavior'])
-
-    logger.info(f"Custom system prompt: {current_app.custom_sys_prompt}")
+    session = SessionContext.start(session_id, user_info, preferred_name, [])
+    logger.info("Built custom system prompt", extra={"payload": {"sys_prompt": session.sys_prompt}})
 
     response_data = {
         "success": True,
@@ -92,15 +245,19 @@ def handle_first_chat(data):
 
     # Retrieve first message and audio content, if applicable
     try:
-        first_message = get_first_message(preferred_name, current_app.custom_sys_prompt, current_app.user_info['history_summary'], current_app.user_info['custom_gender'])
+        first_message = get_first_message(preferred_name, session.sys_prompt, user_info['history_summary'], session.gender)
         response_data["message"] = first_message
         if is_voice_mode:
-            audio_content = generate_audio(first_message)
-            if audio_content:
-                response_data["audioData"] = base64.b64encode(audio_content).decode("utf-8")
-        init_convo = [{"role": "assistant", "content": first_message}]
-        current_app.temp_db[session_id] = {"history": init_convo, "crisis_status": False}
-        logger.info(f"Temp db: {current_app.temp_db}")
+            if user_info['history_summary']:
+                response_data.update(submit_audio([first_message], session.gender, audio_format))
+            else:
+                # Only the fixed part of the greeting is kept in the disk cache
+                parts = greeting_parts(preferred_name, session.gender)
+                response_data.update(submit_audio(parts, session.gender, audio_format, [False, True]))
+        session.add_message("assistant", first_message)
+        session.save()
+        submit_appointment_suggestion(session)
+        logger.info(f"Started session: {session_id}")
     except Exception as e:
         logger.error(f"Error retrieving first message: {e}")
         return jsonify({"success": False, "error": str(e)})
@@ -108,107 +265,608 @@ def handle_first_chat(data):
     return jsonify(response_data)
 
 
-def handle_crisis_message(session_id, temp_db):
+def handle_crisis_message(session):
     """
     Handle crisis message.
 
     Args:
-        session_id (str): The ID of the conversation.
-        temp_db (dict): The temporary database.
+        session (SessionContext): The session context.
 
     Returns:
         str: The generated response.
     """
-    logger.info(f"SENT_CRISIS original status: {temp_db[session_id]['crisis_status']}")
-    if not temp_db[session_id]['crisis_status']:
-        temp_db[session_id]['crisis_status'] = True
+    first_crisis_message = get_first_crisis_message(session)
+    if first_crisis_message:
+        return first_crisis_message
+    return get_response(*get_branch_request("crisis", session, current_app.config), "crisis")
+
+
+def get_first_crisis_message(session):
+    """
+    Return the fixed crisis message the first time a session reaches the crisis branch.
+
+    Args:
+        session (SessionContext): The session context.
+
+    Returns:
+        str: CRISIS_MESSAGE if it has not been sent in this session yet, None otherwise.
+    """
+    logger.info(f"SENT_CRISIS original status: {session.crisis_status}")
+    if not session.crisis_status:
+        session.crisis_status = True
         return CRISIS_MESSAGE
-    return get_response(current_app.custom_sys_prompt + pl.handle_crisis_prompt_v0(), temp_db[session_id]["history"][-LONG_CONTEXT_LEN:])
+    return None
+
+
+def choose_branch(intent, session, should_end=None):
+    """
+    Decide which prompt answers the turn from the classifier's answer and, once it
+    has been asked, the end-of-conversation check. Shared by the Flask and async apps.
+
+    Args:
+        intent (str): The intent ("1" typical, "2" crisis, "3" irrelevant).
+        session (SessionContext): The session context.
+        should_end (str): The answer to end_check_prompt, or None if it hasn't been asked.
+
+    Returns:
+        str: One of "crisis", "robust", "close" or "reply", or None if the end check is needed first.
+    """
+    if "2" in intent: # Crisis response
+        return "crisis"
+    if "3" in intent: # Robust response
+        return "robust"
+    if len(session.history) < MIN_CONVO_LEN:
+        return "reply"
+    if should_end is None:
+        return None
+    logger.info(f"should_end: {should_end}")
+    return "close" if "1" in should_end else "reply"
+
+
+def end_check_prompt(session, config):
+    return pl.idenfity_end_prompt_v0() + str(session.recent_history(config['CONTEXT_TOKENS_CLASSIFY']))
+
+
+def select_branch(session):
+    """
+    Classify the latest turn and decide which prompt should answer it.
+
+    Args:
+        session (SessionContext): The session context.
+
+    Returns:
+        str: One of "crisis", "robust", "close" or "reply".
+    """
+    intent = classify_intent(session)
+    logger.info(f"Convo length: {len(session.history)}")
+    branch = choose_branch(intent, session)
+    if branch is None:
+        # Determine if the conversation should end or not
+        should_end = get_response(end_check_prompt(session, current_app.config), [], "end")
+        branch = choose_branch(intent, session, should_end)
+    return branch
+
+
+def classify_intent(session):
+    """
+    Classify the latest turn, answering from the local classifier when it is confident
+    and falling back to classify_intent_prompt_v1 otherwise.
+
+    Args:
+        session (SessionContext): The session context.
+
+    Returns:
+        str: The intent ("1" typical, "2" crisis, "3" irrelevant).
+    """
+    recent_history = session.recent_history(current_app.config['CONTEXT_TOKENS_CLASSIFY'])
+    intent, prediction = fast_intent(recent_history, current_app.config, current_app.intent_classifier)
+    if intent is None:
+        intent = get_response(pl.classify_intent_prompt_v1(), [{"role": "user", "content": str(recent_history)}], "classify")
+        record_shadow(recent_history, prediction, intent, current_app.config)
+    logger.info(f"Detected intent: {intent}")
+    return intent
+
+
+def get_branch_request(branch, session, config):
+    """
+    Build the system prompt and messages that answer a turn for the given branch.
 
+    Args:
+        branch (str): One of "crisis", "robust", "close" or "reply".
+        session (SessionContext): The session context.
+        config (dict): The app config, for the CONTEXT_TOKENS_* budgets.
 
-def generate_response(session_id, temp_db, sys_prompt):
+    Returns:
+        str: The system prompt to send to the API.
+        list: The messages to send to the API.
+    """
+    sys_prompt = session.sys_prompt
+    if branch == "crisis":
+        return sys_prompt + pl.handle_crisis_prompt_v0(), session.recent_history(config['CONTEXT_TOKENS_REPLY'])
+    if branch == "robust":
+        return sys_prompt + pl.robust_v0(), session.recent_history(config['CONTEXT_TOKENS_CLASSIFY'])
+    if branch == "close":
+        return pl.close_convo_prompt_v0() + pl.inject_behavior(session.user_info['custom_behavior']), session.recent_history(config['CONTEXT_TOKENS_CLOSE'])
+    return sys_prompt, session.recent_history(config['CONTEXT_TOKENS_REPLY'])
+
+
+def generate_response(session):
     """
     Generate a response to a conversation using OpenAI's API.
 
     Args:
-        session_id (str): The ID of the conversation.
-        temp_db (dict): The temporary database.
-        sys_prompt (str): The system prompt for the response.
+        session (SessionContext): The session context.
 
     Returns:
         str: The generated response.
         bool: True if the conversation should end, False otherwise.
     """
-    session_history_str = str(temp_db[session_id]["history"][-SHORT_CONTEXT_LEN:])
+    if current_app.config['SPECULATIVE_RESPONSE']:
+        return generate_response_speculative(session)
 
-    # Classify intent
-    intent = get_response(pl.classify_intent_prompt_v1(), [{"role": "user", "content": session_history_str}])
-    logger.info(f"Detected intent: {intent}")
-    if "2" in intent: # Crisis response
-        return handle_crisis_message(session_id, temp_db), False
-    elif "3" in intent: # Robust response
-        return get_response(sys_prompt + pl.robust_v0(), temp_db[session_id]["history"][-SHORT_CONTEXT_LEN:]), False
+    branch = select_branch(session)
+    if branch == "crisis":
+        return handle_crisis_message(session), False
+    return get_response(*get_branch_request(branch, session, current_app.config), branch), branch == "close"
+
+
+def generate_response_speculative(session):
+    """
+    Generate a response like generate_response, but fire the intent classifier,
+    the end-of-conversation check and the default reply at the same time.
+
+    The default reply is kept when the turn is a typical therapy message. If the
+    crisis, robust or closing branch wins, the default reply is cancelled (or
+    discarded if it is already running) and that branch's response is used instead.
 
-    # Generate typical response
-    convo_len = len(temp_db[session_id]["history"])
+    Args:
+        session (SessionContext): The session context.
+
+    Returns:
+        str: The generated response.
+        bool: True if the conversation should end, False otherwise.
+    """
+    recent_history = session.recent_history(current_app.config['CONTEXT_TOKENS_CLASSIFY'])
+    convo_len = len(session.history)
     logger.info(f"Convo length: {convo_len}")
-    if convo_len >= MIN_CONVO_LEN:
-        # Determine if the conversation should end or not
-        should_end = get_response(pl.idenfity_end_prompt_v0() + session_history_str, [])
-        logger.info(f"should_end: {should_end}")
-        if "1" in should_end:
-            return get_response(pl.close_convo_prompt_v0() + pl.inject_behavior(current_app.user_info['custom_behavior']), temp_db[session_id]["history"][-LONG_CONTEXT_LEN:]), True
 
-    return get_response(sys_prompt, temp_db[session_id]["history"][-LONG_CONTEXT_LEN:]), False
+    intent, prediction = fast_intent(recent_history, current_app.config, current_app.intent_classifier)
+    intent_future = None
+    if intent is None:
+        intent_future = submit_response(pl.classify_intent_prompt_v1(), [{"role": "user", "content": str(recent_history)}], "classify")
+    end_future = reply_future = None
+    if intent is None or "1" in intent: # Skip speculation when the local classifier already picked another branch
+        if convo_len >= MIN_CONVO_LEN:
+            end_future = submit_response(end_check_prompt(session, current_app.config), [], "end")
+        reply_future = submit_response(*get_branch_request("reply", session, current_app.config))
+
+    def discard(*futures):
+        for future in futures:
+            if future is not None and not future.done() and not future.cancel():
+                logger.info("Discarding speculative response that was already in flight")
+
+    if intent_future is not None:
+        intent = intent_future.result()
+        record_shadow(recent_history, prediction, intent, current_app.config)
+    logger.info(f"Detected intent: {intent}")
+    branch = choose_branch(intent, session)
+    if branch is None:
+        branch = choose_branch(intent, session, end_future.result())
+    if branch == "reply":
+        return reply_future.result(), False
+    discard(reply_future, end_future)
+    if branch == "crisis":
+        return handle_crisis_message(session), False
+    return get_response(*get_branch_request(branch, session, current_app.config), branch), branch == "close"
+
+
+def finish_turn(session, agent_response, end_flag):
+    """
+    Store the agent's response and build the response payload for a chat turn.
 
+    Args:
+        session (SessionContext): The session context.
+        agent_response (str): The agent's response.
+        end_flag (bool): True if the conversation should end, False otherwise.
 
-def handle_chat(data):
-    session_id = data.get('sessionId', 'default')
-    user_message = data.get('message')
-    is_voice_mode = data.get('isVoiceMode', False)
-    logger.info(f"Received message: {user_message}. Session ID: {session_id}")
-    
-    if session_id not in current_app.temp_db:
-        return jsonify({"success": False, "error": "Session not found"})
-    current_app.temp_db[session_id]["history"].append({"role": "user", "content": user_message}) # Store the user's message in the temporary database
-    try:
-        agent_response, end_flag = generate_response(session_id, current_app.temp_db, current_app.custom_sys_prompt) # Generate a response to the user's message
-    except Exception as e:
-        logger.error(f"Error generating response: {e}")
-        return jsonify({"success": False, "error": str(e)})
-    logger.info(f"Response: {agent_response}")
-    current_app.temp_db[session_id]["history"].append({"role": "assistant", "content": agent_response}) # Store the agent's response in the temporary database
+    Returns:
+        dict: The response payload, including a suggested appointment if the conversation ended.
+    """
+    logger.info(f"Response ready for session ID: {session.session_id}", extra={"payload": {"response": agent_response}})
+    session.add_message("assistant", agent_response) # Store the agent's response in the session
+    update_summary = summary_update_due(session, current_app.config)
+    session.save()
+    if update_summary:
+        submit_summary_update(session)
 
     response_data = {
         "success": True,
         "message": agent_response,
-        "sessionId": session_id
+        "sessionId": session.session_id
     }
 
     if end_flag: # Suggest an appointment if the conversation should end
-        suggestedAppointment, suggestedTime = suggest_appointment(current_app.user_info['user_id'])
+        suggestedAppointment, suggestedTime = closing_suggestion(session)
         if suggestedAppointment:
             response_data['suggestedAppointment'] = suggestedAppointment
             response_data['suggestedTime'] = suggestedTime
             logger.info(f"Scheduling appointment time: {response_data['suggestedTime']}")
+    return response_data
+
+
+def summary_update_due(session, config):
+    """
+    Check whether the running summary should be updated, i.e. SUMMARY_EVERY_TURNS
+    replies have been added since the last update was requested. Marks the update
+    as requested in the session state, so call it before saving the session.
+
+    Args:
+        session (SessionContext): The session context.
+        config (dict): The app config.
+
+    Returns:
+        bool: True if an update is due.
+    """
+    every = config['SUMMARY_EVERY_TURNS']
+    if not every:
+        return False
+    requested_upto = session.state.get("summary_requested_upto", 0)
+    turns = sum(1 for message in session.history[requested_upto:] if message["role"] == "assistant")
+    if turns < every:
+        return False
+    session.set("summary_requested_upto", len(session.history))
+    return True
+
+
+def summary_request(chat_history, running_summary):
+    """
+    Build the request that brings a conversation's summary up to date.
+
+    Args:
+        chat_history (list): The conversation history.
+        running_summary (dict): The running summary ("summary", "upto"), or None to
+            summarize the whole transcript with summary_prompt_v0.
+
+    Returns:
+        str: The prompt to send, or None if the running summary already covers the conversation.
+        str: The prompt name, for timing logs.
+    """
+    if not running_summary:
+        return pl.summary_prompt_v0(chat_history), "summary"
+    new_turns = chat_history[running_summary["upto"]:]
+    if not new_turns:
+        return None, "summary_update"
+    return pl.update_summary_prompt_v0(running_summary["summary"], new_turns), "summary_update"
+
 
-    if is_voice_mode: # Generate audio response if in voice mode
-        audio_content = generate_audio(agent_response)
-        if audio_content:
-            response_data["audioData"] = base64.b64encode(audio_content).decode("utf-8")
+def summary_is_current(session_store, session_id, generation):
+    """
+    Args:
+        session_store (SessionStore): The app's session store.
+        session_id (str): Unique identifier for the session.
+        generation (int): The session's summary_generation when the summary update was requested.
+
+    Returns:
+        bool: Whether the session still exists and hasn't been saved since.
+    """
+    state = session_store.get(session_id)
+    return state is not None and state.get("summary_generation", 0) == generation
+
+
+def update_running_summary(store, session_id, chat_history, generation=0):
+    """
+    Fold the turns a session's running summary doesn't cover yet into it. The update
+    is dropped if the session is saved while it runs: the save took its own copy of
+    the summary, and writing this one back would leave a stale summary behind.
+
+    Args:
+        store (SessionStore): The app's summary store.
+        session_id (str): Unique identifier for the session.
+        chat_history (list): The conversation history.
+        generation (int): The session's summary_generation when the update was requested.
+    """
+    running_summary = store.get(session_id) or {"summary": None, "upto": 0}
+    prompt, prompt_name = summary_request(chat_history, running_summary)
+    if prompt is None:
+        return
+    summary = get_response(prompt, [], prompt_name)
+    session_store = current_app.session_store
+    if not summary_is_current(session_store, session_id, generation):
+        logger.info(f"Session {session_id} was saved while its summary was updating; dropping the update")
+        return
+    store.save(session_id, {"summary": summary, "upto": len(chat_history)})
+    # A save that landed between the check and the write has already deleted the summary it copied
+    if not summary_is_current(session_store, session_id, generation):
+        store.delete(session_id)
+
+
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+def submit_summary_update(session):
+    """
+    Run update_running_summary on the app's chat worker pool. A session whose summary
+    is already being updated is skipped; the next update catches up.
+
+    Args:
+        session (SessionContext): The session context.
+    """
+    app = current_app._get_current_object()
+    store, session_id, chat_history = app.summary_store, session.session_id, list(session.history)
+    generation = session.summary_generation
+    with _summarizing_lock:
+        if session_id in _summarizing:
+            return
+        _summarizing.add(session_id)
+
+    def run():
+        try:
+            with app.app_context():
+                update_running_summary(store, session_id, chat_history, generation)
+        except Exception as e:
+            logger.exception(f"Error updating running summary for session {session_id}: {e}")
+        finally:
+            with _summarizing_lock:
+                _summarizing.discard(session_id)
+
+    app.chat_executor.submit(run)
+
+
+def handle_chat(data):
+    session_id = data.get('sessionId', 'default')
+    user_message = data.get('message')
+    is_voice_mode = data.get('isVoiceMode', False)
+    audio_format = parse_audio_format(data)
+    logger.info(f"Received message. Session ID: {session_id}", extra={"payload": {"message": user_message}})
+    
+    session = SessionContext.load(session_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Session not found"})
+    session.add_message("user", user_message) # Store the user's message in the session
+    try:
+        agent_response, end_flag = generate_response(session) # Generate a response to the user's message
+    except Exception as e:
+        logger.error(f"Error generating response: {e}")
+        session.save() # Keep the user's message, so the next turn still sees it
+        return jsonify({"success": False, "error": str(e)})
+    response_data = finish_turn(session, agent_response, end_flag)
+
+    if is_voice_mode: # Start generating the audio response; the client fetches it by ID
+        response_data.update(submit_audio([agent_response], session.gender, audio_format))
     
     return jsonify(response_data)
 
 
+def sse_event(payload):
+    """
+    Format a payload as a Server-Sent Events frame.
+
+    Args:
+        payload (dict): The JSON-serializable payload.
+
+    Returns:
+        str: The SSE frame.
+    """
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def handle_chat_stream(data):
+    session_id = data.get('sessionId', 'default')
+    user_message = data.get('message')
+    is_voice_mode = data.get('isVoiceMode', False)
+    audio_format = parse_audio_format(data)
+    logger.info(f"Received streaming message. Session ID: {session_id}", extra={"payload": {"message": user_message}})
+
+    session = SessionContext.load(session_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Session not found"})
+    session.add_message("user", user_message) # Store the user's message in the session
+    try:
+        branch = select_branch(session)
+        agent_response = get_first_crisis_message(session) if branch == "crisis" else None
+    except Exception as e:
+        logger.error(f"Error generating response: {e}")
+        session.save() # Keep the user's message, so the next turn still sees it
+        return jsonify({"success": False, "error": str(e)})
+
+    # Synthesize speech sentence by sentence while the reply is still streaming
+    speech = SpeechPipeline(session.gender, audio_format) if is_voice_mode else None
+
+    def audio_events(finished):
+        for index, sentence, audio_content in finished:
+            if audio_content:
+                yield sse_event({"type": "audio", "index": index, "text": sentence, **audio_payload(audio_content, audio_format)})
+
+    def events():
+        chunks = []
+        try:
+            if agent_response:
+                deltas = [agent_response]
+            else:
+                sys_prompt, messages = get_branch_request(branch, session, current_app.config)
+                deltas = stream_response(sys_prompt, messages, branch)
+            for delta in deltas:
+                chunks.append(delta)
+                yield sse_event({"type": "delta", "content": delta})
+                if speech:
+                    speech.feed(delta)
+                    yield from audio_events(speech.ready())
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            session.save()
+            yield sse_event({"type": "error", "success": False, "error": str(e)})
+            return
+        response_data = finish_turn(session, "".join(chunks), branch == "close")
+        if speech:
+            speech.flush()
+            yield from audio_events(speech.drain())
+        yield sse_event({"type": "done", "end": branch == "close", **response_data})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def punctuation_inputs(data):
+    """
+    Args:
+        data (dict): The /api/add-punct payload, with either `text` or a `segments` list.
+
+    Returns:
+        list: The texts to punctualize, or None if the payload has none.
+    """
+    segments = data.get('segments')
+    if segments is None:
+        text = data.get('text')
+        return [text] if isinstance(text, str) and text else None
+    if not isinstance(segments, list) or not segments or not all(isinstance(segment, str) for segment in segments):
+        return None
+    return segments
+
+
+def punctuation_cache_key(text):
+    """The response cache key of a single-text punctuation call, shared by batched calls."""
+    conversation = [{"role": "system", "content": pl.punctualize_prompt()}, {"role": "user", "content": text}]
+    return response_cache_key("punctuation", pl.CACHEABLE_PROMPTS["punctuation"], MODEL, conversation)
+
+
+def punctuation_batch_message(texts):
+    return {"role": "user", "content": json.dumps({"segments": texts}, ensure_ascii=False)}
+
+
+def parse_punctuation_batch(content, count):
+    """
+    Args:
+        content (str): The model's answer to punctualize_batch_prompt.
+        count (int): How many segments were sent.
+
+    Returns:
+        list: One corrected string per segment, or None if the answer doesn't have exactly that shape.
+    """
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`").removeprefix("json").strip()
+    try:
+        segments = json.loads(content).get("segments")
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(segments, list) or len(segments) != count or not all(isinstance(s, str) for s in segments):
+        return None
+    return [segment.strip() for segment in segments]
+
+
+def punctuate_batch(texts):
+    """
+    Punctualize texts with one LLM call, falling back to one call per text if the
+    batched answer can't be split back into segments.
+
+    Args:
+        texts (list): Non-blank texts, at most PUNCT_BATCH_MAX of them.
+
+    Returns:
+        list: The corrected texts, in order.
+    """
+    unique = list(dict.fromkeys(texts))
+    answers = None
+    if len(unique) > 1:
+        content = get_response(pl.punctualize_batch_prompt(), [punctuation_batch_message(unique)], "punctuation_batch", use_cache=False)
+        answers = parse_punctuation_batch(content, len(unique))
+        if answers is None:
+            logger.warning(f"[punctuation_batch] Unusable answer for {len(unique)} segments, punctualizing them one by one")
+    if answers is None:
+        answers = [
+            get_response(pl.punctualize_prompt(), [{"role": "user", "content": text}], "punctuation", use_cache=False).strip()
+            for text in unique
+        ]
+    corrected = dict(zip(unique, answers))
+    return [corrected[text] for text in texts]
+
+
+def punctuation_lookup(texts, config, response_cache):
+    """
+    Answer what can be answered without the LLM: blank texts, texts the local
+    normalizer is confident about (PUNCT_LOCAL_MODE=on) and cached answers.
+
+    Args:
+        texts (list): The texts to punctualize.
+        config (dict): The app config.
+        response_cache (ResponseCache): The app's response cache.
+
+    Returns:
+        list: The answers so far, with the input text where the LLM is still needed.
+        dict: Indexes of texts the LLM is still needed for, mapped to their cache keys.
+        list: Per text, the local answer to compare with the LLM's in shadow mode, else None.
+    """
+    results = list(texts)
+    misses = {}
+    local, shadow = local_punctuation(texts, config)
+    for i, text in enumerate(texts):
+        if not text.strip():
+            continue
+        if local[i] is not None:
+            results[i] = local[i]
+            continue
+        key = punctuation_cache_key(text)
+        cached = response_cache.get("punctuation", key)
+        if cached is not None:
+            results[i] = cached.strip()
+        else:
+            misses[i] = key
+    return results, misses, shadow
+
+
+def punctuation_store(results, misses, answers, shadow, response_cache):
+    """Fill in and cache the LLM's answers for the texts punctuation_lookup left open."""
+    for (i, key), answer in zip(misses.items(), answers):
+        response_cache.put(key, answer)
+        results[i] = answer
+        if shadow[i] is not None:
+            record_punctuation_shadow(shadow[i], answer)
+
+
+def punctuate(texts):
+    """
+    Punctualize texts, answering locally or from the response cache where possible.
+    The rest join whatever other requests are waiting on app.punct_batcher and go
+    out in a shared LLM call.
+
+    Args:
+        texts (list): The texts to punctualize. Blank ones are returned unchanged.
+
+    Returns:
+        list: The corrected texts, in order.
+    """
+    app = current_app._get_current_object()
+    results, misses, shadow = punctuation_lookup(texts, app.config, app.response_cache)
+    if misses:
+        def run_batch(chunk):
+            # Extra chunks of an oversized batch run on the chat worker pool
+            with app.app_context():
+                return punctuate_batch(chunk)
+
+        answers = app.punct_batcher.submit([texts[i] for i in misses], run_batch, app.chat_executor)
+        punctuation_store(results, misses, answers, shadow, app.response_cache)
+    return results
+
+
+def punctuation_result(data, new_texts):
+    """The /api/add-punct response body: newText for a single text, newSegments for a list."""
+    if data.get('segments') is None:
+        return {'success': True, 'newText': new_texts[0]}
+    return {'success': True, 'newSegments': new_texts}
+
+
 def handle_add_punctuation(data):
-    text = data.get('text')
-    if not text:
+    texts = punctuation_inputs(data)
+    if texts is None:
         return jsonify({'success': False, 'error': 'No text provided'})
     
     try:   
-        new_text = get_response(pl.punctualize_prompt(), [{"role": "user", "content": text}]).strip()
+        new_texts = punctuate(texts)
     except Exception as e:
         logger.error(f"Error adding punctuation: {str(e)}")
         return jsonify({'success': False, 'error': 'Failed to add punctuation'})
     
-    return jsonify({'success': True, 'newText': new_text})
+    return jsonify(punctuation_result(data, new_texts))
@@ -1,6 +1,8 @@
+import uuid
 from flask import jsonify, current_app
-from .chat_utils import get_response
-import backend.prompt_lib as pl
+from .chat_utils import get_response, summary_request
+from .session_utils import SessionContext
+from .history_utils import submit_compaction
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,13 +13,14 @@ def handle_new_user(data):
     full_name = data.get('fullName')
     preferred_name = data.get('preferredName')
     try:
-        current_app.supabase_client.table("users").insert({
+        current_app.repository.insert_user({
             "user_id": user_id,
             "email": email,
             "full_name": full_name,
             "preferred_name": preferred_name,
             "history_summary": "[]"
-        }).execute()
+        })
+        current_app.user_cache.invalidate(user_id)
     except Exception as e:
         logger.error(f"Error adding user: {e}")
         return jsonify({"success": False, "error": str(e)})
@@ -25,36 +28,69 @@ def handle_new_user(data):
     return jsonify({"success": True})
 
 
-def save_session(user_id, past_history, chat_history):
+def save_session(user_id, chat_history, running_summary=None, save_id=None):
     """
-    Save a session to the database.
+    Save a session to the database. The session's summary is appended to the
+    sessions table, which is where past-session history is read from.
 
     Args:
         user_id (str): The ID of the user.
-        past_history (list): The past history of the user.
         chat_history (list): The current conversation history.
+        running_summary (dict): The session's running summary, if any. Only the turns it
+            doesn't cover are summarized; without it the whole transcript is.
+        save_id (str): Unique key for this save, so running it again doesn't add a second row.
 
     Returns:
         None
     """
-    logger.info(f"Saving session for user_id: {user_id}, past_history: {past_history}, chat_history: {chat_history}")
-    summary = get_response(pl.summary_prompt_v0(chat_history), [])
-    logger.info(f"Summary: {summary}")
-    current_app.supabase_client.table("sessions").insert({
-        "user_id": user_id,
-        "full_conversation": chat_history,
-        "summary": summary
-    }).execute()
-    current_app.supabase_client.table("users").update({
-        "history_summary": str([*past_history, summary])
-    }).eq("user_id", user_id).execute()
+    logger.info(f"Saving session for user_id: {user_id}", extra={"payload": {"chat_history": chat_history}})
+    prompt, prompt_name = summary_request(chat_history, running_summary)
+    summary = get_response(prompt, [], prompt_name) if prompt else running_summary["summary"]
+    logger.info(f"Summarized session for user_id: {user_id}", extra={"payload": {"summary": summary}})
+    current_app.repository.insert_session(user_id, chat_history, summary, save_id)
+    current_app.user_cache.invalidate(user_id)
     return
 
 
+SAVE_SESSION_JOB = "save_session"
+
+def save_session_job(payload):
+    """
+    Job queue handler for SAVE_SESSION_JOB. Runs in an app context.
+
+    Args:
+        payload (dict): user_id, chat_history and running_summary, captured when the save was requested,
+            and the save_id that makes retries idempotent.
+    """
+    save_session(payload['user_id'], payload['chat_history'], payload.get('running_summary'), payload.get('save_id'))
+    submit_compaction(payload['user_id'])
+
+
 def handle_save_session(session_id):
+    session = SessionContext.load(session_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Session not found"})
     try:
-        save_session(current_app.user_info['user_id'], current_app.user_info['history_summary'], current_app.temp_db[session_id]["history"])
+        # The conversation is copied into the job, so the save doesn't depend on the session staying around
+        job_id = current_app.job_queue.enqueue(SAVE_SESSION_JOB, {
+            "user_id": session.user_id,
+            "chat_history": session.history,
+            "running_summary": session.load_running_summary(),
+            "save_id": uuid.uuid4().hex
+        })
+        # The job has its own copy now. Bumping the generation first stops summary updates
+        # that are still running from writing theirs back
+        session.set("summary_generation", session.summary_generation + 1)
+        session.save()
+        current_app.summary_store.delete(session_id)
     except Exception as e:
-        logger.exception(f"Error saving session: {e}")
+        logger.exception(f"Error queueing session save: {e}")
         return jsonify({"success": False, "error": str(e)})
-    return jsonify({"success": True})
+    return jsonify({"success": True, "jobId": job_id})
+
+
+def handle_get_job(job_id):
+    job = current_app.job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "jobId": job_id, **job})
@@ -0,0 +1,105 @@
+from flask import current_app
+import logging
+import threading
+import backend.prompt_lib as pl
+from .chat_utils import get_response
+from .token_utils import estimate_tokens, fit_suffix
+from backend.repository import digest_cursor
+
+logger = logging.getLogger(__name__)
+
+# Session rows read per compaction round
+COMPACTION_BATCH = 50
+
+
+def plan_compaction(digest, summaries, config):
+    """
+    Decide how many of the oldest summaries to fold into the long-term digest.
+
+    Nothing is folded while the digest plus all summaries fit HISTORY_TOKEN_BUDGET
+    and there are no more than HISTORY_RECENT_SUMMARIES of them. Otherwise the newest
+    summaries that fit next to a digest of HISTORY_DIGEST_TOKENS stay verbatim.
+
+    Args:
+        digest (str): The current digest, or None.
+        summaries (list): Summaries not in the digest yet, oldest first.
+        config (dict): The app config.
+
+    Returns:
+        int: How many of the oldest summaries to fold.
+    """
+    token_counts = [estimate_tokens(summary) for summary in summaries]
+    if (estimate_tokens(digest) + sum(token_counts) <= config['HISTORY_TOKEN_BUDGET']
+            and len(summaries) <= config['HISTORY_RECENT_SUMMARIES']):
+        return 0
+    keep_from = fit_suffix(token_counts, config['HISTORY_TOKEN_BUDGET'] - config['HISTORY_DIGEST_TOKENS'])
+    return max(keep_from, len(summaries) - config['HISTORY_RECENT_SUMMARIES'])
+
+
+def digest_words(config):
+    # About three words per four tokens
+    return config['HISTORY_DIGEST_TOKENS'] * 3 // 4
+
+
+def compact_history(user_id):
+    """
+    Fold a user's older session summaries into users.history_digest until what is
+    left fits the history budget. users.history_digest_until and history_digest_until_id
+    record the created_at and id of the newest session in the digest.
+
+    Args:
+        user_id (str): The ID of the user.
+    """
+    repository = current_app.repository
+    config = current_app.config
+    while True:
+        row = repository.get_user(user_id)
+        session_rows = repository.get_summaries(
+            user_id, after=digest_cursor(row), limit=COMPACTION_BATCH, newest_first=False
+        )
+
+        fold = plan_compaction(row.get('history_digest'), [r['summary'] for r in session_rows], config)
+        if not fold:
+            return
+        digest = get_response(
+            pl.digest_prompt_v0(row.get('history_digest'), [r['summary'] for r in session_rows[:fold]], digest_words(config)),
+            [],
+            "digest"
+        )
+        repository.update_user(user_id, {
+            "history_digest": digest,
+            "history_digest_until": session_rows[fold - 1]['created_at'],
+            "history_digest_until_id": session_rows[fold - 1]['id']
+        })
+        current_app.user_cache.invalidate(user_id)
+        logger.info(f"Folded {fold} session summaries into the digest for user_id: {user_id}")
+
+
+_compacting = set()
+_compacting_lock = threading.Lock()
+
+def submit_compaction(user_id):
+    """
+    Run compact_history on the app's chat worker pool. A user already being
+    compacted in this process is skipped.
+
+    Args:
+        user_id (str): The ID of the user.
+    """
+    app = current_app._get_current_object()
+    with _compacting_lock:
+        if user_id in _compacting:
+            return
+        _compacting.add(user_id)
+
+    def run():
+        try:
+            with app.app_context():
+                compact_history(user_id)
+        except Exception as e:
+            logger.exception(f"Error compacting history for user_id {user_id}: {e}")
+        finally:
+            with _compacting_lock:
+                _compacting.discard(user_id)
+
+    app.chat_executor.submit(run)
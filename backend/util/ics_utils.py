@@ -0,0 +1,121 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+PRODID = "-//Talk2Me//Therapy Sessions//EN"
+SESSION_LENGTH = timedelta(minutes=30)
+SESSION_SUMMARY = "Therapy Session with Talk2Me"
+SESSION_DESCRIPTION = "Virtual therapy session with Talk2Me AI therapist"
+# RFC 5545 3.1: content lines are at most 75 octets, excluding the line break
+MAX_LINE_OCTETS = 75
+
+
+def escape_text(value):
+    """
+    Escape a TEXT property value (RFC 5545 3.3.11).
+
+    Args:
+        value (str): The raw text.
+
+    Returns:
+        str: The text with backslashes, semicolons, commas and line breaks escaped.
+    """
+    return (value.replace("\\", "\\\\")
+                 .replace(";", "\\;")
+                 .replace(",", "\\,")
+                 .replace("\r\n", "\\n")
+                 .replace("\n", "\\n"))
+
+
+def fold_line(line):
+    """
+    Fold a content line into chunks of at most MAX_LINE_OCTETS octets (RFC 5545 3.1).
+    Multi-byte UTF-8 characters are never split.
+
+    Args:
+        line (str): The unfolded content line.
+
+    Returns:
+        str: The folded line, continuation lines starting with a space, without a trailing CRLF.
+    """
+    if len(line.encode("utf-8")) <= MAX_LINE_OCTETS:
+        return line
+    chunks = []
+    chunk, size = [], 0
+    # Continuation lines lose one octet to the leading space
+    limit = MAX_LINE_OCTETS
+    for char in line:
+        octets = len(char.encode("utf-8"))
+        if size + octets > limit:
+            chunks.append("".join(chunk))
+            chunk, size, limit = [], 0, MAX_LINE_OCTETS - 1
+        chunk.append(char)
+        size += octets
+    chunks.append("".join(chunk))
+    return "\r\n ".join(chunks)
+
+
+def format_utc(value):
+    """
+    Args:
+        value (datetime): A timezone-aware time.
+
+    Returns:
+        str: The time as an RFC 5545 UTC DATE-TIME, e.g. 20250301T040000Z.
+    """
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def event_lines(start_time, stamp, uid):
+    """
+    Args:
+        start_time (datetime): The session's start time (timezone-aware).
+        stamp (datetime): When the event was generated (DTSTAMP).
+        uid (str): The event's UID.
+
+    Returns:
+        list: The unfolded content lines of one VEVENT for a SESSION_LENGTH therapy session.
+    """
+    return [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{format_utc(stamp)}",
+        f"DTSTART:{format_utc(start_time)}",
+        f"DTEND:{format_utc(start_time + SESSION_LENGTH)}",
+        f"SUMMARY:{escape_text(SESSION_SUMMARY)}",
+        f"DESCRIPTION:{escape_text(SESSION_DESCRIPTION)}",
+        "END:VEVENT",
+    ]
+
+
+def render_sessions(start_times, uids=None, stamp=None):
+    """
+    Render an ICS calendar holding one therapy session per start time.
+
+    Args:
+        start_times (list): Session start times (timezone-aware).
+        uids (list): Optional UIDs, one per start time. Stable UIDs let calendar apps
+            update events on re-import instead of duplicating them. Random by default.
+        stamp (datetime): DTSTAMP for every event. Defaults to now.
+
+    Returns:
+        str: The ICS file contents, CRLF line endings.
+    """
+    stamp = stamp or datetime.now(timezone.utc)
+    uids = uids or [f"{uuid.uuid4()}@talk2me" for _ in start_times]
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}"]
+    for start_time, uid in zip(start_times, uids):
+        lines.extend(event_lines(start_time, stamp, uid))
+    lines.append("END:VCALENDAR")
+    return "".join(fold_line(line) + "\r\n" for line in lines)
+
+
+def session_uid(user_id, start_time):
+    """
+    Args:
+        user_id (str): The ID of the user.
+        start_time (datetime): The session's start time (timezone-aware).
+
+    Returns:
+        str: A UID that is the same every time this appointment is exported.
+    """
+    return f"{uuid.uuid5(uuid.NAMESPACE_URL, f'talk2me:{user_id}:{format_utc(start_time)}')}@talk2me"
@@ -0,0 +1,216 @@
+import json
+import logging
+import math
+import os
+import re
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Labels match the digits classify_intent_prompt_v1 answers with
+NORMAL, CRISIS, OFF_TOPIC = "1", "2", "3"
+LABELS = (NORMAL, CRISIS, OFF_TOPIC)
+
+# Anything that might be a crisis always goes to the LLM classifier
+CRISIS_LEXICON = re.compile(
+    r"\b(suicid\w*|kill (my ?self|him|her|them|someone)|end (it all|my life)|want to die|wanna die|"
+    r"better off dead|no (point|reason) (in )?(living|going on)|hurt(ing)? (my ?self|someone|others)|"
+    r"self[- ]harm\w*|cut(ting)? myself|overdos\w*|can'?t go on|not worth living|take my (own )?life)\b",
+    re.IGNORECASE
+)
+OFF_TOPIC_LEXICON = re.compile(
+    r"\b(ignore (all |your )?(previous|prior) instructions|system prompt|write (me )?(a|an) (song|poem|essay|story|code|program)|"
+    r"what is the capital of|translate (this|into)|who (won|is the president)|recipe for)\b",
+    re.IGNORECASE
+)
+# A turn that mentions distress is never short-circuited to off-topic, whatever else it says
+DISTRESS_LEXICON = re.compile(
+    r"\b(hopeless\w*|helpless\w*|anxi\w*|depress\w*|sad(ness)?|lonely|alone|scared|afraid|panic\w*|stress\w*|"
+    r"overwhelm\w*|cry(ing)?|cried|tears|grie\w*|died|dead|death|lost|miss(ing)? (him|her|them)|hurt(s|ing)?|"
+    r"exhausted|worthless|numb|can'?t (sleep|cope|stop)|nightmares?|therap\w*)\b",
+    re.IGNORECASE
+)
+# Feature added for off-topic lexicon hits; its weight is learned like any other
+OFF_TOPIC_FEATURE = "lexicon:off_topic"
+# Used when no trained model exists: a lexicon hit alone scores about 0.79 off-topic,
+# below the default LOCAL_INTENT_OFF_TOPIC_THRESHOLD, so it still goes to the LLM
+RULES_ONLY_MODEL = {
+    "weights": {NORMAL: {}, CRISIS: {}, OFF_TOPIC: {OFF_TOPIC_FEATURE: 2.0}},
+    "bias": {NORMAL: 0.0, CRISIS: 0.0, OFF_TOPIC: 0.0}
+}
+TOKEN = re.compile(r"[a-z']+")
+
+
+def featurize(text):
+    """
+    Turn a message into the sparse features the linear model scores.
+
+    Args:
+        text (str): The user's message.
+
+    Returns:
+        list: Unigram and bigram features.
+    """
+    tokens = TOKEN.findall(text.lower())
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    if OFF_TOPIC_LEXICON.search(text):
+        features.append(OFF_TOPIC_FEATURE)
+    return features
+
+
+class LocalIntentClassifier:
+    """
+    In-process intent classifier that sits in front of classify_intent_prompt_v1.
+
+    Lexicon rules catch possible crises, which always go to the LLM. A small
+    multinomial logistic regression, trained offline on logged turns with
+    train_model, scores everything else; obvious off-topic requests add a lexicon
+    feature to that score rather than deciding on their own. Turns that mention
+    distress are never labeled off-topic locally.
+    """
+
+    def __init__(self, model=None):
+        self.weights = model["weights"] if model else None
+        self.bias = model["bias"] if model else None
+
+    @classmethod
+    def load(cls, path):
+        """
+        Args:
+            path (str): Path to a model written by train_model. A missing file means rules only.
+
+        Returns:
+            LocalIntentClassifier: The classifier.
+        """
+        if not path or not os.path.exists(path):
+            logger.info("No local intent model found, using lexicon rules only")
+            return cls(RULES_ONLY_MODEL)
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def classify(self, user_messages):
+        """
+        Classify the latest turn.
+
+        Args:
+            user_messages (list): Recent user messages, oldest first. The last one is scored;
+                the others are only checked for crisis language.
+
+        Returns:
+            str: The predicted label, or None if the turn must go to the LLM.
+            float: Confidence in the label.
+        """
+        if any(CRISIS_LEXICON.search(message) for message in user_messages):
+            return None, 0.0
+        text = user_messages[-1] if user_messages else ""
+        if self.weights is None:
+            return None, 0.0
+        probabilities = self.predict_proba(featurize(text))
+        label = max(probabilities, key=probabilities.get)
+        if label == CRISIS or (label == OFF_TOPIC and DISTRESS_LEXICON.search(text)):
+            return None, 0.0
+        return label, probabilities[label]
+
+    def predict_proba(self, features):
+        scores = {
+            label: self.bias[label] + sum(self.weights[label].get(feature, 0.0) for feature in features)
+            for label in LABELS
+        }
+        top = max(scores.values())
+        exps = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exps.values())
+        return {label: value / total for label, value in exps.items()}
+
+
+def fast_intent(history, config, classifier):
+    """
+    Run the local classifier on the recent history.
+
+    Args:
+        history (list): Recent messages in the conversation.
+        config (dict): The app config.
+        classifier (LocalIntentClassifier): The app's local classifier.
+
+    Returns:
+        str: A confident label to use instead of the LLM classifier, or None.
+        tuple: The raw (label, confidence) prediction, for shadow logging.
+    """
+    mode = config['LOCAL_INTENT_MODE']
+    if mode == 'off':
+        return None, (None, 0.0)
+    user_messages = [m["content"] for m in history if m["role"] == "user"]
+    label, confidence = classifier.classify(user_messages)
+    thresholds = {NORMAL: config['LOCAL_INTENT_NORMAL_THRESHOLD'], OFF_TOPIC: config['LOCAL_INTENT_OFF_TOPIC_THRESHOLD']}
+    if mode == 'on' and label is not None and confidence >= thresholds[label]:
+        logger.info(f"Local intent: {label} ({confidence:.2f})")
+        return label, (label, confidence)
+    return None, (label, confidence)
+
+
+_shadow_lock = threading.Lock()
+
+def record_shadow(history, prediction, llm_intent, config):
+    """
+    Log how the local prediction compares with the LLM classifier, and keep the
+    turn so the model can be retrained on it.
+
+    Args:
+        history (list): Recent messages in the conversation.
+        prediction (tuple): The local (label, confidence).
+        llm_intent (str): The LLM classifier's answer.
+        config (dict): The app config.
+    """
+    if config['LOCAL_INTENT_MODE'] == 'off':
+        return
+    llm_label = next((label for label in (CRISIS, OFF_TOPIC, NORMAL) if label in llm_intent), NORMAL)
+    label, confidence = prediction
+    logger.info(f"Intent shadow: local={label} ({confidence:.2f}) llm={llm_label} agree={label == llm_label}")
+    user_messages = [m["content"] for m in history if m["role"] == "user"]
+    if not user_messages or not config['LOCAL_INTENT_LOG_PATH']:
+        return
+    with _shadow_lock:
+        with open(config['LOCAL_INTENT_LOG_PATH'], "a") as f:
+            f.write(json.dumps({"text": user_messages[-1], "llm": llm_label, "local": label, "confidence": confidence}) + "\n")
+
+
+def train_model(examples, epochs=10, learning_rate=0.1, l2=1e-4):
+    """
+    Fit the multinomial logistic regression used by LocalIntentClassifier.
+
+    Args:
+        examples (list): (text, label) pairs, e.g. LLM-labeled turns from the shadow log.
+        epochs (int): Passes over the data.
+        learning_rate (float): SGD step size.
+        l2 (float): L2 regularization strength.
+
+    Returns:
+        dict: The model, ready to be written as JSON.
+    """
+    weights = {label: {} for label in LABELS}
+    bias = {label: 0.0 for label in LABELS}
+    classifier = LocalIntentClassifier({"weights": weights, "bias": bias})
+    for _ in range(epochs):
+        for text, target in examples:
+            features = featurize(text)
+            probabilities = classifier.predict_proba(features)
+            for label in LABELS:
+                gradient = probabilities[label] - (1.0 if label == target else 0.0)
+                bias[label] -= learning_rate * gradient
+                for feature in features:
+                    w = weights[label].get(feature, 0.0)
+                    weights[label][feature] = w - learning_rate * (gradient + l2 * w)
+    # Drop near-zero weights to keep the model small
+    weights = {label: {f: round(w, 4) for f, w in ws.items() if abs(w) > 1e-3} for label, ws in weights.items()}
+    return {"weights": weights, "bias": bias}
+
+
+if __name__ == "__main__":
+    # Usage: python -m backend.util.intent_utils <shadow_log.jsonl> <model.json>
+    log_path, model_path = sys.argv[1], sys.argv[2]
+    with open(log_path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    model = train_model([(row["text"], row["llm"]) for row in rows])
+    with open(model_path, "w") as f:
+        json.dump(model, f)
+    print(f"Trained on {len(rows)} turns, wrote {model_path}")
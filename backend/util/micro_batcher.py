@@ -0,0 +1,138 @@
+import asyncio
+import concurrent.futures
+import threading
+
+
+class BaseMicroBatcher:
+    """
+    Collects items submitted concurrently over a short window and hands them to
+    one batch call, then gives each caller its own result.
+
+    There is no background thread: the first caller to find no batch open opens
+    one, waits up to `window` seconds (less if the batch fills up) and runs it.
+    Later callers join the open batch and wait for their results.
+    """
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self.lock = threading.Lock()
+        self.batch = None
+        self.stats = {"items": 0, "batches": 0}
+
+    def _chunks(self, items):
+        return [items[i:i + self.max_batch] for i in range(0, len(items), self.max_batch)]
+
+    def _count(self, items, batches):
+        with self.lock:
+            self.stats["items"] += items
+            self.stats["batches"] += batches
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Items submitted, batch calls made and the average batch size.
+        """
+        with self.lock:
+            return {
+                **self.stats,
+                "avg_batch_size": self.stats["items"] / self.stats["batches"] if self.stats["batches"] else 0.0
+            }
+
+
+class MicroBatcher(BaseMicroBatcher):
+    """Blocking micro-batcher for the Flask app's request threads."""
+
+    def submit(self, items, run_batch, executor):
+        """
+        Args:
+            items (list): The caller's items.
+            run_batch (callable): Takes a list of at most max_batch items and returns their results in order.
+            executor (concurrent.futures.Executor): Runs extra chunks when a batch holds more than max_batch items.
+
+        Returns:
+            list: The results for the caller's items, in order.
+        """
+        futures = [concurrent.futures.Future() for _ in items]
+        with self.lock:
+            leader = self.batch is None
+            if leader:
+                self.batch = {"items": [], "futures": [], "full": threading.Event()}
+            batch = self.batch
+            batch["items"].extend(items)
+            batch["futures"].extend(futures)
+            if len(batch["items"]) >= self.max_batch:
+                batch["full"].set()
+        if leader:
+            batch["full"].wait(self.window)
+            with self.lock:
+                # Close the batch; later callers open a new one
+                self.batch = None
+            self._run(batch, run_batch, executor)
+        return [future.result() for future in futures]
+
+    def _run(self, batch, run_batch, executor):
+        item_chunks = self._chunks(batch["items"])
+        future_chunks = self._chunks(batch["futures"])
+        self._count(len(batch["items"]), len(item_chunks))
+
+        def run(chunk, futures):
+            try:
+                for future, result in zip(futures, run_batch(chunk)):
+                    future.set_result(result)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+        extra = [executor.submit(run, chunk, futures) for chunk, futures in zip(item_chunks[1:], future_chunks[1:])]
+        run(item_chunks[0], future_chunks[0])
+        concurrent.futures.wait(extra)
+
+
+class AsyncMicroBatcher(BaseMicroBatcher):
+    """Async counterpart of MicroBatcher for the ASGI app."""
+
+    async def submit(self, items, run_batch):
+        """
+        Args:
+            items (list): The caller's items.
+            run_batch (callable): Async function taking a list of at most max_batch items and returning their results in order.
+
+        Returns:
+            list: The results for the caller's items, in order.
+        """
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in items]
+        leader = self.batch is None
+        if leader:
+            self.batch = {"items": [], "futures": [], "full": asyncio.Event()}
+        batch = self.batch
+        batch["items"].extend(items)
+        batch["futures"].extend(futures)
+        if len(batch["items"]) >= self.max_batch:
+            batch["full"].set()
+        if leader:
+            try:
+                await asyncio.wait_for(batch["full"].wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            self.batch = None
+            await self._run(batch, run_batch)
+        return list(await asyncio.gather(*futures))
+
+    async def _run(self, batch, run_batch):
+        item_chunks = self._chunks(batch["items"])
+        future_chunks = self._chunks(batch["futures"])
+        self._count(len(batch["items"]), len(item_chunks))
+
+        async def run(chunk, futures):
+            try:
+                for future, result in zip(futures, await run_batch(chunk)):
+                    future.set_result(result)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+        await asyncio.gather(*(run(chunk, futures) for chunk, futures in zip(item_chunks, future_chunks)))
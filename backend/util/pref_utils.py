@@ -1,34 +1,55 @@
 from flask import jsonify, current_app
 import logging
+from .session_utils import SessionContext, get_user_row
 
 logger = logging.getLogger(__name__)
 
-def handle_get_prefs(user_id): 
+def handle_get_prefs(user_id, session_id=None): 
     logger.info(f"Getting prefs for user_id: {user_id}")
     try:
-        db_user_info = current_app.supabase_client.table('users').select('*').eq('user_id', user_id).execute()
+        user_info = get_user_row(user_id)
     except Exception as e:
         logger.error(f"Error getting user info: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
-    current_app.user_info = db_user_info.data[0]
-    logger.info(f"Retrieved user info: {current_app.user_info}")
-    return jsonify({'success': True, 'backgroundInfo': current_app.user_info['custom_background'], 'agentPreferences': current_app.user_info['custom_behavior'], 'gender': current_app.user_info['custom_gender']})
+    if user_info is None:
+        return jsonify({'success': False, 'error': 'User not found'}), 404
+    logger.info(f"Retrieved user info for user_id: {user_id}", extra={"payload": {"user_info": user_info}})
+
+    # Keep a live session in sync with the latest row
+    session = SessionContext.load(session_id)
+    if session is not None and session.user_id == user_id:
+        session.update_user_info(user_info)
+        session.save()
+    return jsonify({'success': True, 'backgroundInfo': user_info['custom_background'], 'agentPreferences': user_info['custom_behavior'], 'gender': user_info['custom_gender']})
 
 
 def handle_set_prefs(data):
     user_id = data.get('userId')
+    session_id = data.get('sessionId')
     background_info = data.get('backgroundInfo')
     agent_preferences = data.get('agentPreferences')
     gender = data.get('gender')
-    logger.info(f"Saving prefs for user_id: {user_id}, background_info: {background_info}, agent_preferences: {agent_preferences}, gender: {gender}")
+    logger.info(f"Saving prefs for user_id: {user_id}", extra={"payload": {"background_info": background_info, "agent_preferences": agent_preferences, "gender": gender}})
     try: 
-        current_app.supabase_client.table("users").update({
+        current_app.repository.update_user(user_id, {
             "custom_background": background_info,
             "custom_behavior": agent_preferences,
             "custom_gender": gender
-        }).eq("user_id", user_id).execute()
+        })
+        current_app.user_cache.invalidate(user_id)
     except Exception as e:
         logger.error(f"Error setting prefs: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
+
+    # Apply the new preferences to a live session right away
+    session = SessionContext.load(session_id)
+    if session is not None and session.user_id == user_id:
+        session.update_user_info({
+            **session.user_info,
+            "custom_background": background_info,
+            "custom_behavior": agent_preferences,
+            "custom_gender": gender
+        })
+        session.save()
     
     return jsonify({'success': True})
@@ -0,0 +1,279 @@
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+# Contractions speech-to-text often writes without the apostrophe, plus "I" forms
+CONTRACTIONS = {
+    "i": "I", "i'm": "I'm", "i've": "I've", "i'd": "I'd", "i'll": "I'll",
+    "im": "I'm", "ive": "I've", "dont": "don't", "cant": "can't", "wont": "won't",
+    "didnt": "didn't", "doesnt": "doesn't", "isnt": "isn't", "wasnt": "wasn't", "arent": "aren't",
+    "couldnt": "couldn't", "shouldnt": "shouldn't", "wouldnt": "wouldn't", "havent": "haven't",
+    "hasnt": "hasn't", "thats": "that's", "theres": "there's", "whats": "what's",
+    "youre": "you're", "theyre": "they're", "youve": "you've", "theyve": "they've"
+}
+# Proper nouns the rules can recognize ("may" and "march" are left alone)
+CAPITALIZED = {
+    word: word.capitalize() for word in (
+        "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday", "january", "february",
+        "april", "june", "july", "august", "september", "october", "november", "december"
+    )
+}
+# Words whose apostrophe-less form is also a word (its/it's, were/we're, ...), or that the LLM may respell
+AMBIGUOUS_WORDS = {"its", "were", "well", "ill", "id", "wed", "hell", "shell", "lets", "whos", "hed", "shed", "youll", "ok"}
+# Words that usually call for a comma or a sentence break the rules can't place
+CLAUSE_WORDS = {"but", "so", "because", "though", "however", "actually", "anyway", "also", "like"}
+# Fillers the LLM may drop as speech-to-text artifacts
+FILLERS = {"um", "uh", "uhm", "hmm", "er", "ah", "mm"}
+# Leading interjections followed by a comma ("yeah i guess" -> "Yeah, I guess.")
+INTERJECTIONS = {"yeah", "yes", "yep", "nope", "okay"}
+# Leading words that take a comma only sometimes ("no i can't" but "no problem")
+AMBIGUOUS_OPENERS = {"no", "oh", "hey", "sure", "please"}
+WH_WORDS = {"what", "why", "how", "when", "where", "who", "which"}
+AUXILIARIES = {"is", "are", "am", "was", "do", "does", "did", "can", "could", "would", "should", "will", "have", "has"}
+SUBJECTS = {"i", "you", "we", "they", "he", "she", "it", "im", "there", "that", "this", "anyone", "someone", "anything", "everything"}
+# Everyday words the rules can leave lowercase. Anything else may be a name ("hi jennifer", "new york") and goes to the LLM.
+COMMON_WORDS = set("""
+    a about above after again against ago all almost alone along already alright also always an and another any
+    anybody anymore anyway anywhere around as ask at away back bad be because been before being below best better
+    between big bit both bring but by can't care come couldn't day days didn't different doesn't doing don't done down
+    during each either else end enough even ever every everybody everyone everywhere far feel few find fine first for
+    from full get give go going gone good got great had hadn't half happen happy hard hasn't haven't having he's hear
+    heard hello help her here hers herself hi him himself his home honestly hope i'd i'll i'm i've if in inside
+    instead into isn't it'll it's itself just keep kind know last late later least leave less let let's life little
+    long look lot lots love made make many maybe me mean might mind more morning most much must my myself need never
+    new next nice night nobody none nor not nothing now of off often old on once one only or other others our ours
+    ourselves out over own part people place point pretty probably put quite rather ready real really right same say
+    see seem seems she's shouldn't since small some somebody something sometimes somewhere soon sorry start still
+    stuff such take talk tell than thank thanks that's the their theirs them themselves then there's these they'd
+    they'll they're they've thing things think those through time times to today together told tomorrow tonight too
+    toward try turn under until up upon us use very want wasn't way we'd we'll we're we've week weekend what's whether
+    while whole whose with within without won't wouldn't wrong year years yesterday yet you'd you'll you're you've
+    young your yours yourself
+
+    able afraid alive angry annoyed anxious ashamed awake awful busy calm clear close comfortable confused crazy dark
+    difficult easy empty exhausted fair fault free frustrated funny glad grateful guilty heavy helpful hopeful
+    hopeless hurt important impossible jealous lonely lost mad nervous normal numb overwhelmed patient poor positive
+    proud quiet relaxed sad safe scared serious sick simple slow stressful strong stuck stupid terrible tired tough
+    true ugly uncomfortable unhappy upset useful weird well wonderful worried worse worst worth
+
+    advice afternoon age anger anxiety apartment appointment attention baby bed birthday body book boss boyfriend
+    brother call car cat chance change child children choice class coffee college conversation couple course dad date
+    daughter death decision depression dinner doctor dog dream family father feeling food friend friendship future
+    game girlfriend goal grief group guy habit hand head health heart history holiday hour hours house husband idea
+    job journal kid kids lunch man marriage medication meeting memory message minute minutes mom moment money month
+    months mother mum music name news office pain panic parent parents partner past person phone plan pressure problem
+    question reason relationship rest room school self sense session shift sister situation sleep son space story
+    stress support teacher team text therapist therapy thought topic trouble trust truth vacation voice walk wife
+    woman work world worry
+
+    accept agree allow answer apologize argue asked believe blame break breathe broke buy called cancel cheat check
+    choose clean cook cope cry dance deal decide die drink drive eat enjoy exercise expect explain fail fall fight
+    finish fix forget forgive forgot grow hate hold ignore imagine kill laugh learn lie like listen live lose meet met
+    miss move notice open pay pick play pray promise quit read relax remember run sat scream sell send share shout
+    show sing sit slept smile speak spend stand stay stop study suppose swim teach travel understand wait wake wanted
+    wash watch win wish wonder write
+
+    became began bought came caught felt found gave guess kept knew left meant said saw sent spent stood taught took
+    understood went woke won wore wrote
+""".split()) | INTERJECTIONS | AMBIGUOUS_OPENERS | WH_WORDS | AUXILIARIES | SUBJECTS
+WORD = re.compile(r"^([^\w']*)([\w']+)([^\w']*)$")
+SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+([,.!?;:])")
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_punctuation(text, max_words):
+    """
+    Punctualize a short speech-to-text fragment with deterministic rules:
+    capitalization (including "I", weekdays and months), common apostrophe-less
+    contractions, a comma after a leading interjection and sentence-final punctuation.
+    Fragments with words outside COMMON_WORDS, which may be names, are left to the LLM.
+
+    Args:
+        text (str): The fragment.
+        max_words (int): Longer fragments are left to the LLM.
+
+    Returns:
+        str: The normalized text, or None if the rules can't be trusted with it.
+    """
+    text = SPACE_BEFORE_PUNCTUATION.sub(r"\1", " ".join(text.split()))
+    words = text.split(" ")
+    if not text or len(words) > max_words or text[-1] in ",;:":
+        return None
+    cores = []
+    for word in words:
+        match = WORD.match(word)
+        # Hyphens, digits, times and the like go to the LLM
+        if match is None or any(c.isdigit() for c in word):
+            return None
+        cores.append(match.group(2).lower())
+    if any(core in AMBIGUOUS_WORDS or core in CLAUSE_WORDS or core in FILLERS for core in cores):
+        return None
+    if not all(core in CONTRACTIONS or core in CAPITALIZED or is_common(core) for core in cores):
+        return None
+    if any(a == b for a, b in zip(cores, cores[1:])):
+        return None
+    if len(cores) > 1 and cores[0] in AMBIGUOUS_OPENERS:
+        return None
+
+    out = []
+    sentence = []
+    for i, word in enumerate(words):
+        prefix, core, suffix = WORD.match(word).groups()
+        if not sentence:
+            # "what i want ..." or "how you feel ..." start statements as often as questions
+            if cores[i] in WH_WORDS and cores[i + 1:i + 2] and cores[i + 1] in SUBJECTS:
+                return None
+        sentence.append(cores[i])
+        core = CONTRACTIONS.get(core.lower()) or CAPITALIZED.get(core.lower(), core)
+        if len(sentence) == 1:
+            core = core[0].upper() + core[1:]
+        if i == 0 and len(words) > 1 and not suffix and cores[0] in INTERJECTIONS:
+            suffix = ","
+        out.append(prefix + core + suffix)
+        if suffix[-1:] in (".", "!", "?"):
+            sentence = []
+    result = " ".join(out)
+    if result[-1] not in ".!?":
+        result += "?" if is_question(sentence) else "."
+    return result
+
+
+def is_common(word):
+    """
+    Args:
+        word (str): A lowercased word.
+
+    Returns:
+        bool: Whether it is a common word, a regular inflection of one ("talked", "meetings", "crying")
+        or its possessive.
+    """
+    if word.endswith("'s"):
+        word = word[:-2]
+    if word in COMMON_WORDS:
+        return True
+    for suffix in ("s", "es", "ed", "ing", "ly"):
+        if not word.endswith(suffix) or len(word) - len(suffix) < 2:
+            continue
+        stem = word[:-len(suffix)]
+        # Plain, e-dropping ("making"), doubled-consonant ("stopped") and y-to-i ("tried") stems
+        stems = [stem, stem + "e", stem[:-1] if stem[-1:] == stem[-2:-1] else stem]
+        if stem.endswith("i"):
+            stems.append(stem[:-1] + "y")
+        if any(candidate in COMMON_WORDS for candidate in stems):
+            return True
+    return False
+
+
+def is_question(words):
+    """
+    Args:
+        words (list): The lowercased words of an unpunctuated sentence.
+
+    Returns:
+        bool: Whether it opens like a question: a wh-word, or an auxiliary verb followed by its subject.
+    """
+    if words[0] in WH_WORDS:
+        return True
+    return words[0] in AUXILIARIES and len(words) > 1 and words[1] in SUBJECTS
+
+
+def local_punctuation(texts, config):
+    """
+    Run the rule-based normalizer in front of the LLM, as PUNCT_LOCAL_MODE says.
+
+    Args:
+        texts (list): The texts to punctualize.
+        config (dict): The app config.
+
+    Returns:
+        list: Per text, the local answer when it can be used instead of the LLM, else None.
+        list: Per text, the local answer for shadow comparison, else None.
+    """
+    mode = config['PUNCT_LOCAL_MODE']
+    if mode == 'off':
+        return [None] * len(texts), [None] * len(texts)
+    local = [normalize_punctuation(text, config['PUNCT_LOCAL_MAX_WORDS']) if text.strip() else None for text in texts]
+    if mode == 'on':
+        return local, [None] * len(texts)
+    return [None] * len(texts), local
+
+
+def record_shadow(local, llm_answer):
+    logger.info(f"Punctuation shadow: agree={local == llm_answer}", extra={"payload": {"local": local, "llm": llm_answer}})
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[int(q * (len(samples) - 1))] if samples else 0.0
+
+
+def benchmark(rows, max_words, llm=None):
+    """
+    Compare the rule-based normalizer with reference answers and, optionally, the LLM.
+
+    Args:
+        rows (list): Corpus rows with "text" and a reference "expected" answer.
+        max_words (int): As PUNCT_LOCAL_MAX_WORDS.
+        llm (callable): Takes a text and returns the LLM's answer; skipped when None.
+
+    Returns:
+        dict: Coverage, agreement and latency figures.
+    """
+    local_times, local_answers = [], []
+    for row in rows:
+        start = time.perf_counter()
+        local_answers.append(normalize_punctuation(row["text"], max_words))
+        local_times.append(time.perf_counter() - start)
+    handled = [(row, answer) for row, answer in zip(rows, local_answers) if answer is not None]
+    report = {
+        "rows": len(rows),
+        "handled_locally": len(handled),
+        "local_agrees_with_expected": sum(answer == row["expected"] for row, answer in handled),
+        "local_p50_us": 1e6 * percentile(local_times, 0.5),
+        "local_p95_us": 1e6 * percentile(local_times, 0.95)
+    }
+    if llm is not None:
+        llm_times, llm_answers = [], []
+        for row in rows:
+            start = time.perf_counter()
+            llm_answers.append(llm(row["text"]))
+            llm_times.append(time.perf_counter() - start)
+        report.update({
+            "llm_agrees_with_expected": sum(answer == row["expected"] for row, answer in zip(rows, llm_answers)),
+            "local_agrees_with_llm": sum(
+                local == answer for local, answer in zip(local_answers, llm_answers) if local is not None
+            ),
+            "llm_p50_ms": 1e3 * percentile(llm_times, 0.5),
+            "llm_p95_ms": 1e3 * percentile(llm_times, 0.95)
+        })
+    return report
+
+
+if __name__ == "__main__":
+    # Usage: python -m backend.util.punct_utils <corpus.jsonl> [--llm]
+    # --llm also sends every row through punctualize_prompt (needs OPENAI_API_KEY)
+    with open(sys.argv[1]) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    llm = None
+    if "--llm" in sys.argv[2:]:
+        from dotenv import load_dotenv
+        from openai import OpenAI
+        import backend.prompt_lib as pl
+        from .chat_utils import MODEL
+
+        load_dotenv()
+        client = OpenAI()
+
+        def llm(text):
+            response = client.chat.completions.create(
+                model=MODEL,
+                messages=[{"role": "system", "content": pl.punctualize_prompt()}, {"role": "user", "content": text}],
+                temperature=0
+            )
+            return response.choices[0].message.content.strip()
+
+    print(json.dumps(benchmark(rows, int(os.getenv('PUNCT_LOCAL_MAX_WORDS', '12')), llm), indent=2))
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def response_cache_key(prompt_name, version, model, conversation):
+    """
+    Args:
+        prompt_name (str): The prompt's label.
+        version (str): The prompt's version (see prompt_lib.CACHEABLE_PROMPTS).
+        model (str): The model the call goes to.
+        conversation (list): The full message list sent to the API.
+
+    Returns:
+        str: A key that changes whenever the prompt version, model or any message does.
+    """
+    digest = hashlib.sha256(json.dumps([model, conversation], sort_keys=True).encode('utf-8')).hexdigest()
+    return f"{prompt_name}:{version}:{digest}"
+
+
+class ResponseCache:
+    """
+    Cache of LLM answers for deterministic, short-answer prompts, keyed by
+    response_cache_key. Entries expire after `ttl` seconds and the number of
+    entries is bounded by LRU. Per process, like the other caches.
+    """
+
+    def __init__(self, max_entries, ttl, enabled=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def get(self, prompt_name, key):
+        """
+        Args:
+            prompt_name (str): The prompt's label, for per-prompt stats.
+            key (str): From response_cache_key.
+
+        Returns:
+            str: The cached answer, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                self._count(prompt_name, "misses")
+                return None
+            self.entries.move_to_end(key)
+            self._count(prompt_name, "hits")
+            return entry[1]
+
+    def put(self, key, response):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic() + self.ttl, response)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _count(self, prompt_name, outcome):
+        counts = self.stats.setdefault(prompt_name, {"hits": 0, "misses": 0})
+        counts[outcome] += 1
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Hits, misses and hit rate overall and per prompt, and the number of cached answers.
+        """
+        with self.lock:
+            hits = sum(counts["hits"] for counts in self.stats.values())
+            misses = sum(counts["misses"] for counts in self.stats.values())
+            metrics = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "entries": len(self.entries)
+            }
+            for prompt_name, counts in self.stats.items():
+                metrics[f"{prompt_name}_hits"] = counts["hits"]
+                metrics[f"{prompt_name}_misses"] = counts["misses"]
+            return metrics
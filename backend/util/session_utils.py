@@ -0,0 +1,283 @@
+from flask import current_app
+import ast
+import logging
+import backend.prompt_lib as pl
+from backend.session_store import new_session
+from backend.repository import digest_cursor
+from .token_utils import estimate_tokens, message_tokens, fit_suffix
+
+logger = logging.getLogger(__name__)
+
+# Parsed from the sessions table rather than the users row, so kept when the row is refreshed
+HISTORY_KEYS = ('history_summary', 'history_digest')
+
+
+def parse_user_info(db_row, summary_rows=None, limit=None, token_budget=None):
+    """
+    Parse a row from the Supabase users table into the form sessions keep.
+
+    Past-session summaries come from the sessions table, which is appended to once
+    per session. Only the most recent ones are read; older sessions are folded into
+    the users.history_digest column (see history_utils.compact_history).
+
+    Args:
+        db_row (dict): The user's row as returned by Supabase.
+        summary_rows (list): The user's latest rows from the sessions table that aren't in
+            the digest yet, newest first. If empty and there is no digest, the legacy
+            users.history_summary column is parsed instead.
+        limit (int): How many recent summaries to keep. None keeps all of them.
+        token_budget (int): Ceiling for the digest plus recent summaries. The oldest
+            summaries are dropped until they fit. None means no ceiling.
+
+    Returns:
+        dict: The user info, with history_summary as a list of recent summaries
+        (oldest first) and history_digest as a string or None.
+    """
+    user_info = dict(db_row)
+    digest = user_info.get('history_digest') or None
+    legacy = user_info.get('history_summary')
+    if summary_rows:
+        history = [row['summary'] for row in reversed(summary_rows)]
+    elif digest:
+        history = []
+    elif isinstance(legacy, str):
+        # Users whose summaries were only ever stored as str(list) on their row
+        history = ast.literal_eval(legacy) if legacy else []
+    else:
+        history = list(legacy or [])
+    if limit:
+        history = history[-limit:]
+    if token_budget:
+        budget = token_budget - estimate_tokens(digest)
+        history = history[fit_suffix([estimate_tokens(summary) for summary in history], budget):]
+    user_info['history_summary'] = history
+    user_info['history_digest'] = digest
+    return user_info
+
+
+def get_user_row(user_id):
+    """
+    Read a user's row (repository.USER_COLUMNS) through the app's user cache.
+
+    Args:
+        user_id (str): The ID of the user.
+
+    Returns:
+        dict: The user's row, or None if the user doesn't exist.
+    """
+    row = current_app.user_cache.get(user_id)
+    if row is None:
+        row = current_app.repository.get_user(user_id)
+        if row is None:
+            return None
+        current_app.user_cache.put(user_id, row)
+    return row
+
+
+def fetch_user_info(user_id):
+    """
+    Load a user's row and their most recent session summaries from Supabase.
+
+    Args:
+        user_id (str): The ID of the user.
+
+    Returns:
+        dict: The parsed user info (see parse_user_info), or None if the user doesn't exist.
+    """
+    row = get_user_row(user_id)
+    if row is None:
+        return None
+    limit = current_app.config['HISTORY_RECENT_SUMMARIES']
+    # Sessions up to history_digest_until are already part of the digest
+    summary_rows = current_app.repository.get_summaries(user_id, after=digest_cursor(row), limit=limit)
+    if not summary_rows and not row.get('history_digest'):
+        row = {**row, 'history_summary': current_app.repository.get_legacy_history(user_id)}
+    return parse_user_info(row, summary_rows, limit, current_app.config['HISTORY_TOKEN_BUDGET'])
+
+
+def build_system_prompt(user_info, preferred_name):
+    """
+    Assemble the custom system prompt for a user.
+
+    Args:
+        user_info (dict): The parsed user info.
+        preferred_name (str): The user's preferred name.
+
+    Returns:
+        str: The system prompt, including past sessions, background and behavior preferences.
+    """
+    custom_sys_prompt = pl.systemprompt_v1()
+    if user_info['history_summary'] or user_info.get('history_digest'):
+        custom_sys_prompt = custom_sys_prompt + pl.inject_history(preferred_name, user_info['history_summary'], user_info.get('history_digest'))
+    if user_info['custom_background']:
+        custom_sys_prompt = custom_sys_prompt + pl.inject_background(user_info['custom_background'])
+    if user_info['custom_behavior']:
+        custom_sys_prompt = custom_sys_prompt + pl.inject_behavior(user_info['custom_behavior'])
+    return custom_sys_prompt
+
+
+class SessionContext:
+    """
+    Everything one conversation needs, resolved by session ID: its history,
+    crisis status, the user's row and the assembled system prompt.
+
+    Handlers load a context at the start of a request and save it once they
+    are done, so requests for different sessions never share state. Saving a
+    loaded context writes back only the fields it changed, so a concurrent
+    request on the same session keeps its own changes.
+    """
+
+    def __init__(self, session_id, state, store=None, changed=()):
+        self.session_id = session_id
+        self.state = state
+        self.store = store if store is not None else current_app.session_store
+        self.changed = set(changed)
+
+    @classmethod
+    def start(cls, session_id, user_info, preferred_name, history, store=None):
+        """
+        Create the context for a new session. It is not stored until save is called.
+
+        Args:
+            session_id (str): Unique identifier for the session.
+            user_info (dict): The parsed user info.
+            preferred_name (str): The user's preferred name.
+            history (list): The conversation history so far.
+            store (SessionStore): Store to save into. Defaults to the Flask app's session store.
+
+        Returns:
+            SessionContext: The new context.
+        """
+        state = new_session(history, user_info, build_system_prompt(user_info, preferred_name))
+        state["preferred_name"] = preferred_name
+        return cls(session_id, state, store, changed=state)
+
+    @classmethod
+    def load(cls, session_id, store=None):
+        """
+        Args:
+            session_id (str): Unique identifier for the session.
+            store (SessionStore): Store to load from. Defaults to the Flask app's session store.
+
+        Returns:
+            SessionContext: The session's context, or None if the session doesn't exist.
+        """
+        if not session_id:
+            return None
+        store = store if store is not None else current_app.session_store
+        state = store.get(session_id)
+        return cls(session_id, state, store) if state is not None else None
+
+    def set(self, key, value):
+        """
+        Set a field of the session state, marking it to be saved.
+
+        Args:
+            key (str): The field.
+            value: Its new value.
+        """
+        self.state[key] = value
+        self.changed.add(key)
+
+    def save(self):
+        """
+        Write the changed fields back to the store. If the session has expired in
+        the meantime, the whole state is saved again.
+        """
+        changes = {key: self.state[key] for key in self.changed if key in self.state}
+        if changes and not self.store.update(self.session_id, changes):
+            self.store.save(self.session_id, self.state)
+        self.changed.clear()
+
+    def add_message(self, role, content):
+        """
+        Append a message to the history, caching its token count alongside it.
+
+        Args:
+            role (str): "user" or "assistant".
+            content (str): The message.
+        """
+        token_counts = self._token_counts()
+        message = {"role": role, "content": content}
+        self.history.append(message)
+        token_counts.append(message_tokens(message))
+        self.changed.update(("history", "token_counts"))
+
+    def recent_history(self, token_budget):
+        """
+        Args:
+            token_budget (int): Maximum tokens for the messages.
+
+        Returns:
+            list: The longest suffix of the history that fits the budget. The latest
+            message is always included, even if it doesn't fit on its own.
+        """
+        start = fit_suffix(self._token_counts(), token_budget)
+        return self.history[min(start, max(len(self.history) - 1, 0)):]
+
+    def _token_counts(self):
+        token_counts = self.state.setdefault("token_counts", [])
+        # Count anything stored without a cached count, e.g. sessions saved before counts were kept
+        for message in self.history[len(token_counts):]:
+            token_counts.append(message_tokens(message))
+        return token_counts
+
+    def load_running_summary(self, summary_store=None):
+        """
+        The running summary lives in its own store (the session backend's "summary"
+        namespace), so background updates never overwrite (or get overwritten by) the
+        session state saved by request handlers, and session IDs can't reach it.
+
+        Args:
+            summary_store (SessionStore): Store to load from. Defaults to the Flask app's summary store.
+
+        Returns:
+            dict: The running summary of this conversation ("summary", and "upto": how many
+            history messages it covers), or None if there isn't one yet.
+        """
+        summary_store = summary_store if summary_store is not None else current_app.summary_store
+        return summary_store.get(self.session_id)
+
+    def update_user_info(self, user_info):
+        """
+        Replace the user's row, e.g. after their preferences change, and reassemble the system prompt.
+        The session's past-session history is kept.
+
+        Args:
+            user_info (dict): The user's row.
+        """
+        self.set("user_info", {**user_info, **{key: self.user_info.get(key) for key in HISTORY_KEYS}})
+        self.set("sys_prompt", build_system_prompt(self.user_info, self.state.get("preferred_name") or user_info.get('preferred_name')))
+
+    @property
+    def history(self):
+        return self.state["history"]
+
+    @property
+    def user_info(self):
+        return self.state["user_info"]
+
+    @property
+    def sys_prompt(self):
+        return self.state["sys_prompt"]
+
+    @property
+    def crisis_status(self):
+        return self.state["crisis_status"]
+
+    @crisis_status.setter
+    def crisis_status(self, value):
+        self.set("crisis_status", value)
+
+    @property
+    def summary_generation(self):
+        """How many times the session has been saved. Running summary updates started before a save are dropped."""
+        return self.state.get("summary_generation", 0)
+
+    @property
+    def user_id(self):
+        return self.user_info['user_id']
+
+    @property
+    def gender(self):
+        return self.user_info['custom_gender']
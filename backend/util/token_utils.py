@@ -0,0 +1,56 @@
+import math
+import re
+
+# Roughly how GPT tokenizers split English: words, numbers and single punctuation marks
+TOKEN_PIECE = re.compile(r"\w+|[^\w\s]")
+CHARS_PER_TOKEN = 4
+# Tokens the chat API adds around every message for its role and separators
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text):
+    """
+    Estimate how many tokens a piece of text costs, without loading a tokenizer.
+
+    Long words split into several tokens, so each piece counts as at least one
+    token and one more for every CHARS_PER_TOKEN characters past the first.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The estimated token count.
+    """
+    if not text:
+        return 0
+    return sum(math.ceil(len(piece) / CHARS_PER_TOKEN) for piece in TOKEN_PIECE.findall(text))
+
+
+def message_tokens(message):
+    """
+    Args:
+        message (dict): A chat message with role and content.
+
+    Returns:
+        int: The estimated token count of the message, including per-message overhead.
+    """
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def fit_suffix(token_counts, budget):
+    """
+    Find the longest run of trailing items whose total cost fits a budget.
+
+    Args:
+        token_counts (list): Token count of each item, oldest first.
+        budget (int): Maximum total tokens.
+
+    Returns:
+        int: Index of the first item to keep. Equal to len(token_counts) if not even the last item fits.
+    """
+    total = 0
+    start = len(token_counts)
+    while start > 0 and total + token_counts[start - 1] <= budget:
+        start -= 1
+        total += token_counts[start]
+    return start
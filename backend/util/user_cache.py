@@ -0,0 +1,79 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """
+    Read-through cache of Supabase users rows, keyed by user_id, with a TTL and an
+    LRU bound on the number of rows.
+
+    The cache is per process: writers invalidate their own copy, and other workers
+    see the change once their entry expires.
+    """
+
+    def __init__(self, max_entries, ttl, enabled=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, user_id):
+        """
+        Args:
+            user_id (str): The ID of the user.
+
+        Returns:
+            dict: A copy of the cached row, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(user_id, None)
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return copy.deepcopy(entry[1])
+
+    def put(self, user_id, row):
+        """
+        Args:
+            user_id (str): The ID of the user.
+            row (dict): The user's row as returned by Supabase.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.entries.pop(user_id, None)
+            self.entries[user_id] = (time.monotonic() + self.ttl, copy.deepcopy(row))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """
+        Drop a user's row after it changes.
+
+        Args:
+            user_id (str): The ID of the user.
+        """
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Hit/miss counters, hit rate and the number of cached rows.
+        """
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self.entries)
+            }
@@ -1,23 +1,107 @@
-from flask import current_app
+import base64
+import concurrent.futures
+import io
+import re
+import time
+import wave
+from collections import deque
+from functools import lru_cache
+from flask import current_app, jsonify, request, Response
 from google.cloud import texttospeech
 import logging
+from .audio_cache import AudioCache
+from backend.metrics import propagate
 
 logger = logging.getLogger(__name__)
 
-def tts_config(voice_name):
+# A sentence ends at ., ! or ? (optionally followed by closing quotes/brackets) and whitespace
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])["\'\)\]]*\s+')
+MIN_SENTENCE_LEN = 12
+SUPPORTED_ENCODINGS = ("LINEAR16", "OGG_OPUS", "MP3")
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 24000, 48000)
+# (encoding, sample rate) used when the client doesn't ask for anything else
+DEFAULT_AUDIO_FORMAT = ("LINEAR16", 48000)
+AUDIO_MIMETYPES = {"LINEAR16": "audio/wav", "OGG_OPUS": "audio/ogg", "MP3": "audio/mpeg"}
+# Seconds GET /api/audio/<id> waits for synthesis that is still running
+AUDIO_WAIT_TIMEOUT = 30
+# Seconds between shared store lookups for audio another worker is still synthesizing
+AUDIO_POLL_INTERVAL = 0.05
+
+def parse_audio_format(data):
+    """
+    Read the audio format a client asked for, falling back to the default for anything unsupported.
+
+    Args:
+        data (dict): The request payload, optionally with audioEncoding and sampleRateHertz.
+
+    Returns:
+        tuple: (encoding, sample rate)
+    """
+    encoding = str(data.get('audioEncoding') or DEFAULT_AUDIO_FORMAT[0]).upper()
+    if encoding not in SUPPORTED_ENCODINGS:
+        encoding = DEFAULT_AUDIO_FORMAT[0]
+    try:
+        sample_rate = int(data.get('sampleRateHertz') or DEFAULT_AUDIO_FORMAT[1])
+    except (TypeError, ValueError):
+        sample_rate = DEFAULT_AUDIO_FORMAT[1]
+    if sample_rate not in SUPPORTED_SAMPLE_RATES:
+        sample_rate = DEFAULT_AUDIO_FORMAT[1]
+    return encoding, sample_rate
+
+
+def audio_payload(audio_content, audio_format):
+    """
+    Build the response fields that carry synthesized audio.
+
+    Args:
+        audio_content (bytes): The synthesized audio.
+        audio_format (tuple): (encoding, sample rate) the audio was synthesized with.
+
+    Returns:
+        dict: audioData (base64), audioEncoding and sampleRateHertz.
+    """
+    return {
+        "audioData": base64.b64encode(audio_content).decode("utf-8"),
+        "audioEncoding": audio_format[0],
+        "sampleRateHertz": audio_format[1]
+    }
+
+
+def audio_link(audio_id, audio_format):
+    """
+    Build the response fields that point to audio served by GET /api/audio/<id>.
+
+    Args:
+        audio_id (str): The ID from the app's audio store.
+        audio_format (tuple): (encoding, sample rate) the audio is synthesized with.
+
+    Returns:
+        dict: audioId, audioUrl, audioEncoding and sampleRateHertz.
     """
-    Configure the text-to-speech parameters.
+    return {
+        "audioId": audio_id,
+        "audioUrl": f"/api/audio/{audio_id}",
+        "audioEncoding": audio_format[0],
+        "sampleRateHertz": audio_format[1]
+    }
+
+
+@lru_cache(maxsize=None)
+def tts_config(voice_name, audio_format=DEFAULT_AUDIO_FORMAT):
+    """
+    Configure the text-to-speech parameters. Built once per (voice, encoding, sample rate).
     
     Args:
         voice_name (str): The name of the voice to use.
+        audio_format (tuple): (encoding, sample rate) to synthesize with.
     
     Returns:
         texttospeech.AudioConfig: The audio configuration for the text-to-speech request.
         texttospeech.VoiceSelectionParams: The voice selection parameters for the text-to-speech request.
     """
     text2speech_audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.LINEAR16,
-        sample_rate_hertz=48000,
+        audio_encoding=texttospeech.AudioEncoding[audio_format[0]],
+        sample_rate_hertz=audio_format[1],
     )
     voice = texttospeech.VoiceSelectionParams(
                             language_code="en-US",
@@ -26,28 +110,290 @@ def tts_config(voice_name):
     return text2speech_audio_config, voice
 
 
-def generate_audio(text):
+def voice_name(gender):
+    """
+    Pick the TTS voice for the user's preferred therapist gender.
+
+    Args:
+        gender (str): The user's preferred therapist gender
+
+    Returns:
+        str: The name of the voice to use.
+    """
+    return "Leda" if gender == "FEMALE" else "Charon"
+
+
+def audio_cache_key(gender, text, audio_format=DEFAULT_AUDIO_FORMAT):
+    """
+    Args:
+        gender (str): The user's preferred therapist gender
+        text (str): Text to convert to speech
+        audio_format (tuple): (encoding, sample rate) to synthesize with
+
+    Returns:
+        str: The audio cache key for this voice, audio config and text.
+    """
+    return AudioCache.key(voice_name(gender), f"{audio_format[0]}:{audio_format[1]}", text)
+
+
+def generate_audio(text, gender, audio_format=DEFAULT_AUDIO_FORMAT, cacheable=False):
     """
     Generate speech from text using Google Cloud TTS and returns it.
+    Results are served from and stored in the app's audio cache.
     
     Args:
         text (str): Text to convert to speech
+        gender (str): The user's preferred therapist gender
+        audio_format (tuple): (encoding, sample rate) to synthesize with
+        cacheable (bool): Whether the text is a static phrase whose audio may be kept on disk
 
     Returns:
         bytes: The audio content containing the synthesized speech
     """
-    is_female = (current_app.user_info['custom_gender'] == "FEMALE")
+    key = audio_cache_key(gender, text, audio_format)
+    audio_content = current_app.audio_cache.get(key)
+    if audio_content is not None:
+        return audio_content
     try:
-        text2speech_audio_config, voice = tts_config("Leda" if is_female else "Charon")
+        text2speech_audio_config, voice = tts_config(voice_name(gender), audio_format)
         synthesis_input = texttospeech.SynthesisInput(text=text)
         
-        response = current_app.tts_client.synthesize_speech(
-            input=synthesis_input,
-            voice=voice,
-            audio_config=text2speech_audio_config
-        )
+        with current_app.metrics.span("tts", "synthesize"):
+            response = current_app.tts_client.synthesize_speech(
+                input=synthesis_input,
+                voice=voice,
+                audio_config=text2speech_audio_config
+            )
+        current_app.audio_cache.put(key, response.audio_content, persist=cacheable)
         return response.audio_content
     except Exception as e:
-        print(f"Unexpected error in text-to-speech: {str(e)}")
+        logger.error(f"Unexpected error in text-to-speech: {str(e)}")
         return None
 
+
+def generate_audio_parts(parts, gender, audio_format=DEFAULT_AUDIO_FORMAT, cacheable=None):
+    """
+    Generate speech for text made of several parts, synthesizing (or fetching from
+    the cache) each part on its own and joining the audio. Lets templated messages
+    reuse pre-rendered audio for their fixed parts.
+
+    Args:
+        parts (list): Pieces of text, in order
+        gender (str): The user's preferred therapist gender
+        audio_format (tuple): (encoding, sample rate) to synthesize with
+        cacheable (list): Per part, whether it is a static phrase (see generate_audio). Defaults to none.
+
+    Returns:
+        bytes: The audio content containing the synthesized speech
+    """
+    cacheable = cacheable or [False] * len(parts)
+    chunks = [generate_audio(part, gender, audio_format, static) for part, static in zip(parts, cacheable)]
+    if any(chunk is None for chunk in chunks):
+        return None
+    return join_audio(chunks)
+
+
+def join_audio(chunks):
+    """
+    Concatenate synthesized audio clips.
+
+    Args:
+        chunks (list): Audio clips in the same encoding, in order.
+
+    Returns:
+        bytes: A single clip. WAV clips are merged under one header; MP3 frames and
+        Ogg streams are appended, which players handle as one (chained) stream.
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    if not all(chunk.startswith(b"RIFF") for chunk in chunks):
+        return b"".join(chunks)
+    output = io.BytesIO()
+    with wave.open(io.BytesIO(chunks[0])) as first:
+        params = first.getparams()
+    with wave.open(output, "wb") as joined:
+        joined.setparams(params)
+        for chunk in chunks:
+            with wave.open(io.BytesIO(chunk)) as clip:
+                joined.writeframes(clip.readframes(clip.getnframes()))
+    return output.getvalue()
+
+
+def submit_audio(parts, gender, audio_format=DEFAULT_AUDIO_FORMAT, cacheable=None):
+    """
+    Synthesize speech on the app's chat worker pool and register it in the audio store,
+    so the caller can respond right away and the client fetches the audio by ID.
+
+    Args:
+        parts (list): Pieces of text, in order
+        gender (str): The user's preferred therapist gender
+        audio_format (tuple): (encoding, sample rate) to synthesize with
+        cacheable (list): Per part, whether it is a static phrase (see generate_audio)
+
+    Returns:
+        dict: Response fields pointing to the audio (see audio_link).
+    """
+    app = current_app._get_current_object()
+    audio_id = app.audio_store.reserve(audio_format)
+
+    def run():
+        with app.app_context():
+            try:
+                audio_content = generate_audio_parts(parts, gender, audio_format, cacheable)
+            except Exception as e:
+                # e.g. a wave.Error joining a bad cached chunk; published as failed below
+                logger.error(f"Error generating audio {audio_id}: {e}")
+                audio_content = None
+            try:
+                app.audio_store.publish(audio_id, audio_format, audio_content)
+            except Exception as e:
+                logger.error(f"Error publishing audio {audio_id}: {e}")
+            return audio_content
+
+    app.audio_store.add(audio_id, app.chat_executor.submit(propagate(run)), audio_format)
+    return audio_link(audio_id, audio_format)
+
+
+def wait_for_shared_audio(audio_id):
+    """
+    Poll the shared audio store for a clip handed out by another worker.
+
+    Args:
+        audio_id (str): The audio ID.
+
+    Returns:
+        tuple: (status, audio_format, audio_content) as returned by AudioStore.fetch;
+        the status is still "pending" if AUDIO_WAIT_TIMEOUT ran out.
+    """
+    deadline = time.monotonic() + AUDIO_WAIT_TIMEOUT
+    while True:
+        status, audio_format, audio_content = current_app.audio_store.fetch(audio_id)
+        if status != "pending" or time.monotonic() >= deadline:
+            return status, audio_format, audio_content
+        time.sleep(AUDIO_POLL_INTERVAL)
+
+
+def handle_get_audio(audio_id):
+    """
+    Serve synthesized audio as raw bytes, waiting for it if synthesis is still running.
+
+    Args:
+        audio_id (str): The ID returned in a chat response.
+
+    Returns:
+        Response: The audio, with Range and conditional request support, or a JSON error.
+    """
+    entry = current_app.audio_store.get(audio_id)
+    if entry is not None:
+        pending, audio_format = entry
+        try:
+            audio_content = pending.result(timeout=AUDIO_WAIT_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            logger.error(f"Timed out waiting for audio {audio_id}")
+            return jsonify({"success": False, "error": "Audio is not ready"}), 504
+    else:
+        # Produced by another worker
+        status, audio_format, audio_content = wait_for_shared_audio(audio_id)
+        if status is None:
+            return jsonify({"success": False, "error": "Audio not found or expired"}), 404
+        if status == "pending":
+            logger.error(f"Timed out waiting for audio {audio_id}")
+            return jsonify({"success": False, "error": "Audio is not ready"}), 504
+    if audio_content is None:
+        return jsonify({"success": False, "error": "Audio generation failed"}), 500
+
+    response = Response(audio_content, mimetype=AUDIO_MIMETYPES[audio_format[0]])
+    response.set_etag(audio_id)
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['AUDIO_TTL']
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(audio_content))
+
+
+def split_sentences(text):
+    """
+    Split text into finished sentences and the unfinished remainder.
+
+    Sentences shorter than MIN_SENTENCE_LEN are merged into the next one so
+    that fragments like "Hi." aren't synthesized on their own.
+
+    Args:
+        text (str): Text received so far.
+
+    Returns:
+        list: The finished sentences, in order.
+        str: The remainder that doesn't end in a sentence boundary yet.
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        if len(text[start:match.end()].strip()) >= MIN_SENTENCE_LEN:
+            sentences.append(text[start:match.end()].strip())
+            start = match.end()
+    return sentences, text[start:]
+
+
+class SpeechPipeline:
+    """
+    Synthesize a streamed reply sentence by sentence on the chat worker pool,
+    so speech for early sentences is ready while later ones are still being generated.
+    Audio is handed back strictly in sentence order.
+    """
+
+    def __init__(self, gender, audio_format=DEFAULT_AUDIO_FORMAT):
+        self.app = current_app._get_current_object()
+        self.gender = gender
+        self.audio_format = audio_format
+        self.buffer = ""
+        self.pending = deque()
+        self.index = 0
+        self.start = time.perf_counter()
+
+    def feed(self, delta):
+        """Add a piece of the reply and start synthesizing any sentences it completes."""
+        self.buffer += delta
+        sentences, self.buffer = split_sentences(self.buffer)
+        for sentence in sentences:
+            self._submit(sentence)
+
+    def flush(self):
+        """Start synthesizing whatever is left once the reply is complete."""
+        if self.buffer.strip():
+            self._submit(self.buffer.strip())
+        self.buffer = ""
+
+    def ready(self):
+        """
+        Yield audio for sentences that are finished, stopping at the first one still in progress.
+
+        Yields:
+            tuple: (index, sentence, audio_content) for each finished sentence, in order.
+        """
+        while self.pending and self.pending[0][2].done():
+            yield self._pop()
+
+    def drain(self):
+        """
+        Wait for and yield audio for every remaining sentence, in order.
+
+        Yields:
+            tuple: (index, sentence, audio_content) for each remaining sentence.
+        """
+        while self.pending:
+            yield self._pop()
+
+    def _submit(self, sentence):
+        app = self.app
+
+        def run():
+            with app.app_context():
+                return generate_audio(sentence, self.gender, self.audio_format)
+
+        self.pending.append((self.index, sentence, app.chat_executor.submit(propagate(run))))
+        self.index += 1
+
+    def _pop(self):
+        index, sentence, future = self.pending.popleft()
+        audio_content = future.result()
+        if index == 0:
+            logger.info(f"First audio ready after {time.perf_counter() - self.start:.3f}s")
+        return index, sentence, audio_content
@@ -91,19 +91,18 @@ function ChatInterface() {
     fetchUserPreferences();
   }, [user]);
 
-  const playAudio = async (audioData) => {
+  const playAudio = async (audioUrl) => {
     try {
-      // Convert base64 to ArrayBuffer
-      const binaryString = window.atob(audioData);
-      const len = binaryString.length;
-      const bytes = new Uint8Array(len);
-      for (let i = 0; i < len; i++) {
-        bytes[i] = binaryString.charCodeAt(i);
+      // Fetch the raw audio bytes
+      const audioResponse = await fetch(`http://127.0.0.1:5000${audioUrl}`, { mode: 'cors' });
+      if (!audioResponse.ok) {
+        throw new Error(`Audio request failed with status ${audioResponse.status}`);
       }
+      const bytes = await audioResponse.arrayBuffer();
 
       // Create and play audio
       const audioContext = new (window.AudioContext || window.webkitAudioContext)();
-      const audioBuffer = await audioContext.decodeAudioData(bytes.buffer);
+      const audioBuffer = await audioContext.decodeAudioData(bytes);
       const source = audioContext.createBufferSource();
 
       setIsPlaying(true);
@@ -157,8 +156,8 @@ function ChatInterface() {
         timestamp: new Date()
       };
       setMessages([...newMessages, botMessage]);
-      if (isVoiceMode && data.audioData) {
-        playAudio(data.audioData);
+      if (isVoiceMode && data.audioUrl) {
+        playAudio(data.audioUrl);
       }
     } else {
       const errorMessage = {
@@ -412,8 +411,8 @@ function ChatInterface() {
           timestamp: new Date()
         }]);
 
-        if (mode === true && data.audioData) {
-          playAudio(data.audioData);
+        if (mode === true && data.audioUrl) {
+          playAudio(data.audioUrl);
         }  
       } else {
         // Fallback message if API call fails
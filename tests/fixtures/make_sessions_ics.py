@@ -0,0 +1,40 @@
+"""
+Regenerate sessions.ics with the ics library (0.7.3) that ics_utils replaced:
+
+    pip install ics==0.7.3
+    python tests/fixtures/make_sessions_ics.py
+
+The events match test_ics_utils.test_matches_ics_library, built the way the old
+/api/generate-calendar handler built its event, with DTSTAMP and UID fixed.
+"""
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytz
+from ics import Calendar, Event
+
+PACIFIC_TZ = pytz.timezone("America/Los_Angeles")
+STAMP = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+SESSIONS = [
+    # Standard and daylight time in Pacific, and a time that is already UTC
+    (PACIFIC_TZ.localize(datetime(2025, 1, 15, 20, 0)), "winter@talk2me"),
+    (PACIFIC_TZ.localize(datetime(2025, 7, 15, 20, 0)), "summer@talk2me"),
+    (
+        datetime(2025, 3, 9, 10, 30, tzinfo=timezone.utc),
+        "a-very-long-uid-that-needs-folding-0123456789abcdef0123456789abcdef@talk2me"
+    )
+]
+
+if __name__ == "__main__":
+    calendar = Calendar()
+    for start_time, uid in SESSIONS:
+        event = Event()
+        event.name = "Therapy Session with Talk2Me"
+        event.begin = start_time
+        event.end = start_time + timedelta(minutes=30)
+        event.description = "Virtual therapy session with Talk2Me AI therapist"
+        # ics 0.7.3 writes created as DTSTAMP
+        event.created = STAMP
+        event.uid = uid
+        calendar.events.add(event)
+    Path(__file__).with_name("sessions.ics").write_bytes(str(calendar).encode("utf-8"))
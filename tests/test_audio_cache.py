@@ -0,0 +1,47 @@
+from backend.session_store import SQLiteSessionStore
+from backend.util.audio_cache import AudioCache, AudioStore
+
+
+def test_only_persisted_entries_reach_disk(tmp_path):
+    cache = AudioCache(1024, str(tmp_path))
+    cache.put("a" * 64, b"conversation", persist=False)
+    cache.put("b" * 64, b"greeting", persist=True)
+
+    restarted = AudioCache(1024, str(tmp_path))
+    assert restarted.get("a" * 64) is None
+    assert restarted.get("b" * 64) == b"greeting"
+    assert cache.get("a" * 64) == b"conversation"
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = AudioCache(10, None)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    cache.get("a")
+    cache.put("c", b"12345")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    assert cache.metrics()["memory_bytes"] == 10
+
+
+def test_audio_store_serves_clips_across_workers(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    producer = AudioStore(60, SQLiteSessionStore(path, 60, "audio"))
+    other = AudioStore(60, SQLiteSessionStore(path, 60, "audio"))
+
+    audio_id = producer.reserve(("LINEAR16", 48000))
+    assert other.get(audio_id) is None
+    assert other.fetch(audio_id) == ("pending", ("LINEAR16", 48000), None)
+
+    producer.publish(audio_id, ("LINEAR16", 48000), b"RIFF...")
+    assert other.fetch(audio_id) == ("ready", ("LINEAR16", 48000), b"RIFF...")
+    assert other.fetch("unknown") == (None, None, None)
+
+
+def test_audio_store_without_shared_store_is_local(tmp_path):
+    store = AudioStore(60)
+    audio_id = store.reserve(("MP3", 24000))
+    store.add(audio_id, "pending", ("MP3", 24000))
+    store.publish(audio_id, ("MP3", 24000), b"mp3")
+    assert store.get(audio_id) == ("pending", ("MP3", 24000))
+    assert AudioStore(60).fetch(audio_id) == (None, None, None)
@@ -0,0 +1,61 @@
+import pytest
+from flask import Flask
+
+import backend.util.chat_utils as chat_utils
+from backend.session_store import InMemorySessionStore, new_session
+from backend.util.chat_utils import update_running_summary
+
+HISTORY = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.session_store = InMemorySessionStore(60)
+    app.summary_store = InMemorySessionStore(60)
+    app.session_store.save("s1", new_session(list(HISTORY), {}, "prompt"))
+    with app.app_context():
+        yield app
+
+
+def save_session(app):
+    """What handle_save_session does to the stores once the save job is queued."""
+    app.session_store.update("s1", {"summary_generation": 1})
+    app.summary_store.delete("s1")
+
+
+def test_update_writes_the_summary(app, monkeypatch):
+    monkeypatch.setattr(chat_utils, "get_response", lambda *args: "A summary.")
+    update_running_summary(app.summary_store, "s1", HISTORY)
+    assert app.summary_store.get("s1") == {"summary": "A summary.", "upto": 2}
+
+
+def test_update_is_dropped_when_the_session_is_saved_meanwhile(app, monkeypatch):
+    def get_response(*args):
+        save_session(app)
+        return "A stale summary."
+
+    monkeypatch.setattr(chat_utils, "get_response", get_response)
+    update_running_summary(app.summary_store, "s1", HISTORY)
+    assert app.summary_store.get("s1") is None
+
+
+def test_update_written_just_before_a_save_is_removed(app, monkeypatch):
+    monkeypatch.setattr(chat_utils, "get_response", lambda *args: "A stale summary.")
+    summary_store = app.summary_store
+    save = summary_store.save
+
+    def save_then_session_saved(session_id, summary):
+        save(session_id, summary)
+        app.session_store.update("s1", {"summary_generation": 1})
+
+    monkeypatch.setattr(summary_store, "save", save_then_session_saved)
+    update_running_summary(summary_store, "s1", HISTORY)
+    assert summary_store.get("s1") is None
+
+
+def test_update_for_the_current_generation_is_kept(app, monkeypatch):
+    save_session(app)
+    monkeypatch.setattr(chat_utils, "get_response", lambda *args: "A summary.")
+    update_running_summary(app.summary_store, "s1", HISTORY, generation=1)
+    assert app.summary_store.get("s1")["summary"] == "A summary."
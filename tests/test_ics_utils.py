@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytz
+
+from backend.util.appt_utils import render_calendar
+from backend.util.ics_utils import MAX_LINE_OCTETS, escape_text, fold_line, render_sessions, session_uid
+
+FIXTURE = Path(__file__).parent / "fixtures" / "sessions.ics"
+PACIFIC_TZ = pytz.timezone("America/Los_Angeles")
+STAMP = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+# The sessions in the fixture, which was written by the ics library (see fixtures/make_sessions_ics.py)
+START_TIMES = [
+    PACIFIC_TZ.localize(datetime(2025, 1, 15, 20, 0)),
+    PACIFIC_TZ.localize(datetime(2025, 7, 15, 20, 0)),
+    datetime(2025, 3, 9, 10, 30, tzinfo=timezone.utc)
+]
+UIDS = [
+    "winter@talk2me",
+    "summer@talk2me",
+    "a-very-long-uid-that-needs-folding-0123456789abcdef0123456789abcdef@talk2me"
+]
+
+
+def unfold(calendar):
+    return calendar.replace("\r\n ", "")
+
+
+def normalize(calendar):
+    """
+    Args:
+        calendar (str): ICS file contents.
+
+    Returns:
+        tuple: The calendar's properties other than PRODID, and each event's properties, in
+        canonical order, so outputs that differ only in property order and PRODID compare equal.
+    """
+    properties, events, event = [], [], None
+    for line in unfold(calendar).split("\r\n"):
+        if not line or line.startswith("PRODID:") or line in ("BEGIN:VCALENDAR", "END:VCALENDAR"):
+            continue
+        if line == "BEGIN:VEVENT":
+            event = []
+        elif line == "END:VEVENT":
+            events.append(tuple(sorted(event)))
+            event = None
+        else:
+            (properties if event is None else event).append(line)
+    return tuple(sorted(properties)), sorted(events)
+
+
+def test_matches_ics_library():
+    calendar = render_sessions(START_TIMES, UIDS, STAMP)
+    assert normalize(calendar) == normalize(FIXTURE.read_bytes().decode("utf-8"))
+
+
+def test_lines_are_crlf_terminated_and_folded():
+    calendar = render_sessions(START_TIMES, UIDS, STAMP)
+    assert calendar.endswith("\r\n")
+    lines = calendar[:-2].split("\r\n")
+    assert all("\n" not in line for line in lines)
+    assert all(len(line.encode("utf-8")) <= MAX_LINE_OCTETS for line in lines)
+    assert f"UID:{UIDS[2]}" in unfold(calendar)
+
+
+def test_fold_line_never_splits_multibyte_characters():
+    line = "DESCRIPTION:" + "é" * 100
+    folded = fold_line(line)
+    chunks = folded.split("\r\n")
+    assert all(len(chunk.encode("utf-8")) <= MAX_LINE_OCTETS for chunk in chunks)
+    assert all(chunk.startswith(" ") for chunk in chunks[1:])
+    assert folded.replace("\r\n ", "") == line
+    assert fold_line("SUMMARY:short") == "SUMMARY:short"
+
+
+def test_escape_text():
+    assert escape_text("a\\b;c,d\r\ne\nf") == r"a\\b\;c\,d\ne\nf"
+
+
+def test_times_are_written_in_utc_without_tzid():
+    calendar = render_calendar("2025-07-15T20:00:00")
+    assert "DTSTART:20250716T030000Z" in calendar
+    assert "DTEND:20250716T033000Z" in calendar
+    assert "TZID" not in calendar
+
+    # An explicit offset wins over the Pacific default
+    assert "DTSTART:20250715T180000Z" in render_calendar("2025-07-15T20:00:00+02:00")
+
+
+def test_session_uid_is_stable():
+    start_time = PACIFIC_TZ.localize(datetime(2025, 1, 15, 20, 0))
+    assert session_uid("u1", start_time) == session_uid("u1", start_time.astimezone(timezone.utc))
+    assert session_uid("u1", start_time) != session_uid("u2", start_time)
@@ -0,0 +1,45 @@
+import pytest
+
+from backend.util.intent_utils import (
+    CRISIS, NORMAL, OFF_TOPIC, OFF_TOPIC_FEATURE, LocalIntentClassifier, featurize, fast_intent
+)
+
+CONFIG = {'LOCAL_INTENT_MODE': 'on', 'LOCAL_INTENT_NORMAL_THRESHOLD': 0.9, 'LOCAL_INTENT_OFF_TOPIC_THRESHOLD': 0.95}
+
+
+@pytest.fixture
+def classifier(tmp_path):
+    return LocalIntentClassifier.load(str(tmp_path / "missing.json"))
+
+
+@pytest.mark.parametrize("text", [
+    "I've been on 5-2 shifts for a month and I'm exhausted",
+    "my python died last night and I can't stop crying",
+    "I can't solve this on my own",
+    "I lost my job writing javascript"
+])
+def test_therapy_turns_are_not_off_topic(classifier, text):
+    label, _ = classifier.classify([text])
+    assert label != OFF_TOPIC
+    assert fast_intent([{"role": "user", "content": text}], CONFIG, classifier)[0] is None
+
+
+def test_lexicon_hit_is_a_feature_not_a_verdict(classifier):
+    assert OFF_TOPIC_FEATURE in featurize("What is the capital of France?")
+    label, confidence = classifier.classify(["What is the capital of France?"])
+    assert label == OFF_TOPIC
+    assert confidence < CONFIG['LOCAL_INTENT_OFF_TOPIC_THRESHOLD']
+
+
+def test_distress_is_never_off_topic():
+    model = {
+        "weights": {NORMAL: {}, CRISIS: {}, OFF_TOPIC: {OFF_TOPIC_FEATURE: 10.0}},
+        "bias": {NORMAL: 0.0, CRISIS: 0.0, OFF_TOPIC: 0.0}
+    }
+    classifier = LocalIntentClassifier(model)
+    assert classifier.classify(["Write me a poem"])[0] == OFF_TOPIC
+    assert classifier.classify(["I feel so hopeless, write me a poem"]) == (None, 0.0)
+
+
+def test_crisis_language_goes_to_the_llm(classifier):
+    assert classifier.classify(["I want to kill myself", "what is the capital of France"]) == (None, 0.0)
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+import backend.job_queue as job_queue
+from backend.job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), workers=1, max_attempts=2)
+
+
+def expire_leases(queue):
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET run_after = ? WHERE status = ?", (time.time() - 1, RUNNING))
+
+
+def test_claim_then_finish(queue):
+    job_id = queue.enqueue("save", {"n": 1})
+    claimed_id, kind, payload, attempts, lease = queue._claim()
+    assert (claimed_id, kind, payload, attempts) == (job_id, "save", '{"n": 1}', 0)
+    assert queue._claim() is None
+    assert queue.get(job_id)["status"] == RUNNING
+    assert queue._finish(job_id, lease, 1, None) == DONE
+    assert queue.get(job_id) == {"kind": "save", "status": DONE, "attempts": 1, "error": None}
+
+
+def test_expired_lease_is_taken_over(queue):
+    job_id = queue.enqueue("save", {})
+    *_, first_lease = queue._claim()
+    expire_leases(queue)
+    *_, attempts, second_lease = queue._claim()
+    assert attempts == 1
+
+    # The first worker finishing late can't overwrite the new owner's outcome
+    assert queue._finish(job_id, first_lease, 1, "boom") is None
+    assert queue.get(job_id)["status"] == RUNNING
+    assert queue._finish(job_id, second_lease, 2, None) == DONE
+    assert queue._finish(job_id, second_lease, 2, None) is None
+
+
+def test_failures_retry_with_backoff_then_fail(queue):
+    job_id = queue.enqueue("save", {})
+    *_, lease = queue._claim()
+    assert queue._finish(job_id, lease, 1, "boom") == QUEUED
+    assert queue._claim() is None
+
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET run_after = ?", (time.time() - 1,))
+    *_, attempts, lease = queue._claim()
+    assert attempts == 1
+    assert queue._finish(job_id, lease, 2, "boom again") == FAILED
+    assert queue.get(job_id)["error"] == "boom again"
+
+
+def test_workers_run_registered_handlers(queue, monkeypatch):
+    monkeypatch.setattr(job_queue, "POLL_SECONDS", 0.05)
+    seen = []
+    queue.register("save", seen.append)
+    queue.start()
+    job_id = queue.enqueue("save", {"n": 1})
+    for _ in range(100):
+        if queue.get(job_id)["status"] == DONE:
+            break
+        time.sleep(0.02)
+    assert queue.get(job_id)["status"] == DONE
+    assert seen == [{"n": 1}]
+
+
+
+def test_job_that_keeps_losing_its_worker_fails(queue):
+    job_id = queue.enqueue("save", {})
+    queue._claim()
+    expire_leases(queue)
+    assert queue._claim()[3] == 1
+    expire_leases(queue)
+    assert queue._claim() is None
+    assert queue.get(job_id) == {"kind": "save", "status": FAILED, "attempts": 2, "error": "Lease expired on the last attempt"}
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from openai import APIConnectionError
+
+import backend.llm_client as llm_client
+from backend.llm_client import MIN_LATENCY_SAMPLES, AsyncLLMClient, LLMClient
+
+CONFIG = {
+    'OPENAI_TIMEOUT': 30, 'OPENAI_TIMEOUTS': '', 'OPENAI_MAX_RETRIES': 0, 'OPENAI_RETRY_BACKOFF': 0.1,
+    'OPENAI_HEDGE_PROMPTS': '', 'OPENAI_HEDGE_MIN_DELAY': 1.0, 'OPENAI_POOL_SIZE': 1
+}
+HEDGED = {**CONFIG, 'OPENAI_HEDGE_PROMPTS': 'classify', 'OPENAI_HEDGE_MIN_DELAY': 0.05, 'OPENAI_POOL_SIZE': 2}
+
+
+def connection_error():
+    return APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+class Completions:
+    """
+    Answers call n with outcomes[n]: an exception to raise, a (seconds, answer) pair to
+    sleep before answering, or a plain answer. Calls past the end get the last outcome.
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = outcomes or ("completion",)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def next_outcome(self, kwargs):
+        if kwargs.get('stream'):
+            return 0, "stream"
+        with self.lock:
+            outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+            self.calls += 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome if isinstance(outcome, tuple) else (0, outcome)
+
+    def create(self, **kwargs):
+        seconds, answer = self.next_outcome(kwargs)
+        time.sleep(seconds)
+        return answer
+
+
+class AsyncCompletions(Completions):
+    async def create(self, **kwargs):
+        seconds, answer = self.next_outcome(kwargs)
+        await asyncio.sleep(seconds)
+        return answer
+
+
+class OpenAI:
+    def __init__(self, completions):
+        self.chat = type("Chat", (), {"completions": completions})()
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """Upper bounds of the jittered retry delays, which are skipped."""
+    bounds = []
+
+    def uniform(low, high):
+        bounds.append(high)
+        return 0
+
+    monkeypatch.setattr(llm_client.random, "uniform", uniform)
+    return bounds
+
+
+def test_streams_are_not_counted_as_latency_samples():
+    client = LLMClient(OpenAI(Completions()), CONFIG)
+    assert client.create("reply", stream=True) == "stream"
+    assert "reply" not in client.latencies
+    assert client.create("reply") == "completion"
+    assert len(client.latencies["reply"]) == 1
+    assert client.metrics()["requests"] == 2
+
+
+def test_async_streams_are_not_counted_as_latency_samples():
+    client = AsyncLLMClient(OpenAI(AsyncCompletions()), CONFIG)
+    assert asyncio.run(client.create("reply", stream=True)) == "stream"
+    assert "reply" not in client.latencies
+    assert asyncio.run(client.create("reply")) == "completion"
+    assert len(client.latencies["reply"]) == 1
+
+
+def test_retries_with_exponential_jittered_backoff(backoffs):
+    completions = Completions(connection_error(), connection_error(), "completion")
+    client = LLMClient(OpenAI(completions), {**CONFIG, 'OPENAI_MAX_RETRIES': 2})
+    assert client.create("reply") == "completion"
+    assert backoffs == [0.1, 0.2]
+    assert client.metrics() == {"requests": 3, "retries": 2, "hedges": 0, "hedge_wins": 0, "failures": 0}
+
+
+def test_exhausted_retries_count_a_failure(backoffs):
+    client = LLMClient(OpenAI(Completions(connection_error())), {**CONFIG, 'OPENAI_MAX_RETRIES': 1})
+    with pytest.raises(APIConnectionError):
+        client.create("reply")
+    assert client.metrics() == {"requests": 2, "retries": 1, "hedges": 0, "hedge_wins": 0, "failures": 1}
+
+
+def test_other_errors_are_not_retried(backoffs):
+    client = LLMClient(OpenAI(Completions(ValueError("bad request"))), {**CONFIG, 'OPENAI_MAX_RETRIES': 2})
+    with pytest.raises(ValueError):
+        client.create("reply")
+    assert client.metrics()["requests"] == 1
+    assert backoffs == []
+
+
+def test_slow_request_is_hedged_and_the_hedge_wins():
+    client = LLMClient(OpenAI(Completions((0.5, "slow"), "fast")), HEDGED)
+    assert client.create("classify") == "fast"
+    assert client.metrics() == {"requests": 2, "retries": 0, "hedges": 1, "hedge_wins": 1, "failures": 0}
+
+
+def test_fast_request_is_not_hedged():
+    client = LLMClient(OpenAI(Completions("fast")), HEDGED)
+    assert client.create("classify") == "fast"
+    assert client.create("reply") == "fast"
+    assert client.metrics()["hedges"] == 0
+
+
+def test_primary_that_answers_first_after_the_hedge_is_not_a_hedge_win():
+    client = LLMClient(OpenAI(Completions((0.1, "primary"), (0.5, "hedge"))), HEDGED)
+    assert client.create("classify") == "primary"
+    assert (client.metrics()["hedges"], client.metrics()["hedge_wins"]) == (1, 0)
+
+
+def test_hedge_delay_follows_the_observed_p95():
+    client = LLMClient(OpenAI(Completions()), HEDGED)
+    assert client.hedge_delay("reply") is None
+    assert client.hedge_delay("classify") == HEDGED['OPENAI_HEDGE_MIN_DELAY']
+    for i in range(MIN_LATENCY_SAMPLES):
+        client._observe("classify", (i + 1) / 100)
+    assert client.hedge_delay("classify") == 0.19
+
+
+def test_async_retries_then_fails(backoffs):
+    client = AsyncLLMClient(OpenAI(AsyncCompletions(connection_error())), {**CONFIG, 'OPENAI_MAX_RETRIES': 2})
+    with pytest.raises(APIConnectionError):
+        asyncio.run(client.create("reply"))
+    assert backoffs == [0.1, 0.2]
+    assert client.metrics() == {"requests": 3, "retries": 2, "hedges": 0, "hedge_wins": 0, "failures": 1}
+
+
+def test_async_slow_request_is_hedged_and_the_hedge_wins():
+    client = AsyncLLMClient(OpenAI(AsyncCompletions((0.5, "slow"), "fast")), HEDGED)
+    assert asyncio.run(client.create("classify")) == "fast"
+    assert client.metrics() == {"requests": 2, "retries": 0, "hedges": 1, "hedge_wins": 1, "failures": 0}
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.util.micro_batcher import AsyncMicroBatcher, MicroBatcher
+
+
+class Recorder:
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.fail_on = fail_on
+
+    def __call__(self, items):
+        with self.lock:
+            self.calls.append(list(items))
+        if self.fail_on is not None and self.fail_on in items:
+            raise RuntimeError("batch failed")
+        return [item.upper() for item in items]
+
+
+def submit_concurrently(batcher, run_batch, groups):
+    barrier = threading.Barrier(len(groups))
+    with ThreadPoolExecutor(max_workers=len(groups) + 2) as pool:
+        def submit(items):
+            barrier.wait()
+            return batcher.submit(items, run_batch, pool)
+        futures = [pool.submit(submit, items) for items in groups]
+        return [future.result() if future.exception() is None else future.exception() for future in futures]
+
+
+def test_concurrent_callers_share_one_batch():
+    batcher = MicroBatcher(window=0.2, max_batch=16)
+    run_batch = Recorder()
+    results = submit_concurrently(batcher, run_batch, [["a"], ["b", "c"], ["d"]])
+    assert results == [["A"], ["B", "C"], ["D"]]
+    assert len(run_batch.calls) == 1
+    assert sorted(run_batch.calls[0]) == ["a", "b", "c", "d"]
+    assert batcher.metrics() == {"items": 4, "batches": 1, "avg_batch_size": 4.0}
+
+
+def test_full_batch_runs_without_waiting_for_the_window():
+    batcher = MicroBatcher(window=10, max_batch=2)
+    run_batch = Recorder()
+    assert submit_concurrently(batcher, run_batch, [["a", "b"]]) == [["A", "B"]]
+
+
+def test_oversized_batches_are_chunked():
+    batcher = MicroBatcher(window=0.01, max_batch=2)
+    run_batch = Recorder()
+    assert submit_concurrently(batcher, run_batch, [["a", "b", "c", "d", "e"]]) == [["A", "B", "C", "D", "E"]]
+    assert sorted(map(len, run_batch.calls)) == [1, 2, 2]
+    assert batcher.metrics()["batches"] == 3
+
+
+def test_errors_fan_out_to_every_caller_in_the_chunk():
+    batcher = MicroBatcher(window=0.2, max_batch=16)
+    results = submit_concurrently(batcher, Recorder(fail_on="b"), [["a"], ["b"]])
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_errors_stay_within_their_chunk():
+    batcher = MicroBatcher(window=0.01, max_batch=2)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        with pytest.raises(RuntimeError):
+            batcher.submit(["a", "b", "c"], Recorder(fail_on="c"), pool)
+    # The batcher is usable again afterwards
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        assert batcher.submit(["x"], Recorder(), pool) == ["X"]
+
+
+def test_async_concurrent_callers_share_one_batch():
+    batcher = AsyncMicroBatcher(window=0.05, max_batch=16)
+    calls = []
+
+    async def run_batch(items):
+        calls.append(list(items))
+        return [item.upper() for item in items]
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(items, run_batch) for items in (["a"], ["b", "c"], ["d"])))
+
+    assert asyncio.run(main()) == [["A"], ["B", "C"], ["D"]]
+    assert calls == [["a", "b", "c", "d"]]
+
+
+def test_async_chunks_and_error_fan_out():
+    batcher = AsyncMicroBatcher(window=0.05, max_batch=2)
+
+    async def run_batch(items):
+        if "c" in items:
+            raise RuntimeError("batch failed")
+        return [item.upper() for item in items]
+
+    async def main():
+        return await asyncio.gather(
+            batcher.submit(["a"], run_batch), batcher.submit(["b"], run_batch), batcher.submit(["c"], run_batch),
+            return_exceptions=True
+        )
+
+    first, second, third = asyncio.run(main())
+    assert (first, second) == (["A"], ["B"])
+    assert isinstance(third, RuntimeError)
+    assert batcher.metrics()["batches"] == 2
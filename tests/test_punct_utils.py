@@ -0,0 +1,68 @@
+import pytest
+
+from backend.util.punct_utils import benchmark, is_common, local_punctuation, normalize_punctuation
+
+MAX_WORDS = 12
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("hello", "Hello."),
+    ("im doing okay", "I'm doing okay."),
+    ("yeah i guess", "Yeah, I guess."),
+    ("what should i do", "What should I do?"),
+    ("can we talk about my sleep", "Can we talk about my sleep?"),
+    ("i havent talked to anyone about it", "I haven't talked to anyone about it."),
+    ("see you on monday", "See you on Monday."),
+    ("i went for a walk .", "I went for a walk."),
+    ("i tried it. did you", "I tried it. Did you?")
+])
+def test_plain_fragments_are_handled_locally(text, expected):
+    assert normalize_punctuation(text, MAX_WORDS) == expected
+
+
+@pytest.mark.parametrize("text", [
+    # Probable names
+    "hi jennifer",
+    "i went to new york",
+    "i talked to sarah at work",
+    # Ambiguous words, clause breaks, fillers, repeats and openers
+    "its been a long week",
+    "i wanted to go but i was too tired",
+    "um i dont know",
+    "i i dont know",
+    "no i dont think so",
+    # Digits, wh-statements, dangling punctuation and long fragments
+    "my appointment is at 3pm",
+    "what i need is some rest",
+    "i feel,",
+    "i feel tired " * 5
+])
+def test_uncertain_fragments_go_to_the_llm(text):
+    assert normalize_punctuation(text, MAX_WORDS) is None
+
+
+def test_inflections_of_common_words_are_common():
+    for word in ("talked", "meetings", "crying", "tried", "stopped", "making", "mom's"):
+        assert is_common(word)
+    for word in ("jennifer", "york", "sarah", "ed"):
+        assert not is_common(word)
+
+
+@pytest.mark.parametrize("mode, used, shadow", [
+    ("off", [None, None], [None, None]),
+    ("shadow", [None, None], ["Thank you.", None]),
+    ("on", ["Thank you.", None], [None, None])
+])
+def test_local_punctuation_modes(mode, used, shadow):
+    config = {'PUNCT_LOCAL_MODE': mode, 'PUNCT_LOCAL_MAX_WORDS': MAX_WORDS}
+    assert local_punctuation(["thank you", "hi jennifer"], config) == (used, shadow)
+
+
+def test_benchmark_counts_local_coverage():
+    rows = [
+        {"text": "thank you", "expected": "Thank you."},
+        {"text": "hi jennifer", "expected": "Hi, Jennifer."}
+    ]
+    report = benchmark(rows, MAX_WORDS, llm=lambda text: "Thank you." if text == "thank you" else "Hi, Jennifer.")
+    assert (report["rows"], report["handled_locally"], report["local_agrees_with_expected"]) == (2, 1, 1)
+    assert (report["llm_agrees_with_expected"], report["local_agrees_with_llm"]) == (2, 1)
@@ -0,0 +1,30 @@
+from backend.repository import BaseRepository, digest_cursor
+
+
+def summaries_query(**kwargs):
+    repository = BaseRepository("https://db.test", "key", pool_size=1, timeout=1)
+    return repository._get_summaries("u1", kwargs.get("after"), 50, kwargs.get("newest_first", False))
+
+
+def test_digest_cursor():
+    assert digest_cursor({"history_digest_until": None}) is None
+    assert digest_cursor({"history_digest_until": "2025-01-01T00:00:00+00:00", "history_digest_until_id": 7}) == (
+        "2025-01-01T00:00:00+00:00", 7
+    )
+
+
+def test_summaries_resume_after_created_at_and_id():
+    query = summaries_query(after=("2025-01-01T00:00:00+00:00", 7))
+    assert query.params["order"] == "created_at.asc,id.asc"
+    assert query.params["or"] == (
+        '(created_at.gt."2025-01-01T00:00:00+00:00",'
+        'and(created_at.eq."2025-01-01T00:00:00+00:00",id.gt.7))'
+    )
+    assert "created_at" not in query.params
+
+
+def test_summaries_without_cursor_id_fall_back_to_timestamp():
+    query = summaries_query(after=("2025-01-01T00:00:00+00:00", None), newest_first=True)
+    assert query.params["order"] == "created_at.desc,id.desc"
+    assert query.params["created_at"] == "gt.2025-01-01T00:00:00+00:00"
+    assert "or" not in query.params
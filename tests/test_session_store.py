@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+from backend.session_store import (
+    InMemorySessionStore, RedisSessionStore, SQLiteSessionStore, create_session_store, new_session
+)
+from backend.util.session_utils import SessionContext
+
+USER_INFO = {"user_id": "u1", "history_summary": [], "custom_background": None, "custom_behavior": None}
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def make_store(request, tmp_path):
+    def make(ttl=60):
+        if request.param == "memory":
+            return InMemorySessionStore(ttl)
+        if request.param == "sqlite":
+            return SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl)
+        pytest.importorskip("redis")
+        if not os.getenv("TEST_REDIS_URL"):
+            pytest.skip("TEST_REDIS_URL not set")
+        return RedisSessionStore(os.environ["TEST_REDIS_URL"], ttl, prefix=f"talk2me-test:{time.time_ns()}:")
+    return make
+
+
+def test_missing_session_is_none(make_store):
+    assert make_store().get("nope") is None
+
+
+def test_save_then_get_round_trips(make_store):
+    store = make_store()
+    session = new_session([{"role": "assistant", "content": "Hi"}], {"name": "Al"}, "prompt")
+    store.save("s1", session)
+    assert store.get("s1") == session
+
+
+def test_get_returns_a_copy(make_store):
+    store = make_store()
+    store.save("s1", new_session([], {}, "prompt"))
+    loaded = store.get("s1")
+    loaded["history"].append({"role": "user", "content": "not saved"})
+    assert store.get("s1")["history"] == []
+
+
+def test_delete(make_store):
+    store = make_store()
+    store.save("s1", new_session([], {}, "prompt"))
+    store.delete("s1")
+    store.delete("s1")
+    assert store.get("s1") is None
+
+
+def test_expired_session_is_gone(make_store):
+    store = make_store(ttl=1)
+    store.save("s1", new_session([], {}, "prompt"))
+    time.sleep(1.1)
+    assert store.get("s1") is None
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SQLiteSessionStore(path, 60).save("s1", new_session([], {}, "prompt"))
+    assert SQLiteSessionStore(path, 60).get("s1")["sys_prompt"] == "prompt"
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_session_store({"SESSION_STORE": "nope", "SESSION_TTL": 60})
+
+
+def test_namespaces_do_not_share_keys(tmp_path):
+    config = {'SESSION_STORE': 'sqlite', 'SESSION_TTL': 60, 'SESSION_SQLITE_PATH': str(tmp_path / "sessions.db")}
+    sessions = create_session_store(config)
+    audio = create_session_store(config, "audio", 5)
+    sessions.save("s1", new_session([], {}, "prompt"))
+    assert audio.get("s1") is None
+    assert audio.ttl == 5
+
+
+def test_update_merges_fields(make_store):
+    store = make_store()
+    store.save("s1", new_session([], {"name": "Al"}, "prompt"))
+    assert store.update("s1", {"sys_prompt": "new prompt", "crisis_status": True})
+    assert store.get("s1") == {**new_session([], {"name": "Al"}, "new prompt"), "crisis_status": True}
+
+
+def test_update_of_missing_session_writes_nothing(make_store):
+    store = make_store()
+    assert not store.update("s1", {"sys_prompt": "new prompt"})
+    assert store.get("s1") is None
+
+
+def test_concurrent_contexts_keep_each_others_changes(make_store):
+    store = make_store()
+    SessionContext.start("s1", USER_INFO, "Al", [], store).save()
+    turn = SessionContext.load("s1", store)
+    prefs = SessionContext.load("s1", store)
+
+    turn.add_message("user", "Hi")
+    prefs.update_user_info({**prefs.user_info, "custom_background": "Likes hiking"})
+    prefs.save()
+    turn.save()
+
+    session = SessionContext.load("s1", store)
+    assert session.history == [{"role": "user", "content": "Hi"}]
+    assert session.user_info["custom_background"] == "Likes hiking"
+    assert "Likes hiking" in session.sys_prompt
+
+
+def test_saving_an_expired_context_writes_it_whole(make_store):
+    store = make_store()
+    session = SessionContext.start("s1", USER_INFO, "Al", [], store)
+    session.save()
+    store.delete("s1")
+    session.add_message("user", "Hi")
+    session.save()
+    assert store.get("s1")["preferred_name"] == "Al"